@@ -1,28 +1,170 @@
 """API endpoints for mathematical operations."""
+import asyncio
 import json
-from typing import List, Optional
+import math
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
-from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi import (
+    APIRouter, Depends, HTTPException, Request, Response, Query, WebSocket, WebSocketDisconnect
+)
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
+from pydantic import ValidationError
+from starlette.concurrency import iterate_in_threadpool
 
 from app.models.schemas import (
     MathOperationRequest,
     MathOperationResponse,
+    MathOperationResult,
+    BatchOperationRequest,
+    BatchOperationResponse,
+    PowerSummaryRequest,
+    PowerSummaryResponse,
+    SequenceRequest,
     OperationType,
+    RecurrencePreset,
     HealthCheckResponse,
     OperationHistoryItem,
+    JobResponse,
     ErrorResponse
 )
-from app.models.database import OperationHistory
+from app.api.middleware import client_identity
+from app.models.database import Job, OperationHistory
 from app.services.calculator import CalculatorService
 from app.services.cache import cache_service
-from app.db.session import get_db
+from app.services import registry
+from app.services import jobs
+from app.services import ratelimit
+from app.services.jobs import job_service
+from app.services.scheduler import OverloadedError, retry_after, scheduler
+from app.services.history import HistoryBatch, history_policy, recent_history
+from app.services.retention import history_archiver, record_to_row
+from app.services.rollups import GRANULARITIES, MINUTE, operation_rollups
+from app.services.stats import metrics
+from app.db.base import AsyncReadSessionLocal, AsyncSessionLocal
+from app.db.session import get_db, get_read_db
 from app.core.config import settings
+from app.utils.encoding import FastJSONResponse, RawJSON, dumps
 
 router = APIRouter()
 calculator = CalculatorService()
 
+# Flush streamed NDJSON to the client in chunks of roughly this many bytes
+SEQUENCE_CHUNK_BYTES = 64 * 1024
+# Stream job results in chunks of this many digits
+JOB_RESULT_CHUNK_CHARS = 64 * 1024
+# Database rows fetched per round trip by /history/archive
+HISTORY_STREAM_ROWS = 500
+
+
+def _history_record(
+    operation: str,
+    value: int,
+    exponent: Optional[int],
+    result: Any,
+    computation_time: float,
+    ip_address: Optional[str]
+) -> OperationHistory:
+    """Build a history row, serializing the result the operation's way."""
+    return OperationHistory(
+        operation=operation,
+        input_value=value,
+        exponent=exponent,
+        result=registry.get_operation(operation).serialize(result),
+        computation_time_ms=computation_time,
+        ip_address=ip_address
+    )
+
+
+def _keep_history(record: OperationHistory, from_cache: bool) -> bool:
+    """Count a calculation in the operation rollups; whether its history row is written."""
+    operation_rollups.record(record.operation, from_cache, record.computation_time_ms)
+    return history_policy.keep(record, from_cache)
+
+
+def _response_result(result: Any, record: OperationHistory) -> Any:
+    """The result to encode; an int reuses the digits already serialized for history."""
+    return RawJSON(record.result) if type(result) is int else result
+
+
+def _stored_result(record: OperationHistory) -> Any:
+    """A history result to encode; integer digits are already JSON and are not parsed."""
+    try:
+        integer = registry.get_operation(record.operation).deserialize is int
+    except ValueError:
+        integer = False
+    return RawJSON(record.result) if integer else registry.deserialize_result(
+        record.operation, record.result
+    )
+
+
+def _operation_response(
+    request: MathOperationRequest,
+    result: Any,
+    computation_time: float,
+    from_cache: bool
+) -> Dict[str, Any]:
+    """A MathOperationResponse as a plain dict, for FastJSONResponse."""
+    return {
+        "operation": request.operation,
+        "input_value": request.value,
+        "exponent": request.exponent,
+        "modulus": request.modulus,
+        "result": result,
+        "cached": from_cache,
+        "computation_time_ms": computation_time,
+        "timestamp": datetime.utcnow(),
+    }
+
+
+def _operation_params(request: MathOperationRequest) -> Dict[str, Any]:
+    """Extra operation parameters of a request; unset ones are dropped by the registry."""
+    return {
+        "modulus": request.modulus,
+        "coefficients": request.coefficients,
+        "initial_terms": request.initial_terms,
+        "preset": request.preset.value if request.preset is not None else None,
+    }
+
+
+async def _job_response(job: Job) -> JobResponse:
+    """Describe a job, with its queue position or running time as progress."""
+    params = json.loads(job.params) if job.params else {}
+    response = JobResponse(
+        id=job.id,
+        status=job.status,
+        operation=job.operation,
+        input_value=job.input_value,
+        exponent=job.exponent,
+        modulus=params.get("modulus"),
+        cached=job.cached,
+        computation_time_ms=job.computation_time_ms,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        expires_at=job.expires_at
+    )
+    if job.status == jobs.PENDING:
+        response.position = await job_service.position(job)
+    if job.started_at is not None:
+        elapsed = (job.finished_at or datetime.utcnow()) - job.started_at
+        response.elapsed_ms = elapsed.total_seconds() * 1000
+    if job.status == jobs.DONE:
+        response.result_url = f"{settings.API_V1_STR}/jobs/{job.id}/result"
+    return response
+
+
+def _overloaded(error: OverloadedError) -> HTTPException:
+    """503 for a computation the scheduler shed, with a hint for when to retry."""
+    return HTTPException(
+        status_code=503, detail=str(error), headers={"Retry-After": retry_after(error)}
+    )
+
 
 @router.get("/health", response_model=HealthCheckResponse)
 async def health_check():
@@ -46,112 +188,722 @@ async def calculate(
     - Power: Calculate base^exponent
     - Fibonacci: Get n-th Fibonacci number
     - Factorial: Calculate n!
+    - Binomial / Permutation: C(n, k) and n!/(n-k)!, with k as the exponent
+      and an optional modulus
+    - Linear recurrence: n-th term from a preset (fibonacci, lucas, pell,
+      tribonacci) or coefficients and initial terms, optionally modulo m
     """
     try:
-        # Check cache first
-        cached_result = await cache_service.get(
+        result, computation_time, from_cache = await registry.execute(
             request.operation.value,
             request.value,
-            request.exponent
+            request.exponent,
+            _operation_params(request)
         )
         
-        if cached_result is not None:
-            # Return cached result
-            result = cached_result
-            computation_time = 0.0
-            from_cache = True
-        else:
-            # Perform calculation
-            if request.operation == OperationType.POWER:
-                result, computation_time = await calculator.power(
-                    request.value,
-                    request.exponent
-                )
-            elif request.operation == OperationType.FIBONACCI:
-                result, computation_time = await calculator.fibonacci(request.value)
-            elif request.operation == OperationType.FACTORIAL:
-                result, computation_time = await calculator.factorial(request.value)
-            else:
-                raise ValueError(f"Unsupported operation: {request.operation}")
-            
-            # Cache the result
-            await cache_service.set(
-                request.operation.value,
-                request.value,
-                result,
-                request.exponent
-            )
-            from_cache = False
-        
         # Store in database
-        operation_record = OperationHistory(
-            operation=request.operation.value,
-            input_value=request.value,
-            exponent=request.exponent,
-            result=str(result),  # Store as string to handle large numbers
-            computation_time_ms=computation_time,
-            ip_address=req.client.host
+        record = _history_record(
+            request.operation.value,
+            request.value,
+            request.exponent,
+            result,
+            computation_time,
+            req.client.host
         )
-        db.add(operation_record)
-        await db.commit()
+        if _keep_history(record, from_cache):
+            db.add(record)
+            await db.commit()
+            recent_history.add([record])
         
         # Return response
-        return MathOperationResponse(
-            operation=request.operation,
-            input_value=request.value,
-            exponent=request.exponent,
-            result=result,
-            cached=from_cache,
-            computation_time_ms=computation_time
-        )
+        return FastJSONResponse(_operation_response(
+            request, _response_result(result, record), computation_time, from_cache
+        ))
         
+    except OverloadedError as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+
+def _etag(request: MathOperationRequest) -> str:
+    """Strong ETag for a calculation, derived from the request alone since results never change."""
+    key = registry.request_key(
+        request.operation.value, request.value, request.exponent, _operation_params(request)
+    )
+    return f'"{settings.VERSION}-{key}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches ``etag`` (weak comparison, per RFC 9110)."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in (candidate.removeprefix("W/") for candidate in candidates)
+
+
+@router.get(
+    "/calculate/{operation}/{value}",
+    response_model=MathOperationResult,
+    responses={304: {"description": "Not modified: the client's copy, named by ETag, is current"}}
+)
+async def calculate_get(
+    operation: OperationType,
+    value: int,
+    req: Request,
+    exponent: Optional[int] = None,
+    modulus: Optional[int] = None,
+    preset: Optional[RecurrencePreset] = None,
+    coefficients: Optional[List[int]] = Query(None),
+    initial_terms: Optional[List[int]] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Perform a calculation as a cacheable GET.
+
+    Results are deterministic, so responses carry a strong ETag computed
+    from the request and a long-lived `Cache-Control`, letting proxies and
+    CDNs answer repeats. `If-None-Match` with a matching ETag gets `304 Not
+    Modified` without computing anything, and without a history record
+    unless HTTP_LOG_CONDITIONAL_HITS is set. The body holds only the result;
+    `X-Cache` and `Server-Timing` report cache status and computation time.
+    """
+    try:
+        request = MathOperationRequest(
+            operation=operation,
+            value=value,
+            exponent=exponent,
+            modulus=modulus,
+            preset=preset,
+            coefficients=coefficients,
+            initial_terms=initial_terms
+        )
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+
+    caching_headers = {
+        "ETag": _etag(request),
+        "Cache-Control": f"public, max-age={settings.HTTP_CACHE_MAX_AGE_SECONDS}, immutable"
+    }
+    not_modified = _etag_matches(req.headers.get("if-none-match"), caching_headers["ETag"])
+    if not_modified and not settings.HTTP_LOG_CONDITIONAL_HITS:
+        return Response(status_code=304, headers=caching_headers)
+
+    try:
+        result, computation_time, from_cache = await registry.execute(
+            operation.value, value, exponent, _operation_params(request)
+        )
+        record = _history_record(
+            operation.value, value, exponent, result, computation_time, req.client.host
+        )
+        if _keep_history(record, from_cache):
+            db.add(record)
+            await db.commit()
+            recent_history.add([record])
+    except OverloadedError as e:
+        raise _overloaded(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+    if not_modified:
+        return Response(status_code=304, headers=caching_headers)
+    return FastJSONResponse(
+        {
+            "operation": operation,
+            "input_value": value,
+            "exponent": exponent,
+            "modulus": modulus,
+            "result": _response_result(result, record),
+        },
+        headers={
+            **caching_headers,
+            "X-Cache": "HIT" if from_cache else "MISS",
+            "Server-Timing": f"compute;dur={computation_time:.3f}",
+        }
+    )
+
+
+def _parse_ws_message(text: str) -> Tuple[Any, Optional[MathOperationRequest], Any]:
+    """Split a WebSocket message into (id, request, error); exactly one of request and error is set."""
+    message_id = None
+    try:
+        payload = json.loads(text)
+        message_id = payload.pop("id", None)
+        return message_id, MathOperationRequest(**payload), None
+    except ValidationError as e:
+        return message_id, None, e.errors(include_url=False, include_context=False)
+    except (ValueError, TypeError, AttributeError) as e:
+        return message_id, None, f"Invalid message: {e}"
+
+
+async def _ws_calculate(
+    request: MathOperationRequest,
+    client_host: Optional[str],
+    history: HistoryBatch
+) -> Dict[str, Any]:
+    """Run one WebSocket calculation and queue its history row; returns the reply body."""
+    result, computation_time, from_cache = await registry.execute(
+        request.operation.value,
+        request.value,
+        request.exponent,
+        _operation_params(request)
+    )
+    record = _history_record(
+        request.operation.value, request.value, request.exponent,
+        result, computation_time, client_host
+    )
+    if _keep_history(record, from_cache):
+        history.add(record)
+    return _operation_response(
+        request, _response_result(result, record), computation_time, from_cache
+    )
+
+
+class _WebSocketSession:
+    """One /ws connection: flow control, metering, serialized replies and batched history."""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.client_host = websocket.client.host if websocket.client else None
+        # The HTTP rate limit middleware does not see WebSocket messages; each is metered here
+        self.client = client_identity(websocket.scope, websocket.headers)
+        self.in_flight = asyncio.Semaphore(settings.WS_MAX_IN_FLIGHT)
+        self.history = HistoryBatch()
+        self._limiter = ratelimit.rate_limiter
+        self._send_lock = asyncio.Lock()
+        self._tasks = set()
+
+    async def reply(self, message: Dict[str, Any]) -> None:
+        """Send one reply; replies from concurrent calculations never interleave."""
+        try:
+            async with self._send_lock:
+                await self.websocket.send_text(dumps(message).decode())
+        except (WebSocketDisconnect, RuntimeError):
+            # The client went away; the receive loop notices on its next read
+            pass
+
+    async def _settle(self, bill: ratelimit.Bill) -> None:
+        if self._limiter is not None:
+            await self._limiter.settle(self.client, bill.tokens())
+
+    async def _handle(self, message_id: Any, request: MathOperationRequest) -> None:
+        with ratelimit.billing() as bill:
+            try:
+                message = {
+                    "id": message_id,
+                    **await _ws_calculate(request, self.client_host, self.history)
+                }
+            except Exception as e:
+                message = {"id": message_id, "error": str(e)}
+            finally:
+                self.in_flight.release()
+                await self._settle(bill)
+        await self.reply(message)
+
+    async def _admit(self, message_id: Any) -> Optional[Dict[str, Any]]:
+        """Admit one message against the client's rate limit; the rejection reply if refused."""
+        if self._limiter is None:
+            return None
+        wait = await self._limiter.admit(self.client)
+        if wait is None:
+            return None
+        metrics.counter("rate_limit.rejected").add()
+        return {"id": message_id, "error": "Rate limit exceeded", "retry_after": max(1, math.ceil(wait))}
+
+    async def dispatch(self, text: str) -> None:
+        """
+        Parse, meter and validate one message, then start its calculation.
+
+        The caller holds an ``in_flight`` slot for the message; it is released
+        here for refused and invalid messages and when the calculation
+        finishes otherwise. Invalid messages pay the flat request cost, as
+        invalid HTTP requests do.
+        """
+        message_id, request, error = _parse_ws_message(text)
+        rejection = await self._admit(message_id)
+        if rejection is None and request is None:
+            await self._settle(ratelimit.Bill())
+            rejection = {"id": message_id, "error": error}
+        if rejection is not None:
+            self.in_flight.release()
+            await self.reply(rejection)
+            return
+        task = asyncio.create_task(self._handle(message_id, request))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self) -> None:
+        """Cancel unfinished calculations and write the remaining history."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.history.close()
+
+
+@router.websocket("/ws")
+async def calculate_ws(websocket: WebSocket):
+    """
+    Pipelined calculations over one WebSocket connection.
+
+    Each text message is a `/calculate` body plus a client-chosen `id`; each
+    reply is the `/calculate` response with that `id`, or `{"id", "error"}`.
+    Replies are sent as calculations finish, so they may arrive out of
+    order. At most WS_MAX_IN_FLIGHT calculations run per connection; beyond
+    that, messages are not read until one finishes. With rate limiting on,
+    every message is charged like a request, and refused ones get
+    `{"id", "error", "retry_after"}`. History rows are written in batches.
+    """
+    await websocket.accept()
+    session = _WebSocketSession(websocket)
+    try:
+        while True:
+            # Flow control: stop reading while the connection has its fill of work
+            await session.in_flight.acquire()
+            await session.dispatch(await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
+
+
+@router.post("/calculate/batch", response_model=BatchOperationResponse)
+async def calculate_batch(
+    request: BatchOperationRequest,
+    req: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Perform many calculations in one request.
+
+    Powers small enough for machine arithmetic are evaluated together and
+    bypass the cache, since recomputing them is cheaper than a lookup; the
+    rest follow the same cache path as `/calculate`.
+    """
+    operations = request.operations
+    if len(operations) > settings.BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch size exceeds the maximum of {settings.BATCH_MAX_SIZE}"
+        )
+
+    try:
+        start_time = time.time()
+        outcomes = await registry.execute_many([
+            (op.operation.value, op.value, op.exponent, _operation_params(op))
+            for op in operations
+        ])
+
+        records = [
+            _history_record(
+                op.operation.value, op.value, op.exponent, result, computation_time,
+                req.client.host
+            )
+            for op, (result, computation_time, _) in zip(operations, outcomes)
+        ]
+        kept = [
+            record for record, (_, _, from_cache) in zip(records, outcomes)
+            if _keep_history(record, from_cache)
+        ]
+        db.add_all(kept)
+        await db.commit()
+        recent_history.add(kept)
+
+        return FastJSONResponse({
+            "results": [
+                _operation_response(
+                    op, _response_result(result, record), computation_time, from_cache
+                )
+                for op, record, (result, computation_time, from_cache)
+                in zip(operations, records, outcomes)
+            ],
+            "computation_time_ms": (time.time() - start_time) * 1000
+        })
+
+    except OverloadedError as e:
+        raise _overloaded(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
 
+@router.post("/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(request: MathOperationRequest, req: Request, response: Response):
+    """
+    Queue a calculation to run in the background.
+
+    Takes the same body as `/calculate` and returns at once; poll the job's
+    URL (also in the Location header) until it is done, then stream the
+    result. Submitting a calculation identical to a pending or running job
+    returns that job instead of queueing another.
+    """
+    params = _operation_params(request)
+    try:
+        # Validates the parameters now rather than when a worker gets to the job
+        cost = registry.estimate_cost(
+            request.operation.value, request.value, request.exponent, params
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    job, created = await job_service.submit(
+        request.operation.value,
+        request.value,
+        request.exponent,
+        params,
+        req.client.host if req.client else None
+    )
+    if created:
+        # Workers run outside the request, so the submitter pays up front
+        ratelimit.charge(cost)
+    response.headers["Location"] = f"{settings.API_V1_STR}/jobs/{job.id}"
+    return await _job_response(job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Get a job's status and progress."""
+    job = await job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await _job_response(job)
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    Stream a finished job's result as plain text.
+
+    Results are sent in chunks as they are read, so a result with millions
+    of digits never has to be built into a JSON document.
+    """
+    job = await job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == jobs.FAILED:
+        raise HTTPException(status_code=409, detail=f"Job failed: {job.error}")
+    if job.status != jobs.DONE:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return StreamingResponse(
+        job_service.stream_result(job_id, JOB_RESULT_CHUNK_CHARS),
+        media_type="text/plain"
+    )
+
+
+@router.post("/power/summary", response_model=PowerSummaryResponse)
+async def power_summary(request: PowerSummaryRequest):
+    """
+    Describe base^exponent without computing all of its digits.
+
+    Digit count, bit length and leading digits are derived analytically and
+    the residue by modular exponentiation, so this stays cheap for exponents
+    far beyond what `/calculate` can materialize.
+    """
+    try:
+        start_time = time.time()
+        lazy_result = await cache_service.get("power_lazy", request.base, request.exponent)
+        from_cache = lazy_result is not None
+        if not from_cache:
+            lazy_result, _ = await calculator.power(request.base, request.exponent, lazy=True)
+            # Only (base, exponent) is stored, whatever the size of the value
+            await cache_service.set("power_lazy", request.base, lazy_result, request.exponent)
+
+        return PowerSummaryResponse(
+            base=request.base,
+            exponent=request.exponent,
+            sign=lazy_result.sign,
+            digit_count=lazy_result.digit_count(),
+            bit_length=lazy_result.bit_length(),
+            leading_digits=lazy_result.leading_digits(request.leading_digits),
+            modulus=request.modulus,
+            mod_result=(
+                lazy_result.mod(request.modulus) if request.modulus is not None else None
+            ),
+            cached=from_cache,
+            computation_time_ms=(time.time() - start_time) * 1000
+        )
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _sequence_cost(request: SequenceRequest) -> float:
+    """Estimated work of a sequence: about that of its last element."""
+    try:
+        if request.operation == OperationType.POWER:
+            return registry.estimate_cost(request.operation.value, request.base, request.stop)
+        return registry.estimate_cost(request.operation.value, request.stop)
+    except ValueError:
+        # Operations without a sequence form are rejected by the endpoint
+        return 0.0
+
+
+def _sequence_chunks(values: Iterator[Tuple[int, int]]) -> Iterator[bytes]:
+    """NDJSON lines of (index, value) pairs, in chunks of about SEQUENCE_CHUNK_BYTES."""
+    buffer = []
+    size = 0
+    for index, value in values:
+        line = json.dumps({"index": index, "result": value}) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= SEQUENCE_CHUNK_BYTES:
+            yield "".join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+class _HeldStreamingResponse(StreamingResponse):
+    """Streaming response that exits ``stack`` once it is sent, or abandoned part way."""
+
+    def __init__(self, content: AsyncIterator[bytes], stack: AsyncExitStack, **kwargs):
+        super().__init__(content, **kwargs)
+        self._stack = stack
+
+    async def __call__(self, scope, receive, send) -> None:
+        async with self._stack:
+            await super().__call__(scope, receive, send)
+
+
+@router.post("/sequence")
+async def sequence(request: SequenceRequest, req: Request):
+    """
+    Stream successive results of an operation over an index range as NDJSON.
+
+    Each line is a JSON object with `index` and `result`. Values are produced
+    incrementally, so the whole range costs about as much as its last element.
+    The stream holds a scheduler slot from before it starts until it ends, so
+    an overloaded service answers 503 rather than starting it. A single
+    history record summarising the range is written once the stream
+    completes.
+    """
+    try:
+        values = calculator.sequence(
+            request.operation.value,
+            request.start,
+            request.stop,
+            step=request.step,
+            base=request.base,
+            modulus=request.modulus
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    client_host = req.client.host if req.client else None
+    cost = _sequence_cost(request)
+    ratelimit.charge(cost)
+    stack = AsyncExitStack()
+    try:
+        await stack.enter_async_context(scheduler.slot(cost))
+    except OverloadedError as e:
+        raise _overloaded(e)
+
+    async def stream() -> AsyncIterator[bytes]:
+        start_time = time.time()
+        async for chunk in iterate_in_threadpool(_sequence_chunks(values)):
+            yield chunk
+        computation_time = (time.time() - start_time) * 1000
+
+        summary = [request.start, request.stop, request.step]
+        if request.modulus is not None:
+            summary.append(request.modulus)
+        record = OperationHistory(
+            operation=f"{request.operation.value}_sequence",
+            input_value=request.start,
+            exponent=request.base,
+            result=json.dumps(summary),
+            computation_time_ms=computation_time,
+            ip_address=client_host
+        )
+        operation_rollups.record(record.operation, False, computation_time)
+        async with AsyncSessionLocal() as db:
+            db.add(record)
+            await db.commit()
+        recent_history.add([record])
+
+    return _HeldStreamingResponse(stream(), stack, media_type="application/x-ndjson")
+
+
 @router.get("/history", response_model=List[OperationHistoryItem])
 async def get_history(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     operation: Optional[OperationType] = None,
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Get operation history with optional filtering."""
-    query = select(OperationHistory)
-    
-    if operation:
-        query = query.where(OperationHistory.operation == operation.value)
-    
-    query = query.order_by(desc(OperationHistory.created_at))
-    query = query.offset(skip).limit(limit)
-    
-    result = await db.execute(query)
-    operations = result.scalars().all()
+    """
+    Get operation history with optional filtering, newest first.
+
+    Recent pages are served from memory when the recent-history buffer
+    holds them (see RecentHistory); deeper ones are read from the database.
+    """
+    operations = recent_history.page(skip, limit, operation.value if operation else None)
+    if operations is None:
+        query = select(OperationHistory)
+
+        if operation:
+            query = query.where(OperationHistory.operation == operation.value)
+
+        # Ids break ties between rows created in the same instant, as in memory
+        query = query.order_by(desc(OperationHistory.created_at), desc(OperationHistory.id))
+        query = query.offset(skip).limit(limit)
+
+        result = await db.execute(query)
+        operations = result.scalars().all()
     
-    # Convert to response model
-    return [
-        OperationHistoryItem(
-            id=op.id,
-            operation=op.operation,
-            input_value=op.input_value,
-            exponent=op.exponent,
-            result=json.loads(op.result) if op.result.startswith('[') else int(op.result),
-            computation_time_ms=op.computation_time_ms,
-            created_at=op.created_at,
-            ip_address=op.ip_address
-        )
-        for op in operations
-    ]
+    # Encoded directly; the response model documents the shape
+    return FastJSONResponse([_history_item(op) for op in operations])
+
+
+def _history_item(op: OperationHistory) -> Dict[str, Any]:
+    """A history row in the shape of OperationHistoryItem."""
+    return {
+        "id": op.id,
+        "operation": op.operation,
+        "input_value": op.input_value,
+        "exponent": op.exponent,
+        "result": _stored_result(op),
+        "computation_time_ms": op.computation_time_ms,
+        "created_at": op.created_at,
+        "ip_address": op.ip_address,
+    }
+
+
+def _naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+    """History timestamps are naive UTC; convert query bounds given with an offset."""
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _archived_history_chunks(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    operation: Optional[str]
+) -> Iterator[bytes]:
+    """Archived history in the range as NDJSON, in chunks of about SEQUENCE_CHUNK_BYTES."""
+    buffer = []
+    size = 0
+    for record in history_archiver.read(start, end, operation):
+        line = dumps(_history_item(record_to_row(record))) + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= SEQUENCE_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _history_range_query(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    operation: Optional[str]
+):
+    """History rows created in [start, end), optionally of one operation, oldest first."""
+    query = select(OperationHistory)
+    if start is not None:
+        query = query.where(OperationHistory.created_at >= start)
+    if end is not None:
+        query = query.where(OperationHistory.created_at < end)
+    if operation is not None:
+        query = query.where(OperationHistory.operation == operation)
+    return query.order_by(OperationHistory.created_at, OperationHistory.id)
+
+
+@router.get("/history/hits")
+async def get_history_hits(
+    limit: int = Query(100, ge=1, le=1000),
+    operation: Optional[OperationType] = None
+):
+    """
+    Get cache hits counted instead of written to history, most hit first.
+
+    Under the `aggregate` history policy, hits are counted per calculation
+    and written every HISTORY_HIT_FLUSH_SECONDS; this sums what has been
+    written.
+    """
+    totals = await history_policy.counters.totals(
+        operation.value if operation else None, limit
+    )
+    return FastJSONResponse(totals)
+
+
+@router.get("/history/archive")
+async def get_history_archive(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    operation: Optional[OperationType] = None,
+    include_recent: bool = True
+):
+    """
+    Stream history created in [start, end) as NDJSON, oldest first, including archives.
+
+    History older than HISTORY_RETENTION_DAYS is moved from the database to
+    compressed archive files; this reads through the archives covering the
+    range, then the rows still in the database unless `include_recent` is
+    false. Each line has the shape of a `/history` item.
+    """
+    start, end = _naive_utc(start), _naive_utc(end)
+    operation_name = operation.value if operation else None
+
+    async def stream() -> AsyncIterator[bytes]:
+        archived = _archived_history_chunks(start, end, operation_name)
+        async for chunk in iterate_in_threadpool(archived):
+            yield chunk
+        if not include_recent:
+            return
+
+        query = _history_range_query(start, end, operation_name)
+        async with AsyncReadSessionLocal() as db:
+            rows = await db.stream_scalars(query.execution_options(yield_per=HISTORY_STREAM_ROWS))
+            async for partition in rows.partitions():
+                yield b"".join(dumps(_history_item(op)) + b"\n" for op in partition)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
 @router.get("/cache/stats")
 async def get_cache_stats():
-    """Get cache statistics."""
+    """Get cache statistics: occupancy, per-operation hit ratios, latencies and hot keys."""
     return await cache_service.get_stats()
 
 
+@router.get("/stats")
+async def get_stats():
+    """Get service statistics: requests, computation times, scheduler queues and the cache."""
+    return {
+        **metrics.snapshot(),
+        "scheduler": scheduler.snapshot(),
+        "cache": await cache_service.get_stats()
+    }
+
+
+@router.get("/stats/operations")
+async def get_operation_stats(
+    granularity: str = Query(MINUTE, pattern=f"^({'|'.join(GRANULARITIES)})$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    operation: Optional[str] = None
+):
+    """
+    Get per-operation call counts, cache-hit ratios and computation-time percentiles.
+
+    Each item covers one operation over one minute or hour starting in
+    [start, end) (by default the last 60 buckets), oldest first. The
+    figures are maintained as calculations are recorded, so this reads one
+    row per bucket rather than scanning history. Percentiles are over
+    cache misses, since hits compute nothing.
+    """
+    buckets = await operation_rollups.query(
+        granularity, _naive_utc(start), _naive_utc(end), operation
+    )
+    return FastJSONResponse(buckets)
+
+
 @router.delete("/cache")
 async def clear_cache():
     """Clear the cache."""
@@ -0,0 +1,269 @@
+"""ASGI middleware."""
+import hmac
+import json
+import math
+import time
+from typing import Iterable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.services.ratelimit import MemoryRateLimiter, billing
+from app.services.routing import (
+    CLIENT_HEADER, FORWARDED_HEADER, NODE_HEADER, SECRET_HEADER, ClusterRouter
+)
+from app.services.stats import MetricsRegistry, metrics as default_metrics
+
+# Request headers passed on to the owning node
+_FORWARDED_REQUEST_HEADERS = ("content-type", "accept", "user-agent", "if-none-match")
+# Response headers that describe the hop, not the content
+_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-encoding", "content-length"}
+
+
+class StatsMiddleware:
+    """
+    Count requests and response classes per endpoint and time a sample of them.
+
+    Requests are labelled by the name of the endpoint that handled them, not
+    by path, so path parameters cannot blow up the number of series.
+    """
+
+    def __init__(self, app: ASGIApp, metrics: MetricsRegistry = default_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        sampled = metrics.sample()
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get("endpoint")
+            label = getattr(endpoint, "__name__", "unmatched")
+            metrics.counter(f"requests.{label}").add()
+            metrics.counter(f"responses.{status // 100}xx").add()
+            if sampled:
+                metrics.histogram(f"latency.{label}").record(time.perf_counter() - start)
+
+
+def _from_peer(scope: Scope, headers: Headers) -> bool:
+    """
+    Whether a request was forwarded by another node of the cluster.
+
+    With CLUSTER_SECRET set the request must carry it; otherwise it must come
+    from the host of one of CLUSTER_PEERS. Anyone else could set the
+    forwarding headers to be billed as somebody else.
+    """
+    if FORWARDED_HEADER not in headers:
+        return False
+    if settings.CLUSTER_SECRET:
+        return hmac.compare_digest(
+            headers.get(SECRET_HEADER, "").encode(), settings.CLUSTER_SECRET.encode()
+        )
+    client = scope.get("client")
+    return client is not None and client[0] in {
+        urlsplit(peer).hostname for peer in settings.CLUSTER_PEERS
+    }
+
+
+def client_identity(scope: Scope, headers: Headers) -> str:
+    """Who a request is billed to: the original client of a peer-forwarded request, else this one."""
+    if CLIENT_HEADER in headers and _from_peer(scope, headers):
+        return headers[CLIENT_HEADER]
+    if settings.RATE_LIMIT_CLIENT_HEADER and settings.RATE_LIMIT_CLIENT_HEADER in headers:
+        return headers[settings.RATE_LIMIT_CLIENT_HEADER]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    """
+    Admit requests against per-client token buckets charged by computation cost.
+
+    Each request pays RATE_LIMIT_REQUEST_COST plus one token per
+    RATE_LIMIT_COST_UNIT of estimated work for every result it actually
+    computes (registry.execute charges cache misses only), so cache hits
+    are nearly free and a large factorial costs what it takes. Requests are
+    charged once they finish; a client whose bucket is in debt, or which
+    has RATE_LIMIT_MAX_CONCURRENT requests running, gets 429 with a
+    Retry-After header.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        limiter: MemoryRateLimiter,
+        exempt_paths: Iterable[str] = None,
+        metrics: MetricsRegistry = default_metrics
+    ):
+        self.app = app
+        self.limiter = limiter
+        # Peers health-check each other, and must not be throttled for it
+        self.exempt_paths = set(exempt_paths or [f"{settings.API_V1_STR}/health"])
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        client = client_identity(scope, Headers(scope=scope))
+        wait = await self.limiter.admit(client)
+        if wait is not None:
+            self.metrics.counter("rate_limit.rejected").add()
+            response = JSONResponse(
+                {"detail": "Rate limit exceeded"},
+                status_code=429,
+                headers={"Retry-After": str(max(1, math.ceil(wait)))}
+            )
+            await response(scope, receive, send)
+            return
+
+        with billing() as bill:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                await self.limiter.settle(client, bill.tokens())
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+class RoutingMiddleware:
+    """
+    Send each calculation to the node that owns it on a consistent-hash ring.
+
+    Requests are keyed by (operation, value, exponent), taken from the body
+    of POST /calculate or the path and query of GET /calculate/{operation}/
+    {value}, so a given result is computed and cached by one node of the
+    cluster instead of one per replica. Requests this node owns, requests another node already
+    forwarded, and bodies that cannot be keyed are handled locally; so are
+    requests whose owner cannot be reached, which also takes that owner off
+    the ring until it passes a health check.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        router: ClusterRouter,
+        paths: Iterable[str] = None,
+        metrics: MetricsRegistry = default_metrics
+    ):
+        self.app = app
+        self.router = router
+        self.paths = set(paths or [f"{settings.API_V1_STR}/calculate"])
+        self.get_prefix = f"{settings.API_V1_STR}/calculate/"
+        self.metrics = metrics
+
+    def _owner(self, body: bytes) -> str:
+        try:
+            payload = json.loads(body)
+            return self.router.owner(payload["operation"], payload["value"], payload.get("exponent"))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            # Malformed requests are rejected locally, with the usual validation errors
+            return self.router.node_url
+
+    def _owner_of_path(self, scope: Scope) -> str:
+        parts = scope["path"][len(self.get_prefix):].split("/")
+        query = parse_qs(scope["query_string"].decode())
+        try:
+            operation, value = parts
+            exponent: Optional[int] = None
+            if "exponent" in query:
+                exponent = int(query["exponent"][0])
+            return self.router.owner(operation, int(value), exponent)
+        except ValueError:
+            return self.router.node_url
+
+    async def _forward(
+        self, owner: str, scope: Scope, body: bytes, headers: Headers, send: Send
+    ) -> bool:
+        """Relay the request to ``owner``; False if it is unreachable and the request should run here."""
+        target = scope["path"]
+        if scope["query_string"]:
+            target += "?" + scope["query_string"].decode()
+        forward_headers = {
+            name: headers[name] for name in _FORWARDED_REQUEST_HEADERS if name in headers
+        }
+        # The owner bills the computation to the client, not to this node
+        forward_headers[CLIENT_HEADER] = client_identity(scope, headers)
+        try:
+            upstream = await self.router.forward(
+                owner, scope["method"], target, body, forward_headers
+            )
+        except httpx.TransportError:
+            self.router.mark_down(owner)
+            self.metrics.counter("routing.fallbacks").add()
+            return False
+
+        self.metrics.counter("routing.forwarded").add()
+        response = Response(
+            upstream.content,
+            status_code=upstream.status_code,
+            headers={
+                name: value for name, value in upstream.headers.items()
+                if name.lower() not in _HOP_HEADERS
+            }
+        )
+        await response(scope, None, send)
+        return True
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method, path = scope["method"], scope["path"]
+        if method == "POST" and path in self.paths:
+            body = await _read_body(receive)
+        elif method == "GET" and path.startswith(self.get_prefix):
+            body = b""
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        owner = self.router.node_url
+        if FORWARDED_HEADER not in headers:
+            owner = self._owner(body) if method == "POST" else self._owner_of_path(scope)
+
+        if owner != self.router.node_url and await self._forward(owner, scope, body, headers, send):
+            return
+
+        replayed = method != "POST"
+
+        async def replay() -> Message:
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[NODE_HEADER] = self.router.node_url
+            await send(message)
+
+        await self.app(scope, replay, send_wrapper)
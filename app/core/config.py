@@ -20,11 +20,125 @@ class Settings(BaseSettings):
     
     # Database Configuration
     DATABASE_URL: Optional[str] = None
+    DATABASE_READ_URL: Optional[str] = None  # e.g. a replica for /history; defaults to DATABASE_URL
+    DB_POOL_SIZE: int = 10  # connections kept per process (not SQLite)
+    DB_MAX_OVERFLOW: int = 20  # extra connections opened under load (not SQLite)
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0  # wait for a free connection before failing
+    DB_POOL_RECYCLE_SECONDS: int = 1800  # reconnect before servers drop idle connections
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # wait for other processes' write locks
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024  # page cache per connection
+    SQLITE_READ_POOL_SIZE: int = 4  # query-only connections for /history
     
     # Cache Configuration
     CACHE_TTL_SECONDS: int = 3600
     CACHE_MAX_SIZE: int = 1000
+    CACHE_POLICY: str = "lru"  # lru or tinylfu
+    CACHE_EXPIRY_INTERVAL_SECONDS: float = 1.0  # how often expired entries are freed
+    CACHE_EXPIRY_BATCH: int = 1000  # most entries examined per expiry tick
+    CACHE_EXPENSIVE_TTL_SECONDS: int = 86400  # TTL for results that took long to compute
+    CACHE_EXPENSIVE_THRESHOLD_MS: float = 100.0
+    CACHE_BACKEND: str = "memory"  # memory (per process) or shared (per host, across workers)
+    SHARED_CACHE_NAME: str = "math_ops_cache"
+    SHARED_CACHE_SLOTS: int = 65536
+    SHARED_CACHE_ARENA_BYTES: int = 256 * 1024 * 1024
+    SHARED_CACHE_LOCK_STRIPES: int = 64
+
+    # Cluster Configuration (routing is off unless both of the first two are set)
+    CLUSTER_NODE_URL: Optional[str] = None  # this node's base URL as its peers reach it
+    CLUSTER_PEERS: list = []  # base URLs of every node, this one may be included
+    CLUSTER_VIRTUAL_NODES: int = 100  # ring points per node
+    CLUSTER_HEALTH_INTERVAL_SECONDS: float = 2.0
+    CLUSTER_HEALTH_TIMEOUT_SECONDS: float = 1.0
+    CLUSTER_FORWARD_TIMEOUT_SECONDS: float = 300.0  # forwarded computations may be heavy
+    CLUSTER_MAX_CONNECTIONS: int = 100  # pooled connections across all peers
+    # Sent with forwarded requests; unset, peers are recognised by their CLUSTER_PEERS host
+    CLUSTER_SECRET: Optional[str] = None
+
+    # Arithmetic Configuration
+    ARITHMETIC_BACKEND: str = "auto"  # auto, gmpy2 or python
+
+    # Scheduling Configuration
+    INLINE_COST_THRESHOLD: int = 100000  # estimated result bits computed on the event loop
+
+    # Admission Configuration (offloaded computations only; cache hits never wait)
+    SCHEDULER_MAX_CONCURRENT: int = 0  # computations running at once; 0 means two per CPU
+    SCHEDULER_BULK_MAX_CONCURRENT: int = 0  # slots bulk work may hold; 0 means half
+    SCHEDULER_BULK_COST: float = 10_000_000  # estimated cost (result bits) from which work is bulk
+    SCHEDULER_INTERACTIVE_WEIGHT: int = 4  # share of freed slots when both lanes are waiting
+    SCHEDULER_BULK_WEIGHT: int = 1
+    SCHEDULER_INTERACTIVE_TIMEOUT_SECONDS: float = 2.0  # queue wait before a request is shed
+    SCHEDULER_BULK_TIMEOUT_SECONDS: float = 30.0
+    SCHEDULER_MAX_QUEUE: int = 1000  # waiting computations per lane before new ones are shed
+
+    # Factorial Configuration
+    FACTORIAL_PARALLEL_WORKERS: int = 0  # 0 means one worker per CPU
+    FACTORIAL_PARALLEL_THRESHOLD: int = 50000
+
+    # Prime Configuration
+    PRIME_SIEVE_LIMIT: int = 50_000_000  # prime_count below this sums cached sieve segments
+    PRIME_COUNT_MAX: int = 10 ** 12  # largest range prime_count/nth_prime will cover
+
+    # Combinatorics Configuration
+    COMBINATORICS_SIEVE_LIMIT: int = 10 ** 7  # binomial factorizes over primes up to n below this
+
+    # Job Configuration
+    JOB_WORKERS: int = 2  # jobs run concurrently per process
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0  # how often idle workers look for jobs from other processes
+    JOB_HEARTBEAT_SECONDS: float = 10.0  # running jobs silent for 3 heartbeats are picked up again
+    JOB_RESULT_TTL_SECONDS: int = 86400  # finished jobs and their results are kept this long
+    JOB_CLEANUP_INTERVAL_SECONDS: float = 60.0
+
+    # HTTP Caching Configuration (GET /calculate/{operation}/{value})
+    HTTP_CACHE_MAX_AGE_SECONDS: int = 31536000  # results never change, so a year
+    HTTP_LOG_CONDITIONAL_HITS: bool = False  # write history for 304 Not Modified responses
+
+    # WebSocket Configuration
+    WS_MAX_IN_FLIGHT: int = 32  # calculations one connection may have running at once
+    WS_HISTORY_BATCH: int = 100  # history rows written per transaction
+    WS_HISTORY_FLUSH_SECONDS: float = 1.0  # longest a history row waits to be written
+
+    # Rate Limiting Configuration (token buckets charged by estimated computation cost)
+    RATE_LIMIT_ENABLED: bool = False
+    RATE_LIMIT_BACKEND: str = "memory"  # memory (per process) or redis (shared)
+    RATE_LIMIT_REDIS_URL: str = "redis://localhost:6379/0"
+    RATE_LIMIT_REDIS_PREFIX: str = "math_ops:rate_limit"
+    RATE_LIMIT_CAPACITY: float = 100.0  # bucket size in tokens
+    RATE_LIMIT_REFILL_PER_SECOND: float = 10.0
+    RATE_LIMIT_REQUEST_COST: float = 0.1  # flat tokens per request, all a cache hit pays
+    RATE_LIMIT_COST_UNIT: float = 1_000_000  # estimated cost (result bits) per extra token
+    RATE_LIMIT_MAX_CONCURRENT: int = 8  # requests one client may have running
+    RATE_LIMIT_STALE_SECONDS: float = 600.0  # redis: in-flight entries older than this are dropped
+    RATE_LIMIT_CLIENT_HEADER: Optional[str] = None  # identify clients by this header, not address
+
+    # History Retention Configuration
+    HISTORY_RETENTION_DAYS: float = 0  # rows older than this move to archive files; 0 keeps all
+    HISTORY_ARCHIVE_DIR: str = "data/archive"
+    HISTORY_ARCHIVE_BUCKET_HOURS: int = 24  # time span of one archive file
+    HISTORY_ARCHIVE_INTERVAL_SECONDS: float = 3600.0  # how often old rows are archived
+    HISTORY_ARCHIVE_BATCH: int = 5000  # rows archived and deleted per transaction
+
+    # History Policy Configuration (cache misses are always written)
+    HISTORY_HIT_POLICY: str = "full"  # cache hits: full, sample, sample:<rate> or aggregate
+    HISTORY_HIT_POLICIES: dict = {}  # per operation, e.g. {"fibonacci": "sample:0.01"}
+    HISTORY_HIT_SAMPLE_RATE: float = 0.1  # fraction of hits written under "sample"
+    HISTORY_HIT_FLUSH_SECONDS: float = 60.0  # how often aggregated hit counts are written
+    HISTORY_RECENT_SIZE: int = 1000  # newest rows /history serves from memory; 0 disables
+    HISTORY_RECENT_MAX_BYTES: int = 64 * 1024 * 1024  # result text kept for them
+
+    # Batch Configuration
+    BATCH_MAX_SIZE: int = 10000
+
+    # Sequence Configuration
+    SEQUENCE_MAX_TERMS: int = 100000  # values one /sequence request may stream
     
+    # Stats Configuration
+    STATS_SAMPLE_RATE: float = 0.05  # fraction of cache calls and requests timed
+    ROLLUP_FLUSH_INTERVAL_SECONDS: float = 10.0  # how often operation rollups are written
+    ROLLUP_MINUTE_RETENTION_DAYS: float = 7.0  # per-minute rollups older than this are deleted
+
     # CORS Configuration
     BACKEND_CORS_ORIGINS: list = ["*"]
     
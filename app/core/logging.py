@@ -28,5 +28,7 @@ def setup_logging():
     # Configure specific loggers
     logging.getLogger("uvicorn.access").setLevel(logging.INFO)
     logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    # Cluster forwarding and health checks would log every request
+    logging.getLogger("httpx").setLevel(logging.WARNING)
     
     return logging.getLogger(__name__)
\ No newline at end of file
@@ -2,11 +2,12 @@
 import os
 from pathlib import Path
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from app.models.database import Base
 from app.core.config import settings
+from app.db.profile import create_engine, is_sqlite_file
 
 # Create data directory if it doesn't exist
 DATA_DIR = Path("data")
@@ -15,14 +16,16 @@ DATA_DIR.mkdir(exist_ok=True)
 # Database URL
 DATABASE_URL = settings.DATABASE_URL or f"sqlite+aiosqlite:///{DATA_DIR}/math_operations.db"
 
-# Create async engine
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=False,  # Set to True for SQL query logging
-    future=True
-)
+# Writes go through one engine; reads that may scan (e.g. /history) use another
+engine = create_engine(DATABASE_URL)
+READ_DATABASE_URL = settings.DATABASE_READ_URL or DATABASE_URL
+if is_sqlite_file(READ_DATABASE_URL) or READ_DATABASE_URL != DATABASE_URL:
+    read_engine = create_engine(READ_DATABASE_URL, read_only=True)
+else:
+    # An in-memory database cannot be opened twice, and a server pools for itself
+    read_engine = engine
 
-# Create async session factory
+# Create async session factories
 AsyncSessionLocal = sessionmaker(
     engine,
     class_=AsyncSession,
@@ -30,9 +33,24 @@ AsyncSessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False
 )
+AsyncReadSessionLocal = sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False
+)
 
 
 async def init_db():
     """Initialize database tables."""
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+        # create_all only indexes tables it creates; add indexes introduced since
+        await conn.run_sync(_create_missing_indexes)
+
+
+def _create_missing_indexes(connection) -> None:
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
\ No newline at end of file
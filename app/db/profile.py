@@ -0,0 +1,78 @@
+"""Engine options and connection settings per database backend."""
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.config import settings
+
+
+def is_sqlite_file(url: str) -> bool:
+    """Whether ``url`` is an SQLite database on disk (not in memory)."""
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database not in (None, "", ":memory:")
+
+
+def _sqlite_pragmas(read_only: bool):
+    """Connect listener applying the SQLite performance profile to each new connection."""
+    def apply(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers proceed while a write is in progress; it is a property of the
+        # database file, so the writer sets it and readers inherit it
+        if not read_only:
+            cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+        # In WAL mode NORMAL is durable across application crashes, only not power loss
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        # Negative sizes are in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+    return apply
+
+
+def _engine_options(url: str, read_only: bool) -> Dict[str, Any]:
+    if is_sqlite_file(url):
+        return {
+            # aiosqlite would open (and configure) a connection per session otherwise
+            "poolclass": AsyncAdaptedQueuePool,
+            # SQLite has one writer at a time: queue for it here, not on the file lock
+            "pool_size": settings.SQLITE_READ_POOL_SIZE if read_only else 1,
+            "max_overflow": 0,
+            "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        }
+    if make_url(url).get_backend_name() == "sqlite":
+        # In-memory databases live and die with their connection; keep the defaults
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": True,
+    }
+
+
+def create_engine(url: str, read_only: bool = False) -> AsyncEngine:
+    """
+    Create an engine tuned for its backend.
+
+    SQLite files get WAL, relaxed syncing, a memory-mapped file and a larger
+    page cache on every connection, a single pooled writer connection and,
+    for ``read_only`` engines, a pool of query-only connections. Other
+    backends get a sized connection pool with liveness checks.
+    """
+    engine = create_async_engine(
+        url,
+        echo=False,  # Set to True for SQL query logging
+        future=True,
+        **_engine_options(url, read_only)
+    )
+    if is_sqlite_file(url):
+        event.listen(engine.sync_engine, "connect", _sqlite_pragmas(read_only))
+    return engine
@@ -3,7 +3,7 @@ from typing import AsyncGenerator
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db.base import AsyncSessionLocal
+from app.db.base import AsyncReadSessionLocal, AsyncSessionLocal
 
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
@@ -14,6 +14,23 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         AsyncSession: Database session
     """
     async with AsyncSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency to get a read-only database session.
+
+    On SQLite these come from a pool of query-only connections, which read
+    in WAL mode without waiting for writers.
+
+    Yields:
+        AsyncSession: Read-only database session
+    """
+    async with AsyncReadSessionLocal() as session:
         try:
             yield session
         finally:
@@ -6,9 +6,18 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from app.api import endpoints
+from app.api.middleware import RateLimitMiddleware, RoutingMiddleware, StatsMiddleware
 from app.core.config import settings
 from app.core.logging import setup_logging
 from app.db.base import init_db
+from app.services.cache import cache_service
+from app.services.history import history_policy, recent_history
+from app.services.jobs import job_service
+from app.services.parallel import shutdown_pool
+from app.services.ratelimit import rate_limiter
+from app.services.retention import history_archiver
+from app.services.rollups import operation_rollups
+from app.services.routing import cluster_router
 
 
 # Setup logging
@@ -22,9 +31,28 @@ async def lifespan(app: FastAPI):
     logger.info("Starting up Math Operations Microservice...")
     await init_db()
     logger.info("Database initialized")
+    await recent_history.load()
+    cache_service.start_expiry()
+    job_service.start()
+    history_archiver.start()
+    operation_rollups.start()
+    history_policy.counters.start()
+    if cluster_router is not None:
+        cluster_router.start_health_checks()
+        logger.info(f"Routing across {len(cluster_router.peers) + 1} nodes")
     yield
     # Shutdown
     logger.info("Shutting down...")
+    await job_service.stop()
+    await history_archiver.stop()
+    await operation_rollups.stop()
+    await history_policy.counters.stop()
+    await cache_service.stop_expiry()
+    if cluster_router is not None:
+        await cluster_router.close()
+    if rate_limiter is not None:
+        await rate_limiter.close()
+    shutdown_pool()
 
 
 # Create FastAPI app
@@ -44,6 +72,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-client cost-based rate limiting; inside routing, so the node that computes bills
+if rate_limiter is not None:
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
+# Forward calculations to the node that caches them
+if cluster_router is not None:
+    app.add_middleware(RoutingMiddleware, router=cluster_router)
+
+# Request counts and sampled latencies for /stats
+app.add_middleware(StatsMiddleware)
+
 # Include routers
 app.include_router(
     endpoints.router,
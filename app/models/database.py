@@ -1,7 +1,7 @@
 """SQLAlchemy database models."""
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text
+from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime, Text, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -17,7 +17,8 @@ class OperationHistory(Base):
     exponent = Column(Integer, nullable=True)
     result = Column(Text, nullable=False)  # Store as text to handle large numbers
     computation_time_ms = Column(Float, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Indexed for newest-first listing and for finding rows due for archiving
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
     ip_address = Column(String(45), nullable=True)  # Support IPv6
 
     def __repr__(self):
@@ -25,4 +26,80 @@ class OperationHistory(Base):
         return (
             f"<OperationHistory(id={self.id}, operation={self.operation}, "
             f"input_value={self.input_value}, result={self.result})>"
-        )
\ No newline at end of file
+        )
+
+
+class HistoryHitCount(Base):
+    """Database model for cache hits counted rather than written to history one by one."""
+    __tablename__ = "history_hit_counts"
+
+    id = Column(Integer, primary_key=True)
+    operation = Column(String(50), nullable=False, index=True)
+    input_value = Column(Integer, nullable=False)
+    exponent = Column(Integer, nullable=True)
+    hits = Column(Integer, nullable=False)
+    # The span of one flush interval; a calculation gets a row per interval it was hit in
+    first_hit_at = Column(DateTime, nullable=False)
+    last_hit_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        """String representation."""
+        return (
+            f"<HistoryHitCount(operation={self.operation}, input_value={self.input_value}, "
+            f"exponent={self.exponent}, hits={self.hits})>"
+        )
+
+
+class OperationRollup(Base):
+    """Database model for per-operation aggregates over one minute or hour."""
+    __tablename__ = "operation_rollups"
+    __table_args__ = (
+        # One row per bucket; also serves range scans of a granularity
+        UniqueConstraint("granularity", "bucket_start", "operation"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String(8), nullable=False)  # minute or hour
+    bucket_start = Column(DateTime, nullable=False)
+    operation = Column(String(50), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    cache_hits = Column(Integer, nullable=False, default=0)
+    # JSON LatencyHistogram of the computation times of misses; merged by adding buckets
+    sketch = Column(Text, nullable=False)
+
+    def __repr__(self):
+        """String representation."""
+        return (
+            f"<OperationRollup(granularity={self.granularity}, bucket_start={self.bucket_start}, "
+            f"operation={self.operation}, count={self.count})>"
+        )
+
+
+class Job(Base):
+    """Database model for a calculation run in the background."""
+    __tablename__ = "jobs"
+
+    id = Column(String(32), primary_key=True)
+    request_key = Column(String(32), nullable=False, index=True)  # identical requests share one
+    operation = Column(String(50), nullable=False)
+    input_value = Column(Integer, nullable=False)
+    exponent = Column(Integer, nullable=True)
+    params = Column(Text, nullable=True)  # JSON object of extra operation parameters
+    status = Column(String(16), nullable=False, default="pending", index=True)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    cached = Column(Boolean, nullable=True)
+    computation_time_ms = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # refreshed while running
+    finished_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True, index=True)  # when the result is deleted
+    ip_address = Column(String(45), nullable=True)
+
+    def __repr__(self):
+        """String representation."""
+        return (
+            f"<Job(id={self.id}, operation={self.operation}, "
+            f"input_value={self.input_value}, status={self.status})>"
+        )
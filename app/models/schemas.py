@@ -1,23 +1,44 @@
 """Pydantic models for request/response validation."""
 from datetime import datetime
 from enum import Enum
-from typing import Optional, Any
+from typing import Any, List, Optional
 
 from pydantic import BaseModel, Field, validator
 
+from app.core.config import settings
+
 
 class OperationType(str, Enum):
     """Enumeration of supported mathematical operations."""
     POWER = "power"
     FIBONACCI = "fibonacci"
     FACTORIAL = "factorial"
+    IS_PRIME = "is_prime"
+    NEXT_PRIME = "next_prime"
+    NTH_PRIME = "nth_prime"
+    PRIME_COUNT = "prime_count"
+    BINOMIAL = "binomial"
+    PERMUTATION = "permutation"
+    LINEAR_RECURRENCE = "linear_recurrence"
+
+
+class RecurrencePreset(str, Enum):
+    """Named linear recurrences."""
+    FIBONACCI = "fibonacci"
+    LUCAS = "lucas"
+    PELL = "pell"
+    TRIBONACCI = "tribonacci"
 
 
 class MathOperationRequest(BaseModel):
     """Base request model for mathematical operations."""
     operation: OperationType
     value: int = Field(..., description="Input value for the operation")
-    exponent: Optional[int] = Field(None, description="Exponent for power operation")
+    exponent: Optional[int] = Field(None, description="Exponent for power operation, k for binomial and permutation")
+    modulus: Optional[int] = Field(None, ge=1, description="Reduce the result modulo this (binomial, permutation, fibonacci, linear_recurrence)")
+    coefficients: Optional[List[int]] = Field(None, description="c1..ck of a(n) = c1*a(n-1) + ... + ck*a(n-k)")
+    initial_terms: Optional[List[int]] = Field(None, description="a(0)..a(k-1) of the recurrence")
+    preset: Optional[RecurrencePreset] = Field(None, description="Named recurrence instead of coefficients and initial terms")
 
     @validator('value')
     def validate_value(cls, v, values):
@@ -28,14 +49,50 @@ class MathOperationRequest(BaseModel):
                 raise ValueError("Factorial requires non-negative integer")
             if operation == OperationType.FIBONACCI and v < 0:
                 raise ValueError("Fibonacci requires non-negative integer")
+            if operation == OperationType.NTH_PRIME and v < 1:
+                raise ValueError("nth_prime requires a positive integer")
+            if operation in (OperationType.BINOMIAL, OperationType.PERMUTATION,
+                             OperationType.LINEAR_RECURRENCE) and v < 0:
+                raise ValueError(f"{operation.value} requires non-negative integer")
         return v
 
-    @validator('exponent')
+    @validator('exponent', always=True)
     def validate_exponent(cls, v, values):
-        """Validate exponent is provided for power operation."""
+        """Validate exponent is provided for power, binomial and permutation."""
         if 'operation' in values and values['operation'] == OperationType.POWER:
             if v is None:
                 raise ValueError("Exponent is required for power operation")
+        if 'operation' in values and values['operation'] in (OperationType.BINOMIAL, OperationType.PERMUTATION):
+            if v is None:
+                raise ValueError(f"Exponent (k) is required for {values['operation'].value}")
+        return v
+
+    @validator('modulus')
+    def validate_modulus(cls, v, values):
+        """Validate modulus is only given to operations that support it."""
+        if v is not None and values.get('operation') not in (
+            OperationType.BINOMIAL, OperationType.PERMUTATION,
+            OperationType.FIBONACCI, OperationType.LINEAR_RECURRENCE
+        ):
+            raise ValueError("Modulus is only supported for binomial, permutation, fibonacci and linear_recurrence")
+        return v
+
+    @validator('preset', always=True)
+    def validate_recurrence(cls, v, values):
+        """Validate a recurrence is given by preset or by matching coefficients and initial terms."""
+        coefficients = values.get('coefficients')
+        initial_terms = values.get('initial_terms')
+        if values.get('operation') != OperationType.LINEAR_RECURRENCE:
+            if v is not None or coefficients is not None or initial_terms is not None:
+                raise ValueError("Recurrence fields are only supported for linear_recurrence")
+            return v
+        if v is not None:
+            if coefficients is not None or initial_terms is not None:
+                raise ValueError("Give either a preset or coefficients and initial terms, not both")
+        elif not coefficients or initial_terms is None:
+            raise ValueError("linear_recurrence requires a preset or coefficients and initial terms")
+        elif len(coefficients) != len(initial_terms):
+            raise ValueError("Coefficients and initial terms must have the same length")
         return v
 
     class Config:
@@ -49,11 +106,58 @@ class MathOperationRequest(BaseModel):
         }
 
 
+class SequenceRequest(BaseModel):
+    """Request model for streaming a range of operation results."""
+    operation: OperationType
+    start: int = Field(0, ge=0, description="First index (exponent for power), inclusive")
+    stop: int = Field(..., ge=0, description="Last index, inclusive")
+    step: int = Field(1, ge=1, description="Distance between consecutive indices")
+    base: Optional[int] = Field(None, description="Base for power sequences")
+    modulus: Optional[int] = Field(None, ge=1, description="Reduce every value modulo this")
+
+    @validator('stop')
+    def validate_stop(cls, v, values):
+        """Validate the range is not empty."""
+        if 'start' in values and v < values['start']:
+            raise ValueError("Stop must be greater than or equal to start")
+        return v
+
+    @validator('step', always=True)
+    def validate_step(cls, v, values):
+        """Validate the range does not exceed SEQUENCE_MAX_TERMS."""
+        if 'start' in values and 'stop' in values:
+            terms = (values['stop'] - values['start']) // v + 1
+            if terms > settings.SEQUENCE_MAX_TERMS:
+                raise ValueError(
+                    f"Sequence of {terms} terms exceeds the maximum of {settings.SEQUENCE_MAX_TERMS}"
+                )
+        return v
+
+    @validator('base', always=True)
+    def validate_base(cls, v, values):
+        """Validate base is provided for power sequences."""
+        if values.get('operation') == OperationType.POWER and v is None:
+            raise ValueError("Base is required for power sequences")
+        return v
+
+    class Config:
+        """Pydantic config."""
+        json_schema_extra = {
+            "example": {
+                "operation": "fibonacci",
+                "start": 0,
+                "stop": 100,
+                "step": 1
+            }
+        }
+
+
 class MathOperationResponse(BaseModel):
     """Response model for mathematical operations."""
     operation: OperationType
     input_value: int
     exponent: Optional[int] = None
+    modulus: Optional[int] = None
     result: Any
     cached: bool = Field(default=False, description="Whether result was from cache")
     computation_time_ms: float = Field(..., description="Computation time in milliseconds")
@@ -74,6 +178,130 @@ class MathOperationResponse(BaseModel):
         }
 
 
+class MathOperationResult(BaseModel):
+    """
+    Response model for cacheable GET calculations.
+
+    Only fields that depend on the request, so equal requests get
+    byte-identical responses; cache status and timing go in headers.
+    """
+    operation: OperationType
+    input_value: int
+    exponent: Optional[int] = None
+    modulus: Optional[int] = None
+    result: Any
+
+    class Config:
+        """Pydantic config."""
+        json_schema_extra = {
+            "example": {
+                "operation": "power",
+                "input_value": 2,
+                "exponent": 10,
+                "result": 1024
+            }
+        }
+
+
+class PowerSummaryRequest(BaseModel):
+    """Request model for describing a power without materializing it."""
+    base: int = Field(..., description="Base number")
+    exponent: int = Field(..., ge=0, description="Non-negative exponent")
+    leading_digits: int = Field(20, ge=1, le=1000, description="Number of leading digits")
+    modulus: Optional[int] = Field(None, ge=1, description="Also return the value modulo this")
+
+    class Config:
+        """Pydantic config."""
+        json_schema_extra = {
+            "example": {
+                "base": 3,
+                "exponent": 1000000000,
+                "leading_digits": 20,
+                "modulus": 1000000007
+            }
+        }
+
+
+class PowerSummaryResponse(BaseModel):
+    """Response model for power summaries."""
+    base: int
+    exponent: int
+    sign: int
+    digit_count: int
+    bit_length: int
+    leading_digits: int
+    modulus: Optional[int] = None
+    mod_result: Optional[int] = None
+    cached: bool = Field(default=False, description="Whether result was from cache")
+    computation_time_ms: float = Field(..., description="Computation time in milliseconds")
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+
+class BatchOperationRequest(BaseModel):
+    """Request model for evaluating many operations in one call."""
+    operations: List[MathOperationRequest] = Field(..., min_length=1)
+
+    class Config:
+        """Pydantic config."""
+        json_schema_extra = {
+            "example": {
+                "operations": [
+                    {"operation": "power", "value": 2, "exponent": 10},
+                    {"operation": "power", "value": 3, "exponent": -2},
+                    {"operation": "fibonacci", "value": 10}
+                ]
+            }
+        }
+
+
+class BatchOperationResponse(BaseModel):
+    """Response model for batch operations."""
+    results: List[MathOperationResponse]
+    computation_time_ms: float = Field(..., description="Total computation time in milliseconds")
+
+
+class JobStatus(str, Enum):
+    """Lifecycle of a background job."""
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class JobResponse(BaseModel):
+    """Response model describing a background job."""
+    id: str
+    status: JobStatus
+    operation: OperationType
+    input_value: int
+    exponent: Optional[int] = None
+    modulus: Optional[int] = None
+    position: Optional[int] = Field(None, description="Pending jobs queued ahead of this one")
+    elapsed_ms: Optional[float] = Field(None, description="Time spent running so far, or in total")
+    cached: Optional[bool] = Field(None, description="Whether the result came from the cache")
+    computation_time_ms: Optional[float] = None
+    error: Optional[str] = None
+    result_url: Optional[str] = Field(None, description="Where to stream the result from once done")
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = Field(None, description="When the job and its result are deleted")
+
+    class Config:
+        """Pydantic config."""
+        json_schema_extra = {
+            "example": {
+                "id": "3f2b6c1e9d7a4f0b8c5e2a1d6b9f0c3e",
+                "status": "running",
+                "operation": "factorial",
+                "input_value": 5000000,
+                "elapsed_ms": 41250.0,
+                "created_at": "2024-01-15T10:30:00",
+                "started_at": "2024-01-15T10:30:00"
+            }
+        }
+
+
 class ErrorResponse(BaseModel):
     """Error response model."""
     error: str
@@ -0,0 +1,160 @@
+"""Big-integer arithmetic backends."""
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+try:
+    import gmpy2
+except ImportError:  # pragma: no cover - gmpy2 is optional
+    gmpy2 = None
+
+# Below this many factors a plain loop beats further splitting
+_LEAF_SIZE = 32
+
+
+def product_range(lo: int, hi: int) -> int:
+    """
+    Product of the integers in [lo, hi) by binary splitting.
+
+    Multiplying balanced halves keeps operands of similar size, which is what
+    makes Karatsuba (or GMP) multiplication pay off.
+    """
+    if hi - lo <= _LEAF_SIZE:
+        result = 1
+        for i in range(lo, hi):
+            result *= i
+        return result
+    mid = (lo + hi) // 2
+    return product_range(lo, mid) * product_range(mid, hi)
+
+
+def product(values: Sequence[int]) -> int:
+    """Product of a sequence by balanced binary splitting."""
+    if len(values) <= _LEAF_SIZE:
+        result = 1
+        for value in values:
+            result *= value
+        return result
+    mid = len(values) // 2
+    return product(values[:mid]) * product(values[mid:])
+
+
+def fibonacci_pair(n: int, modulus: Optional[int] = None) -> Tuple[int, int]:
+    """Fast-doubling implementation returning (F(n), F(n + 1))."""
+    a, b = 0, 1
+    for bit in bin(n)[2:]:
+        c = a * (2 * b - a)
+        d = a * a + b * b
+        if modulus is not None:
+            c %= modulus
+            d %= modulus
+        if bit == "1":
+            a, b = d, c + d
+        else:
+            a, b = c, d
+    if modulus is not None:
+        return a % modulus, b % modulus
+    return a, b
+
+
+class PythonBackend:
+    """Pure-Python arithmetic on built-in ints."""
+
+    name = "python"
+
+    def mul(self, a: int, b: int) -> int:
+        """Multiply two integers."""
+        return a * b
+
+    def pow(self, base: int, exponent: int) -> int:
+        """Raise base to a non-negative exponent."""
+        return pow(base, exponent)
+
+    def product_range(self, lo: int, hi: int) -> int:
+        """Product of the integers in [lo, hi)."""
+        return product_range(lo, hi)
+
+    def fac(self, n: int) -> int:
+        """Factorial of a non-negative integer."""
+        return self.product_range(2, n + 1)
+
+    def fib(self, n: int) -> int:
+        """n-th Fibonacci number."""
+        return fibonacci_pair(n)[0]
+
+    def to_decimal(self, n: int) -> str:
+        """Decimal digits of an integer (quadratic in its length for built-in ints)."""
+        return str(n)
+
+
+class GMPBackend(PythonBackend):
+    """GMP arithmetic through gmpy2; results are converted back to int."""
+
+    name = "gmpy2"
+
+    def mul(self, a: int, b: int) -> int:
+        """Multiply two integers."""
+        return int(gmpy2.mpz(a) * b)
+
+    def pow(self, base: int, exponent: int) -> int:
+        """Raise base to a non-negative exponent."""
+        return int(gmpy2.mpz(base) ** exponent)
+
+    def _product_tree(self, lo: int, hi: int):
+        if hi - lo <= _LEAF_SIZE:
+            result = gmpy2.mpz(1)
+            for i in range(lo, hi):
+                result *= i
+            return result
+        mid = (lo + hi) // 2
+        return self._product_tree(lo, mid) * self._product_tree(mid, hi)
+
+    def product_range(self, lo: int, hi: int) -> int:
+        """Product of the integers in [lo, hi)."""
+        return int(self._product_tree(lo, hi))
+
+    def fac(self, n: int) -> int:
+        """Factorial of a non-negative integer."""
+        return int(gmpy2.fac(n))
+
+    def fib(self, n: int) -> int:
+        """n-th Fibonacci number."""
+        return int(gmpy2.fib(n))
+
+    def to_decimal(self, n: int) -> str:
+        """Decimal digits of an integer, subquadratic in its length."""
+        return gmpy2.mpz(n).digits()
+
+
+BACKENDS = {
+    PythonBackend.name: PythonBackend,
+    GMPBackend.name: GMPBackend,
+}
+
+
+def available_backends() -> list:
+    """Names of the backends usable in this environment."""
+    return [name for name in BACKENDS if name != GMPBackend.name or gmpy2 is not None]
+
+
+@lru_cache(maxsize=None)
+def get_backend(name: Optional[str] = None) -> PythonBackend:
+    """
+    Return an arithmetic backend.
+
+    Args:
+        name: "python", "gmpy2" or "auto"; defaults to ARITHMETIC_BACKEND.
+            "auto" picks gmpy2 when it is installed.
+
+    Returns:
+        Backend instance
+    """
+    name = (name or settings.ARITHMETIC_BACKEND).lower()
+    if name == "auto":
+        name = GMPBackend.name if gmpy2 is not None else PythonBackend.name
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown arithmetic backend: {name}")
+    if name == GMPBackend.name and gmpy2 is None:
+        raise ValueError("The gmpy2 backend requires the gmpy2 package")
+    return BACKENDS[name]()
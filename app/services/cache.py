@@ -1,35 +1,57 @@
 """Simple in-memory caching service."""
 from datetime import datetime, timedelta
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List, Tuple
 import asyncio
-from collections import OrderedDict
+import heapq
+import time
 
 from app.core.config import settings
+from app.services.cache_policy import create_policy
+from app.services.stats import CacheMetrics
 
 
 class CacheService:
     """Dictionary-based caching service with TTL support."""
 
-    def __init__(self, max_size: int = None, ttl_seconds: int = None):
+    def __init__(self, max_size: int = None, ttl_seconds: int = None, policy: str = None):
         """
         Initialize cache service.
         
         Args:
             max_size: Maximum number of items in cache
             ttl_seconds: Time-to-live for cache entries in seconds
+            policy: Eviction policy, "lru" or "tinylfu"; defaults to CACHE_POLICY
         """
-        self._cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._cache: Dict[str, Dict[str, Any]] = {}
         self._max_size = max_size or settings.CACHE_MAX_SIZE
         self._ttl_seconds = ttl_seconds or settings.CACHE_TTL_SECONDS
+        self._policy = create_policy(policy or settings.CACHE_POLICY, self._max_size)
         self._lock = asyncio.Lock()
+        self._metrics = CacheMetrics()
+        # (expires_at, key) for every set; superseded items are skipped when popped
+        self._expiry_heap: List[Tuple[datetime, str]] = []
+        self._expiry_task: Optional[asyncio.Task] = None
 
-    def _generate_key(self, operation: str, value: int, exponent: Optional[int] = None) -> str:
+    def _generate_key(
+        self,
+        operation: str,
+        value: int,
+        exponent: Optional[int] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> str:
         """Generate cache key from operation parameters."""
-        if exponent is not None:
-            return f"{operation}:{value}:{exponent}"
-        return f"{operation}:{value}"
+        key = f"{operation}:{value}:{exponent}" if exponent is not None else f"{operation}:{value}"
+        if params:
+            key += ":" + ",".join(f"{name}={params[name]}" for name in sorted(params))
+        return key
 
-    async def get(self, operation: str, value: int, exponent: Optional[int] = None) -> Optional[Any]:
+    async def get(
+        self,
+        operation: str,
+        value: int,
+        exponent: Optional[int] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> Optional[Any]:
         """
         Get value from cache.
         
@@ -37,32 +59,49 @@ class CacheService:
             operation: Operation type
             value: Input value
             exponent: Optional exponent for power operation
+            params: Optional extra operation parameters (e.g. modulus)
             
         Returns:
             Cached result if found and not expired, None otherwise
         """
-        key = self._generate_key(operation, value, exponent)
-        
+        key = self._generate_key(operation, value, exponent, params)
+        metrics = self._metrics
+        sampled = metrics.sample()
+        if sampled:
+            start = time.perf_counter()
+            metrics.hot_keys.add(key)
+        result = None
+
         async with self._lock:
+            self._policy.record(key)
             if key in self._cache:
                 entry = self._cache[key]
                 # Check if entry is expired
                 if datetime.utcnow() < entry['expires_at']:
-                    # Move to end (LRU)
-                    self._cache.move_to_end(key)
-                    return entry['result']
+                    self._policy.touch(key)
+                    result = entry['result']
                 else:
                     # Remove expired entry
                     del self._cache[key]
-        
-        return None
+                    self._policy.remove(key)
+                    metrics.expirations.add()
+
+        if result is None:
+            metrics.miss(operation)
+        else:
+            metrics.hit(operation)
+        if sampled:
+            metrics.get_latency.record(time.perf_counter() - start)
+        return result
 
     async def set(
         self,
         operation: str,
         value: int,
         result: Any,
-        exponent: Optional[int] = None
+        exponent: Optional[int] = None,
+        params: Optional[Dict[str, Any]] = None,
+        ttl_seconds: Optional[float] = None
     ) -> None:
         """
         Set value in cache.
@@ -72,38 +111,126 @@ class CacheService:
             value: Input value
             result: Calculation result
             exponent: Optional exponent for power operation
+            params: Optional extra operation parameters (e.g. modulus)
+            ttl_seconds: Time-to-live for this entry; defaults to the cache's TTL
         """
-        key = self._generate_key(operation, value, exponent)
-        
+        key = self._generate_key(operation, value, exponent, params)
+        sampled = self._metrics.sample()
+        if sampled:
+            start = time.perf_counter()
+
         async with self._lock:
-            # Remove oldest entry if cache is full
-            if len(self._cache) >= self._max_size and key not in self._cache:
-                self._cache.popitem(last=False)
-            
+            if key in self._cache:
+                self._policy.touch(key)
+            else:
+                # Let the policy make room
+                for evicted in self._policy.insert(key):
+                    del self._cache[evicted]
+                    self._metrics.evictions.add()
+
             # Add or update entry
+            now = datetime.utcnow()
+            expires_at = now + timedelta(
+                seconds=self._ttl_seconds if ttl_seconds is None else ttl_seconds
+            )
             self._cache[key] = {
                 'result': result,
-                'expires_at': datetime.utcnow() + timedelta(seconds=self._ttl_seconds),
-                'created_at': datetime.utcnow()
+                'expires_at': expires_at,
+                'created_at': now
             }
-            # Move to end (most recently used)
-            self._cache.move_to_end(key)
+            heapq.heappush(self._expiry_heap, (expires_at, key))
+            if len(self._expiry_heap) > 2 * len(self._cache) + 64:
+                self._compact_expiry_heap()
+
+        if sampled:
+            self._metrics.set_latency.record(time.perf_counter() - start)
+
+    def _compact_expiry_heap(self) -> None:
+        """Drop heap items for keys that were evicted, expired or set again."""
+        self._expiry_heap = [(entry['expires_at'], key) for key, entry in self._cache.items()]
+        heapq.heapify(self._expiry_heap)
+
+    async def expire(self, max_entries: Optional[int] = None) -> int:
+        """
+        Remove entries whose TTL has passed, earliest deadline first.
+
+        Args:
+            max_entries: Upper bound on entries examined; defaults to CACHE_EXPIRY_BATCH
+
+        Returns:
+            Number of heap items examined (expired or superseded)
+        """
+        budget = max_entries or settings.CACHE_EXPIRY_BATCH
+        examined = 0
+        now = datetime.utcnow()
+        async with self._lock:
+            heap = self._expiry_heap
+            while heap and examined < budget and heap[0][0] <= now:
+                expires_at, key = heapq.heappop(heap)
+                examined += 1
+                entry = self._cache.get(key)
+                if entry is not None and entry['expires_at'] == expires_at:
+                    del self._cache[key]
+                    self._policy.remove(key)
+                    self._metrics.expirations.add()
+        return examined
+
+    async def _run_expiry(self, interval: float) -> None:
+        budget = settings.CACHE_EXPIRY_BATCH
+        while True:
+            # A full batch means more may be due: yield, then carry on
+            if await self.expire(budget) >= budget:
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(interval)
+
+    def start_expiry(self, interval: Optional[float] = None) -> None:
+        """Start freeing expired entries in the background."""
+        if self._expiry_task is None or self._expiry_task.done():
+            self._expiry_task = asyncio.create_task(
+                self._run_expiry(interval or settings.CACHE_EXPIRY_INTERVAL_SECONDS)
+            )
+
+    async def stop_expiry(self) -> None:
+        """Stop the background expiration task."""
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            try:
+                await self._expiry_task
+            except asyncio.CancelledError:
+                pass
+            self._expiry_task = None
 
     async def clear(self) -> None:
         """Clear all cache entries."""
         async with self._lock:
             self._cache.clear()
+            self._policy.clear()
+            self._expiry_heap.clear()
 
     async def get_stats(self) -> Dict[str, Any]:
-        """Get cache statistics."""
+        """Get cache statistics: occupancy, hit/miss/expiry/eviction counts and latencies."""
         async with self._lock:
             return {
                 'size': len(self._cache),
                 'max_size': self._max_size,
                 'ttl_seconds': self._ttl_seconds,
-                'entries': len(self._cache)
+                'policy': self._policy.name,
+                **self._metrics.snapshot()
             }
 
 
+def create_cache_service() -> CacheService:
+    """Build the cache backend selected by CACHE_BACKEND ("memory" or "shared")."""
+    backend = settings.CACHE_BACKEND.lower()
+    if backend == "shared":
+        # Imported here because the shared backend subclasses CacheService
+        from app.services.shared_cache import SharedMemoryCache
+        return SharedMemoryCache()
+    if backend != "memory":
+        raise ValueError(f"Unknown cache backend: {settings.CACHE_BACKEND}")
+    return CacheService()
+
+
 # Global cache instance
-cache_service = CacheService()
\ No newline at end of file
+cache_service = create_cache_service()
@@ -0,0 +1,136 @@
+"""Eviction and admission policies for the result cache."""
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Type
+
+from app.services.stats import CountMinSketch
+
+
+class LRUPolicy:
+    """Least-recently-used eviction; every new key is admitted."""
+
+    name = "lru"
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._order: OrderedDict = OrderedDict()
+
+    def record(self, key: Hashable) -> None:
+        """Note a lookup of ``key``, whether or not it is cached."""
+
+    def touch(self, key: Hashable) -> None:
+        """Note a hit on a cached key."""
+        self._order.move_to_end(key)
+
+    def insert(self, key: Hashable) -> List[Hashable]:
+        """
+        Add a new key.
+
+        Returns:
+            Keys that must leave the cache to make room
+        """
+        evicted = []
+        if len(self._order) >= self.max_size:
+            evicted.append(self._order.popitem(last=False)[0])
+        self._order[key] = None
+        return evicted
+
+    def remove(self, key: Hashable) -> None:
+        """Forget a key removed from the cache for another reason (e.g. expiry)."""
+        self._order.pop(key, None)
+
+    def clear(self) -> None:
+        """Forget all keys."""
+        self._order.clear()
+
+
+class TinyLFUPolicy:
+    """
+    W-TinyLFU: a window LRU in front of a segmented LRU, with admission by frequency.
+
+    New keys enter a small window LRU (1% of capacity), which absorbs bursts.
+    Keys leaving the window compete with the main cache's probation victim,
+    and whichever a count-min sketch has seen more often stays. Keys hit while
+    on probation are promoted to the protected segment (80% of main), so a
+    scan of one-off keys can only ever displace other one-off keys.
+    """
+
+    name = "tinylfu"
+
+    WINDOW_RATIO = 0.01
+    PROTECTED_RATIO = 0.8
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._window_size = max(1, int(max_size * self.WINDOW_RATIO))
+        self._main_size = max_size - self._window_size
+        self._protected_size = max(1, int(self._main_size * self.PROTECTED_RATIO))
+        self._window: OrderedDict = OrderedDict()
+        self._probation: OrderedDict = OrderedDict()
+        self._protected: OrderedDict = OrderedDict()
+        # Halve counts every 10 accesses per entry so popularity can decay
+        self._sketch = CountMinSketch(width=max(max_size, 16) * 8, reset_after=10 * max_size)
+
+    def record(self, key: Hashable) -> None:
+        """Note a lookup of ``key``, whether or not it is cached."""
+        self._sketch.add(key)
+
+    def touch(self, key: Hashable) -> None:
+        """Note a hit on a cached key."""
+        if key in self._window:
+            self._window.move_to_end(key)
+        elif key in self._protected:
+            self._protected.move_to_end(key)
+        elif key in self._probation:
+            del self._probation[key]
+            self._protected[key] = None
+            if len(self._protected) > self._protected_size:
+                demoted = self._protected.popitem(last=False)[0]
+                self._probation[demoted] = None
+
+    def insert(self, key: Hashable) -> List[Hashable]:
+        """Add a new key; returns the keys that must leave the cache."""
+        self._window[key] = None
+        if len(self._window) <= self._window_size:
+            return []
+
+        candidate = self._window.popitem(last=False)[0]
+        if len(self._probation) + len(self._protected) < self._main_size:
+            self._probation[candidate] = None
+            return []
+
+        probation = self._probation or self._protected
+        if not probation:
+            return [candidate]
+        victim = next(iter(probation))
+        if self._sketch.estimate(candidate) > self._sketch.estimate(victim):
+            del probation[victim]
+            self._probation[candidate] = None
+            return [victim]
+        return [candidate]
+
+    def remove(self, key: Hashable) -> None:
+        """Forget a key removed from the cache for another reason (e.g. expiry)."""
+        for segment in (self._window, self._probation, self._protected):
+            if segment.pop(key, 0) is None:
+                return
+
+    def clear(self) -> None:
+        """Forget all keys and their frequencies."""
+        self._window.clear()
+        self._probation.clear()
+        self._protected.clear()
+        self._sketch.clear()
+
+
+POLICIES: Dict[str, Type[LRUPolicy]] = {
+    LRUPolicy.name: LRUPolicy,
+    TinyLFUPolicy.name: TinyLFUPolicy,
+}
+
+
+def create_policy(name: str, max_size: int):
+    """Instantiate the cache policy called ``name``."""
+    try:
+        return POLICIES[name.lower()](max_size)
+    except KeyError:
+        raise ValueError(f"Unknown cache policy: {name}") from None
@@ -1,36 +1,89 @@
 """Calculator service with mathematical operations."""
 import asyncio
-from typing import Tuple
+import sys
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
 import time
 
+from app.services import parallel as parallel_products
+from app.services.backends import fibonacci_pair, get_backend
+from app.services import vectorized
+from app.services.lazy import LazyPower
+from app.services.recurrence import linear_recurrence
+
+# Results routinely exceed CPython's default 4300-digit str() limit
+if hasattr(sys, "set_int_max_str_digits"):
+    sys.set_int_max_str_digits(0)
+
+
+def _reduce(x: int, modulus: Optional[int]) -> int:
+    return x % modulus if modulus is not None else x
+
 
 class CalculatorService:
     """Service for performing mathematical calculations."""
 
     @staticmethod
-    async def power(base: int, exponent: int) -> Tuple[int, float]:
+    async def power(base: int, exponent: int, lazy: bool = False) -> Tuple[Any, float]:
         """
         Calculate base raised to the power of exponent.
         
         Args:
             base: Base number
             exponent: Exponent
+            lazy: Return a LazyPower instead of materializing the digits
+                (non-negative exponents only)
             
         Returns:
             Tuple of (result, computation_time_ms)
         """
         start_time = time.time()
         
-        # Use Python's built-in pow for efficiency
-        result = pow(base, exponent)
+        if lazy:
+            result = LazyPower(base, exponent)
+        else:
+            result = CalculatorService._power_value(base, exponent)
         
         computation_time = (time.time() - start_time) * 1000
         return result, computation_time
 
+    @staticmethod
+    def _power_value(base: int, exponent: int) -> Any:
+        """Materialized power; ints for non-negative exponents, floats otherwise."""
+        if exponent >= 0:
+            # LazyPower materializes powers of two with a bit shift
+            return LazyPower(base, exponent).value
+        # Use Python's built-in pow for efficiency
+        return pow(base, exponent)
+
+    @staticmethod
+    async def power_many(
+        bases: Sequence[int],
+        exponents: Sequence[int]
+    ) -> Tuple[List[Any], float]:
+        """
+        Calculate many powers at once.
+
+        Small operands are evaluated in a single vectorized pass when NumPy is
+        available; anything that could overflow machine types uses pow().
+
+        Args:
+            bases: Base numbers
+            exponents: Exponents, same length as bases
+
+        Returns:
+            Tuple of (results, computation_time_ms)
+        """
+        start_time = time.time()
+
+        results = vectorized.power_many(bases, exponents)
+
+        computation_time = (time.time() - start_time) * 1000
+        return results, computation_time
+
     @staticmethod
     async def fibonacci(n: int) -> Tuple[int, float]:
         """
-        Calculate the n-th Fibonacci number using dynamic programming.
+        Calculate the n-th Fibonacci number as a preset of the recurrence engine.
         
         Args:
             n: Position in Fibonacci sequence
@@ -45,8 +98,7 @@ class CalculatorService:
         elif n == 1:
             result = 1
         else:
-            # Dynamic programming approach for efficiency
-            result = CalculatorService._fibonacci_dp(n)
+            result = linear_recurrence(n, preset="fibonacci")
         
         computation_time = (time.time() - start_time) * 1000
         return result, computation_time
@@ -64,12 +116,15 @@ class CalculatorService:
         return curr
 
     @staticmethod
-    async def factorial(n: int) -> Tuple[int, float]:
+    async def factorial(n: int, parallel: Optional[bool] = None) -> Tuple[int, float]:
         """
         Calculate the factorial of n.
         
         Args:
             n: Non-negative integer
+            parallel: Split the product across the process pool. Defaults to
+                doing so when n reaches FACTORIAL_PARALLEL_THRESHOLD and more
+                than one worker is configured.
             
         Returns:
             Tuple of (result, computation_time_ms)
@@ -79,7 +134,13 @@ class CalculatorService:
         if n < 0:
             raise ValueError("Factorial is not defined for negative numbers")
         
-        result = CalculatorService._factorial_iterative(n)
+        if parallel is None:
+            parallel = parallel_products.should_parallelize(n)
+        
+        if parallel and n > 1:
+            result = await parallel_products.parallel_product_range(2, n + 1)
+        else:
+            result = get_backend().fac(n)
         
         computation_time = (time.time() - start_time) * 1000
         return result, computation_time
@@ -94,4 +155,96 @@ class CalculatorService:
         for i in range(2, n + 1):
             result *= i
         
-        return result
\ No newline at end of file
+        return result
+
+    @staticmethod
+    def _fibonacci_pair(n: int, modulus: Optional[int] = None) -> Tuple[int, int]:
+        """Fast-doubling implementation returning (F(n), F(n + 1))."""
+        return fibonacci_pair(n, modulus)
+
+    @staticmethod
+    def sequence(
+        operation: str,
+        start: int,
+        stop: int,
+        step: int = 1,
+        base: Optional[int] = None,
+        modulus: Optional[int] = None
+    ) -> Iterator[Tuple[int, int]]:
+        """
+        Iterate successive values of an operation over an index range.
+
+        Each value is derived from the previous one, so the whole range costs
+        about as much as its last element and only O(1) values are kept alive.
+
+        Args:
+            operation: "power", "fibonacci" or "factorial"
+            start: First index (exponent for power), inclusive
+            stop: Last index, inclusive
+            step: Distance between consecutive indices
+            base: Base for power sequences
+            modulus: Optional modulus applied to every value
+
+        Yields:
+            Tuples of (index, value)
+        """
+        if start < 0:
+            raise ValueError("Sequence start must be non-negative")
+        if step < 1:
+            raise ValueError("Sequence step must be positive")
+        if modulus is not None and modulus < 1:
+            raise ValueError("Modulus must be positive")
+
+        if operation == "power":
+            if base is None:
+                raise ValueError("Base is required for power sequences")
+            return CalculatorService._power_sequence(base, start, stop, step, modulus)
+        if operation == "fibonacci":
+            return CalculatorService._fibonacci_sequence(start, stop, step, modulus)
+        if operation == "factorial":
+            return CalculatorService._factorial_sequence(start, stop, step, modulus)
+        raise ValueError(f"Unsupported operation: {operation}")
+
+    @staticmethod
+    def _power_sequence(
+        base: int, start: int, stop: int, step: int, modulus: Optional[int]
+    ) -> Iterator[Tuple[int, int]]:
+        """base**index for each index, one multiplication apart."""
+        if modulus is not None:
+            value, factor = pow(base, start, modulus), pow(base, step, modulus)
+        else:
+            value, factor = pow(base, start), pow(base, step)
+        for index in range(start, stop + 1, step):
+            yield index, value
+            value = _reduce(value * factor, modulus)
+
+    @staticmethod
+    def _fibonacci_sequence(
+        start: int, stop: int, step: int, modulus: Optional[int]
+    ) -> Iterator[Tuple[int, int]]:
+        """F(index) for each index, advancing a (F(n), F(n + 1)) pair."""
+        a, b = CalculatorService._fibonacci_pair(start, modulus)
+        if step == 1:
+            for index in range(start, stop + 1):
+                yield index, a
+                a, b = b, _reduce(a + b, modulus)
+            return
+        # F(n+s) = F(n)F(s-1) + F(n+1)F(s), F(n+s+1) = F(n)F(s) + F(n+1)F(s+1)
+        fs, fs1 = CalculatorService._fibonacci_pair(step, modulus)
+        fs0 = _reduce(fs1 - fs, modulus)
+        for index in range(start, stop + 1, step):
+            yield index, a
+            a, b = _reduce(a * fs0 + b * fs, modulus), _reduce(a * fs + b * fs1, modulus)
+
+    @staticmethod
+    def _factorial_sequence(
+        start: int, stop: int, step: int, modulus: Optional[int]
+    ) -> Iterator[Tuple[int, int]]:
+        """index! for each index, multiplying in the factors between neighbours."""
+        value = _reduce(1, modulus)
+        for i in range(2, start + 1):
+            value = _reduce(value * i, modulus)
+        for index in range(start, stop + 1, step):
+            yield index, value
+            for i in range(index + 1, min(index + step, stop) + 1):
+                value = _reduce(value * i, modulus)
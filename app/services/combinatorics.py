@@ -0,0 +1,182 @@
+"""Binomial coefficients and permutations without materializing factorials."""
+import math
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from app.services.backends import get_backend, product
+from app.services.primes import is_prime, small_primes
+
+# Below this k a direct multiplicative formula beats factorizing
+SMALL_K = 256
+# Moduli are factored by trial division up to this bound
+FACTOR_TRIAL_LIMIT = 1 << 16
+
+
+def _check(n: int) -> None:
+    if n < 0:
+        raise ValueError("n must be non-negative")
+
+
+def binomial_exponents(n: int, k: int) -> Dict[int, int]:
+    """
+    Prime factorization of C(n, k) via Legendre/Kummer.
+
+    The exponent of p is the number of carries when adding k and n - k in
+    base p, i.e. sum over i of floor(n/p^i) - floor(k/p^i) - floor((n-k)/p^i).
+
+    Returns:
+        Mapping of prime -> positive exponent
+    """
+    k = min(k, n - k)
+    root = math.isqrt(n)
+    exponents = {}
+    for p in small_primes(n):
+        if p > n - k:
+            # Every prime in (n - k, n] divides the numerator exactly once
+            exponents[p] = 1
+            continue
+        if p > root:
+            e = n // p - k // p - (n - k) // p
+        else:
+            e, power = 0, p
+            while power <= n:
+                e += n // power - k // power - (n - k) // power
+                power *= p
+        if e:
+            exponents[p] = e
+    return exponents
+
+
+def _from_exponents(exponents: Dict[int, int], modulus: Optional[int] = None) -> int:
+    """Multiply out a factorization, grouping primes that share an exponent."""
+    if modulus is not None:
+        result = 1 % modulus
+        for p, e in exponents.items():
+            result = result * pow(p, e, modulus) % modulus
+        return result
+
+    groups: Dict[int, List[int]] = defaultdict(list)
+    for p, e in exponents.items():
+        groups[e].append(p)
+    backend = get_backend()
+    result = 1
+    for e, primes in groups.items():
+        result = backend.mul(result, backend.pow(product(primes), e))
+    return result
+
+
+def _binomial_small_mod_prime(n: int, k: int, p: int) -> int:
+    """C(n, k) mod p for 0 <= n < p by multiplicative formula and an inverse."""
+    if k < 0 or k > n:
+        return 0
+    k = min(k, n - k)
+    numerator = denominator = 1
+    for i in range(k):
+        numerator = numerator * (n - i) % p
+        denominator = denominator * (i + 1) % p
+    return numerator * pow(denominator, p - 2, p) % p
+
+
+def binomial_mod_prime(n: int, k: int, p: int) -> int:
+    """C(n, k) mod prime p by Lucas' theorem: product of C(n_i, k_i) over base-p digits."""
+    result = 1
+    while n or k:
+        n, n_digit = divmod(n, p)
+        k, k_digit = divmod(k, p)
+        if k_digit > n_digit:
+            return 0
+        result = result * _binomial_small_mod_prime(n_digit, k_digit, p) % p
+    return result % p
+
+
+@lru_cache(maxsize=256)
+def squarefree_prime_factors(modulus: int) -> Optional[Tuple[int, ...]]:
+    """
+    The distinct primes of a squarefree ``modulus``, when they are easy to find.
+
+    Trial division up to FACTOR_TRIAL_LIMIT must leave 1 or a prime.
+
+    Returns:
+        The primes, or None if the modulus has a square factor or is hard to factor
+    """
+    factors = []
+    rest = modulus
+    for p in small_primes(FACTOR_TRIAL_LIMIT):
+        if p * p > rest:
+            break
+        if rest % p == 0:
+            rest //= p
+            if rest % p == 0:
+                return None
+            factors.append(p)
+    if rest > 1:
+        if not is_prime(rest):
+            return None
+        factors.append(rest)
+    return tuple(factors)
+
+
+def _crt(residues: List[Tuple[int, int]]) -> int:
+    """The x modulo the product of the pairwise coprime moduli with x = r (mod m) for each (r, m)."""
+    result, combined = 0, 1
+    for residue, modulus in residues:
+        step = (residue - result) * pow(combined, -1, modulus) % modulus
+        result += combined * step
+        combined *= modulus
+    return result
+
+
+def binomial(n: int, k: int, modulus: Optional[int] = None, sieve_limit: int = 10 ** 7) -> int:
+    """
+    Binomial coefficient C(n, k), optionally modulo ``modulus``.
+
+    Small k uses the multiplicative formula. Otherwise prime moduli use
+    Lucas' theorem, and everything else multiplies out the Kummer/Legendre
+    factorization (for n up to ``sieve_limit``). Beyond that, squarefree
+    moduli combine Lucas' theorem per prime by the Chinese remainder
+    theorem; otherwise two balanced product trees are divided and the
+    quotient reduced. n! is never formed.
+    """
+    _check(n)
+    if k < 0 or k > n:
+        return 0
+    k = min(k, n - k)
+    if modulus == 1:
+        return 0
+
+    if modulus is not None and is_prime(modulus):
+        return binomial_mod_prime(n, k, modulus)
+    if k <= SMALL_K:
+        result = math.comb(n, k)
+        return result % modulus if modulus is not None else result
+    if n <= sieve_limit:
+        return _from_exponents(binomial_exponents(n, k), modulus)
+    if modulus is not None:
+        primes = squarefree_prime_factors(modulus)
+        if primes is not None:
+            return _crt([(binomial_mod_prime(n, k, p), p) for p in primes])
+    backend = get_backend()
+    result = backend.product_range(n - k + 1, n + 1) // backend.product_range(2, k + 1)
+    return result % modulus if modulus is not None else result
+
+
+def permutation(n: int, k: int, modulus: Optional[int] = None) -> int:
+    """
+    Number of k-permutations of n, n! / (n - k)!, optionally modulo ``modulus``.
+
+    Computed as the product of (n - k, n] with a balanced product tree, or a
+    running product mod ``modulus`` that stops at the first zero.
+    """
+    _check(n)
+    if k < 0 or k > n:
+        return 0
+    if modulus is None:
+        return get_backend().product_range(n - k + 1, n + 1)
+
+    result = 1 % modulus
+    for i in range(n - k + 1, n + 1):
+        result = result * i % modulus
+        if result == 0:
+            break
+    return result
@@ -0,0 +1,397 @@
+"""Buffered writes of operation history, and which cache hits are written at all."""
+import asyncio
+import bisect
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import desc, func, select
+
+from app.core.config import settings
+from app.db.base import AsyncReadSessionLocal, AsyncSessionLocal
+from app.models.database import HistoryHitCount, OperationHistory
+from app.services.stats import Sampler
+
+logger = logging.getLogger(__name__)
+
+FULL = "full"
+SAMPLE = "sample"
+AGGREGATE = "aggregate"
+
+# (operation, input value, exponent)
+HitKey = Tuple[str, int, Optional[int]]
+
+
+class HistoryBatch:
+    """
+    Collects history rows and inserts them in one transaction per batch.
+
+    A batch is written when it reaches ``max_size`` rows, ``interval``
+    seconds after its first row, or on close, so a busy producer pays for
+    one commit per batch rather than one per row.
+    """
+
+    def __init__(self, max_size: int = None, interval: float = None, session_factory=AsyncSessionLocal):
+        """
+        Args:
+            max_size: Rows per batch; defaults to WS_HISTORY_BATCH
+            interval: Longest a row waits to be written; defaults to WS_HISTORY_FLUSH_SECONDS
+            session_factory: Database session factory
+        """
+        self._max_size = max_size or settings.WS_HISTORY_BATCH
+        self._interval = interval or settings.WS_HISTORY_FLUSH_SECONDS
+        self._session_factory = session_factory
+        self._rows: List[OperationHistory] = []
+        self._timer: Optional[asyncio.Task] = None
+        # One write at a time, so batches commit in order
+        self._lock = asyncio.Lock()
+        # The event loop only keeps weak references to tasks
+        self._writes = set()
+
+    def add(self, row: OperationHistory) -> None:
+        """Queue a row to be written."""
+        self._rows.append(row)
+        if len(self._rows) >= self._max_size:
+            self._cancel_timer()
+            rows, self._rows = self._rows, []
+            task = asyncio.create_task(self._write(rows))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self._interval)
+        self._timer = None
+        await self.flush()
+
+    async def _write(self, rows: List[OperationHistory]) -> None:
+        async with self._lock:
+            async with self._session_factory() as db:
+                db.add_all(rows)
+                await db.commit()
+            recent_history.add(rows)
+
+    async def flush(self) -> int:
+        """Write all queued rows; returns how many."""
+        rows, self._rows = self._rows, []
+        if rows:
+            await self._write(rows)
+        else:
+            # Still wait for batches already being written
+            async with self._lock:
+                pass
+        return len(rows)
+
+    async def close(self) -> None:
+        """Write whatever is still queued."""
+        self._cancel_timer()
+        await self.flush()
+
+
+class HitCounters:
+    """
+    Cache hits counted per calculation and written periodically.
+
+    Each flush inserts one row per calculation hit since the previous
+    flush, so writers never update each other's rows and any number of
+    processes can flush; totals are summed when read.
+    """
+
+    def __init__(
+        self,
+        interval: float = None,
+        session_factory=AsyncSessionLocal,
+        read_session_factory=AsyncReadSessionLocal
+    ):
+        """
+        Args:
+            interval: Seconds between writes; defaults to HISTORY_HIT_FLUSH_SECONDS
+            session_factory: Database session factory for writes
+            read_session_factory: Database session factory for totals
+        """
+        self._interval = interval or settings.HISTORY_HIT_FLUSH_SECONDS
+        self._session_factory = session_factory
+        self._read_session_factory = read_session_factory
+        # key -> [hits, first hit, last hit]
+        self._pending: Dict[HitKey, list] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, row: OperationHistory) -> None:
+        """Count a hit on the calculation ``row`` records."""
+        now = datetime.utcnow()
+        key = (row.operation, row.input_value, row.exponent)
+        counts = self._pending.get(key)
+        if counts is None:
+            self._pending[key] = [1, now, now]
+        else:
+            counts[0] += 1
+            counts[2] = now
+
+    async def flush(self) -> int:
+        """Write the pending counts; returns how many calculations they cover."""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            async with self._session_factory() as db:
+                db.add_all([
+                    HistoryHitCount(
+                        operation=operation, input_value=value, exponent=exponent,
+                        hits=hits, first_hit_at=first, last_hit_at=last
+                    )
+                    for (operation, value, exponent), (hits, first, last) in pending.items()
+                ])
+                await db.commit()
+        except Exception:
+            # Keep the counts for the next flush
+            for key, (hits, first, last) in pending.items():
+                counts = self._pending.setdefault(key, [0, first, last])
+                counts[0] += hits
+                counts[1] = min(counts[1], first)
+            raise
+        return len(pending)
+
+    async def totals(self, operation: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        """Written hit counts summed per calculation, most hit first."""
+        query = select(
+            HistoryHitCount.operation,
+            HistoryHitCount.input_value,
+            HistoryHitCount.exponent,
+            func.sum(HistoryHitCount.hits).label("hits"),
+            func.max(HistoryHitCount.last_hit_at).label("last_hit_at"),
+        ).group_by(
+            HistoryHitCount.operation, HistoryHitCount.input_value, HistoryHitCount.exponent
+        )
+        if operation is not None:
+            query = query.where(HistoryHitCount.operation == operation)
+        query = query.order_by(desc("hits")).limit(limit)
+        async with self._read_session_factory() as db:
+            rows = (await db.execute(query)).all()
+        return [dict(row._mapping) for row in rows]
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Writing history hit counts failed; retrying next interval")
+
+    def start(self) -> None:
+        """Start writing counts on a schedule."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the schedule and write what is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Writing history hit counts failed at shutdown")
+
+
+def _parse_policy(spec: str, default_rate: float) -> Tuple[str, float]:
+    """Split "sample:0.01" style policies into (kind, sample rate)."""
+    kind, _, rate = spec.strip().lower().partition(":")
+    if kind not in (FULL, SAMPLE, AGGREGATE) or (rate and kind != SAMPLE):
+        raise ValueError(f"Unknown history hit policy: {spec}")
+    try:
+        return kind, float(rate) if rate else default_rate
+    except ValueError:
+        raise ValueError(f"Invalid history sample rate: {spec}")
+
+
+class HistoryPolicy:
+    """
+    Decides which calculations get a history row.
+
+    Cache misses always do. Cache hits, the cheapest and most frequent
+    calculations, follow their operation's policy: ``full`` writes every
+    one, ``sample`` a deterministic 1-in-N of them and ``aggregate`` none,
+    counting them in HitCounters instead. Operation rollups still count
+    every calculation, so call volumes and hit ratios stay exact whatever
+    the policy.
+    """
+
+    def __init__(
+        self,
+        default: str = None,
+        overrides: Dict[str, str] = None,
+        sample_rate: float = None,
+        counters: HitCounters = None
+    ):
+        """
+        Args:
+            default: Policy for operations without an override; defaults to HISTORY_HIT_POLICY
+            overrides: Policy per operation; defaults to HISTORY_HIT_POLICIES
+            sample_rate: Rate for a bare "sample"; defaults to HISTORY_HIT_SAMPLE_RATE
+            counters: Where aggregated hits are counted
+
+        Raises:
+            ValueError: If a policy is unknown
+        """
+        sample_rate = settings.HISTORY_HIT_SAMPLE_RATE if sample_rate is None else sample_rate
+        self._default = _parse_policy(default or settings.HISTORY_HIT_POLICY, sample_rate)
+        overrides = settings.HISTORY_HIT_POLICIES if overrides is None else overrides
+        self._overrides = {
+            operation: _parse_policy(spec, sample_rate) for operation, spec in overrides.items()
+        }
+        self.counters = counters or HitCounters()
+        self._samplers: Dict[str, Sampler] = {}
+
+    def policy(self, operation: str) -> Tuple[str, float]:
+        """The (kind, sample rate) applied to cache hits of ``operation``."""
+        return self._overrides.get(operation, self._default)
+
+    def keep(self, row: OperationHistory, cached: bool) -> bool:
+        """Whether to write ``row``; hits that are not written may be counted instead."""
+        if not cached:
+            return True
+        kind, rate = self.policy(row.operation)
+        if kind == FULL:
+            return True
+        if kind == AGGREGATE:
+            self.counters.add(row)
+            return False
+        sampler = self._samplers.get(row.operation)
+        if sampler is None:
+            sampler = self._samplers[row.operation] = Sampler(rate)
+        return sampler()
+
+
+def _order(row: OperationHistory) -> Tuple[datetime, int]:
+    """Position of a row in history, as /history sorts it (newest last here)."""
+    return row.created_at, row.id
+
+
+class RecentHistory:
+    """
+    The newest history rows, kept in memory so that /history's first pages skip the database.
+
+    Loaded at startup, then fed each row as this process commits it, the
+    buffer holds the newest rows in the database in /history's order (by
+    creation time, then id), up to HISTORY_RECENT_SIZE rows and
+    HISTORY_RECENT_MAX_BYTES of result text. A page is served from it only
+    if it holds all of that page; deeper pages, and filters matching too
+    few of the buffered rows, go to the database.
+
+    That holds while this process is the only writer. Rows written by other
+    processes sharing the database are not seen, so the buffer is off when
+    WORKERS > 1, and should be disabled (size 0) if anything else writes
+    history. Rows removed by archiving are dropped from it too.
+    """
+
+    def __init__(
+        self,
+        size: int = None,
+        max_bytes: int = None,
+        session_factory=AsyncReadSessionLocal
+    ):
+        """
+        Args:
+            size: Rows kept; defaults to HISTORY_RECENT_SIZE (0 disables the buffer)
+            max_bytes: Result text kept; defaults to HISTORY_RECENT_MAX_BYTES
+            session_factory: Database session factory for loading
+        """
+        self.size = settings.HISTORY_RECENT_SIZE if size is None else size
+        self.max_bytes = max_bytes or settings.HISTORY_RECENT_MAX_BYTES
+        self.enabled = self.size > 0 and settings.WORKERS <= 1
+        self._session_factory = session_factory
+        self._rows: Deque[OperationHistory] = deque()
+        self._bytes = 0
+        # Nothing is served or buffered until the newest rows are loaded
+        self._loaded = False
+        # Whether the buffer holds every row in the database
+        self._complete = False
+
+    async def load(self) -> None:
+        """Fill the buffer with the newest rows in the database."""
+        if not self.enabled:
+            return
+        async with self._session_factory() as db:
+            rows = (await db.execute(
+                select(OperationHistory)
+                .order_by(desc(OperationHistory.created_at), desc(OperationHistory.id))
+                .limit(self.size)
+            )).scalars().all()
+        self._rows = deque(reversed(rows))
+        self._bytes = sum(len(row.result) for row in rows)
+        self._complete = len(rows) < self.size
+        self._trim()
+        self._loaded = True
+
+    def _insert(self, row: OperationHistory) -> None:
+        rows = self._rows
+        key = _order(row)
+        if not rows or key >= _order(rows[-1]):
+            rows.append(row)
+        elif not self._complete and key < _order(rows[0]):
+            # Committed late with an older timestamp than anything kept: past the buffer's end
+            return
+        else:
+            rows.insert(bisect.bisect(rows, key, key=_order), row)
+        self._bytes += len(row.result)
+
+    def _trim(self) -> None:
+        rows = self._rows
+        while rows and (len(rows) > self.size or self._bytes > self.max_bytes):
+            self._bytes -= len(rows.popleft().result)
+            self._complete = False
+
+    def add(self, rows: Iterable[OperationHistory]) -> None:
+        """Buffer rows just committed to the database."""
+        if not self._loaded:
+            return
+        for row in rows:
+            self._insert(row)
+        self._trim()
+
+    def discard_before(self, cutoff: datetime) -> None:
+        """Drop rows created before ``cutoff``, which were removed from the database."""
+        rows = self._rows
+        while rows and rows[0].created_at < cutoff:
+            self._bytes -= len(rows.popleft().result)
+
+    def page(
+        self,
+        skip: int,
+        limit: int,
+        operation: Optional[str] = None
+    ) -> Optional[List[OperationHistory]]:
+        """
+        A page of history, newest first, as the database would return it.
+
+        Returns:
+            The rows, or None if the buffer does not hold the whole page
+        """
+        if not self._loaded:
+            return None
+        wanted = skip + limit
+        found = []
+        for row in reversed(self._rows):
+            if operation is None or row.operation == operation:
+                found.append(row)
+                if len(found) == wanted:
+                    return found[skip:]
+        return found[skip:] if self._complete else None
+
+
+# Global history policy instance
+history_policy = HistoryPolicy()
+
+# Global recent history instance
+recent_history = RecentHistory()
@@ -0,0 +1,273 @@
+"""Background jobs for calculations too slow to hold a request open for."""
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.orm import defer
+
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
+from app.models.database import Job, OperationHistory
+from app.services import registry
+from app.services.history import history_policy, recent_history
+from app.services.rollups import operation_rollups
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+ACTIVE_STATUSES = (PENDING, RUNNING)
+
+
+class JobService:
+    """
+    Persistent job queue consumed by a pool of asyncio workers.
+
+    Jobs live in the jobs table, so they survive restarts and any process
+    sharing the database can run them: workers claim a job with a
+    conditional UPDATE, and a running job whose heartbeat stops (its
+    process died) is claimed again. The computation itself goes through
+    registry.execute, so it is cached and offloaded exactly as in
+    /calculate.
+    """
+
+    def __init__(self, workers: int = None, session_factory=AsyncSessionLocal):
+        """
+        Initialize job service.
+
+        Args:
+            workers: Jobs run concurrently by this process
+            session_factory: Database session factory
+        """
+        self._workers = workers or settings.JOB_WORKERS
+        self._session_factory = session_factory
+        self._wakeup = asyncio.Event()
+        # Serializes the dedup check and insert of concurrent submissions
+        self._submit_lock = asyncio.Lock()
+        self._tasks: List[asyncio.Task] = []
+        # Ids of the jobs this process is running
+        self._running = set()
+
+    async def submit(
+        self,
+        operation: str,
+        value: int,
+        exponent: Optional[int] = None,
+        params: Optional[Dict[str, Any]] = None,
+        ip_address: Optional[str] = None
+    ) -> Tuple[Job, bool]:
+        """
+        Queue a calculation, unless an identical one is already pending or running.
+
+        Returns:
+            Tuple of (job, created); created is False for a deduplicated request
+        """
+        params = {name: param for name, param in (params or {}).items() if param is not None}
+        key = registry.request_key(operation, value, exponent, params)
+        async with self._submit_lock, self._session_factory() as db:
+            existing = (await db.execute(
+                select(Job).options(defer(Job.result))
+                .where(Job.request_key == key, Job.status.in_(ACTIVE_STATUSES)).limit(1)
+            )).scalar_one_or_none()
+            if existing is not None:
+                return existing, False
+
+            job = Job(
+                id=uuid.uuid4().hex,
+                request_key=key,
+                operation=operation,
+                input_value=value,
+                exponent=exponent,
+                params=json.dumps(params) if params else None,
+                status=PENDING,
+                created_at=datetime.utcnow(),
+                ip_address=ip_address
+            )
+            db.add(job)
+            await db.commit()
+        self._wakeup.set()
+        return job, True
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """A job without its result, or None if it does not exist or has expired."""
+        async with self._session_factory() as db:
+            job = (await db.execute(
+                select(Job).options(defer(Job.result)).where(Job.id == job_id)
+            )).scalar_one_or_none()
+        if job is None or (job.expires_at is not None and job.expires_at <= datetime.utcnow()):
+            return None
+        return job
+
+    async def position(self, job: Job) -> int:
+        """Number of pending jobs queued ahead of ``job``."""
+        async with self._session_factory() as db:
+            return (await db.execute(
+                select(func.count()).select_from(Job).where(
+                    Job.status == PENDING, Job.created_at < job.created_at
+                )
+            )).scalar_one()
+
+    async def stream_result(self, job_id: str, chunk_size: int = 64 * 1024) -> AsyncIterator[str]:
+        """
+        The serialized result of a finished job, in chunks of ``chunk_size`` characters.
+
+        Each chunk is read on its own with SUBSTR, so only one chunk of the
+        result is in memory at a time and no connection is held while the
+        client reads. Stops early if the job expires part way through.
+        """
+        async with self._session_factory() as db:
+            length = (await db.execute(
+                select(func.length(Job.result)).where(Job.id == job_id)
+            )).scalar_one_or_none()
+        # SQL strings are indexed from 1
+        for start in range(1, (length or 0) + 1, chunk_size):
+            async with self._session_factory() as db:
+                chunk = (await db.execute(
+                    select(func.substr(Job.result, start, chunk_size)).where(Job.id == job_id)
+                )).scalar_one_or_none()
+            if chunk is None:
+                return
+            yield chunk
+
+    def _stale_before(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=3 * settings.JOB_HEARTBEAT_SECONDS)
+
+    async def _claim(self) -> Optional[Job]:
+        """Take the oldest runnable job, or None if there is none."""
+        async with self._session_factory() as db:
+            while True:
+                stale = self._stale_before()
+                claimable = or_(
+                    Job.status == PENDING,
+                    (Job.status == RUNNING) & (Job.heartbeat_at < stale)
+                )
+                job = (await db.execute(
+                    select(Job).where(claimable).order_by(Job.created_at).limit(1)
+                )).scalar_one_or_none()
+                if job is None:
+                    return None
+                now = datetime.utcnow()
+                # Another worker, possibly in another process, may have claimed it first
+                claimed = await db.execute(
+                    update(Job).where(Job.id == job.id, claimable)
+                    .values(status=RUNNING, started_at=now, heartbeat_at=now)
+                )
+                await db.commit()
+                if claimed.rowcount:
+                    await db.refresh(job)
+                    return job
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(settings.JOB_HEARTBEAT_SECONDS)
+            async with self._session_factory() as db:
+                await db.execute(
+                    update(Job).where(Job.id == job_id, Job.status == RUNNING)
+                    .values(heartbeat_at=datetime.utcnow())
+                )
+                await db.commit()
+
+    async def run(self, job: Job) -> None:
+        """Compute a claimed job and store its outcome."""
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        self._running.add(job.id)
+        values: Dict[str, Any] = {}
+        history = None
+        try:
+            result, computation_time, cached = await registry.execute(
+                job.operation, job.input_value, job.exponent,
+                json.loads(job.params) if job.params else None,
+                # Jobs exist for work that may wait; they queue rather than fail
+                shed=False
+            )
+            # Converting a result with millions of digits to text takes a while
+            text = await asyncio.to_thread(registry.get_operation(job.operation).serialize, result)
+            values = dict(status=DONE, result=text, cached=cached,
+                          computation_time_ms=computation_time)
+            history = OperationHistory(
+                operation=job.operation,
+                input_value=job.input_value,
+                exponent=job.exponent,
+                result=text,
+                computation_time_ms=computation_time,
+                ip_address=job.ip_address
+            )
+            operation_rollups.record(job.operation, cached, computation_time)
+            if not history_policy.keep(history, cached):
+                history = None
+        except Exception as e:
+            values = dict(status=FAILED, error=str(e))
+        finally:
+            heartbeat.cancel()
+            self._running.discard(job.id)
+
+        now = datetime.utcnow()
+        async with self._session_factory() as db:
+            await db.execute(
+                update(Job).where(Job.id == job.id).values(
+                    finished_at=now,
+                    expires_at=now + timedelta(seconds=settings.JOB_RESULT_TTL_SECONDS),
+                    **values
+                )
+            )
+            if history is not None:
+                db.add(history)
+            await db.commit()
+        if history is not None:
+            recent_history.add([history])
+
+    async def _work(self) -> None:
+        while True:
+            # Cleared before looking, so a submission made meanwhile still wakes us
+            self._wakeup.clear()
+            job = await self._claim()
+            if job is not None:
+                await self.run(job)
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def cleanup(self) -> int:
+        """Delete finished jobs past their retention; returns how many."""
+        async with self._session_factory() as db:
+            deleted = await db.execute(delete(Job).where(Job.expires_at <= datetime.utcnow()))
+            await db.commit()
+        return deleted.rowcount
+
+    async def _run_cleanup(self, interval: float) -> None:
+        while True:
+            await self.cleanup()
+            await asyncio.sleep(interval)
+
+    def start(self) -> None:
+        """Start the workers and the retention task."""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self._workers)]
+        self._tasks.append(asyncio.create_task(
+            self._run_cleanup(settings.JOB_CLEANUP_INTERVAL_SECONDS)
+        ))
+
+    async def stop(self) -> None:
+        """Stop the workers, handing the jobs they were running back to the queue."""
+        interrupted = list(self._running)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if interrupted:
+            async with self._session_factory() as db:
+                await db.execute(
+                    update(Job).where(Job.id.in_(interrupted), Job.status == RUNNING)
+                    .values(status=PENDING, started_at=None, heartbeat_at=None)
+                )
+                await db.commit()
+
+
+# Global job service instance
+job_service = JobService()
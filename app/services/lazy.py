@@ -0,0 +1,224 @@
+"""Deferred (symbolic) power results."""
+from decimal import Decimal, localcontext
+from functools import total_ordering
+from typing import Optional, Union
+
+from app.services.backends import get_backend
+
+# Extra decimal digits carried beyond what the exponent itself needs
+_GUARD_DIGITS = 30
+
+# Fractional parts closer than this to an integer are resolved exactly
+_EPSILON = Decimal("1e-20")
+
+# Results up to this many bits are cheaper to materialize than to reason about
+_SMALL_BITS = 4096
+
+
+@total_ordering
+class LazyPower:
+    """
+    A value of ``base ** exponent`` that is only materialized on demand.
+
+    Digit counts, bit lengths and leading digits are derived from
+    high-precision logarithms, residues use modular exponentiation, and powers
+    of two are materialized with a bit shift. Instances hold two ints, so they
+    are cheap to keep in the result cache whatever the size of the value.
+    """
+
+    __slots__ = ("base", "exponent")
+
+    def __init__(self, base: int, exponent: int):
+        """
+        Initialize lazy power.
+
+        Args:
+            base: Base number
+            exponent: Non-negative exponent
+        """
+        if exponent < 0:
+            raise ValueError("Lazy powers require a non-negative exponent")
+        self.base = base
+        self.exponent = exponent
+
+    def __getstate__(self):
+        """Pickle support for slotted instances."""
+        return self.base, self.exponent
+
+    def __setstate__(self, state):
+        """Restore from pickled state."""
+        self.base, self.exponent = state
+
+    @property
+    def sign(self) -> int:
+        """Sign of the value: -1, 0 or 1."""
+        if self.exponent == 0:
+            return 1
+        if self.base == 0:
+            return 0
+        return -1 if self.base < 0 and self.exponent % 2 else 1
+
+    def _shift(self) -> Optional[int]:
+        """Return j if |base| == 2**j (j >= 1), else None."""
+        magnitude = abs(self.base)
+        if magnitude > 1 and magnitude & (magnitude - 1) == 0:
+            return magnitude.bit_length() - 1
+        return None
+
+    def _is_small(self) -> bool:
+        """Whether the value is small enough to just compute."""
+        magnitude = abs(self.base)
+        return magnitude <= 1 or magnitude.bit_length() * self.exponent <= _SMALL_BITS
+
+    @property
+    def value(self) -> int:
+        """Materialize the full value."""
+        shift = self._shift()
+        if shift is not None:
+            magnitude = 1 << (shift * self.exponent)
+            return -magnitude if self.sign < 0 else magnitude
+        return get_backend().pow(self.base, self.exponent)
+
+    def _precision(self) -> int:
+        """Decimal digits needed to resolve the integer part of the log of |value|."""
+        return (
+            len(str(self.exponent)) + len(str(abs(self.base).bit_length()))
+            + _GUARD_DIGITS
+        )
+
+    def _log(self, radix: int, extra_digits: int = 0) -> Decimal:
+        """exponent * log_radix(|base|) with enough precision to resolve its integer part."""
+        with localcontext() as ctx:
+            ctx.prec = self._precision() + extra_digits
+            magnitude = Decimal(abs(self.base))
+            if radix == 10:
+                log = magnitude.log10()
+            else:
+                log = magnitude.ln() / Decimal(radix).ln()
+            return log * self.exponent
+
+    def _digits_in_radix(self, radix: int) -> int:
+        """Number of base-``radix`` digits of |value|."""
+        if self.sign == 0:
+            return 1
+        if self._is_small():
+            magnitude = abs(self.value)
+            return len(str(magnitude)) if radix == 10 else magnitude.bit_length()
+
+        # |base| == radix**j gives exactly j * exponent + 1 digits
+        magnitude, j = abs(self.base), 0
+        while magnitude % radix == 0:
+            magnitude //= radix
+            j += 1
+        if magnitude == 1:
+            return j * self.exponent + 1
+
+        log = self._log(radix)
+        integral = int(log)
+        fraction = log - integral
+        if fraction < _EPSILON or fraction > 1 - _EPSILON:
+            # Too close to call analytically; settle it exactly
+            value = abs(self.value)
+            return len(str(value)) if radix == 10 else value.bit_length()
+        return integral + 1
+
+    def digit_count(self) -> int:
+        """Number of decimal digits of |value|."""
+        return self._digits_in_radix(10)
+
+    def bit_length(self) -> int:
+        """Bit length of |value|."""
+        if self.sign == 0:
+            return 0
+        shift = self._shift()
+        if shift is not None:
+            return shift * self.exponent + 1
+        return self._digits_in_radix(2)
+
+    def leading_digits(self, count: int) -> int:
+        """
+        First ``count`` decimal digits of |value|.
+
+        Args:
+            count: Number of digits to return
+
+        Returns:
+            The leading digits as an int (all digits if the value is shorter)
+        """
+        if count < 1:
+            raise ValueError("Digit count must be positive")
+        digits = self.digit_count()
+        if digits <= count or self._is_small():
+            return int(str(abs(self.value))[:count])
+
+        log = self._log(10, extra_digits=count)
+        with localcontext() as ctx:
+            ctx.prec = self._precision() + 2 * count
+            scaled = Decimal(10) ** (log - int(log) + count - 1)
+            leading = int(scaled)
+            if scaled - leading < _EPSILON or scaled - leading > 1 - _EPSILON:
+                return int(str(abs(self.value))[:count])
+        return leading
+
+    def mod(self, modulus: int) -> int:
+        """Value modulo ``modulus`` without materializing it."""
+        if modulus < 1:
+            raise ValueError("Modulus must be positive")
+        return pow(self.base, self.exponent, modulus)
+
+    def _compare_key(self, other: "LazyPower") -> int:
+        """Return -1, 0 or 1 comparing self with other."""
+        if self.sign != other.sign:
+            return -1 if self.sign < other.sign else 1
+        if self.sign == 0:
+            return 0
+        if self._is_small() and other._is_small():
+            a, b = self.value, other.value
+            return (a > b) - (a < b)
+
+        with localcontext() as ctx:
+            ctx.prec = max(self._precision(), other._precision())
+            difference = self._log(2) - other._log(2)
+        if abs(difference) < _EPSILON:
+            a, b = self.value, other.value
+            return (a > b) - (a < b)
+        # Larger magnitude means larger value only for positive numbers
+        return self.sign if difference > 0 else -self.sign
+
+    @staticmethod
+    def _coerce(other: Union["LazyPower", int]) -> Optional["LazyPower"]:
+        if isinstance(other, LazyPower):
+            return other
+        if isinstance(other, int) and not isinstance(other, bool):
+            return LazyPower(other, 1)
+        return None
+
+    def __eq__(self, other):
+        """Compare equal to another lazy power or int."""
+        other = self._coerce(other)
+        if other is None:
+            return NotImplemented
+        return self._compare_key(other) == 0
+
+    def __lt__(self, other):
+        """Order against another lazy power or int."""
+        other = self._coerce(other)
+        if other is None:
+            return NotImplemented
+        return self._compare_key(other) < 0
+
+    __hash__ = None
+
+    def __int__(self) -> int:
+        """Materialize as int."""
+        return self.value
+
+    __index__ = __int__
+
+    def __str__(self) -> str:
+        """Full decimal digits (materializes the value)."""
+        return str(self.value)
+
+    def __repr__(self) -> str:
+        """String representation."""
+        return f"LazyPower(base={self.base}, exponent={self.exponent})"
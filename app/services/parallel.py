@@ -0,0 +1,112 @@
+"""Multi-process product trees for large factorials."""
+import asyncio
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from app.core.config import settings
+from app.services.backends import get_backend
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _to_bytes(value: int) -> bytes:
+    """Encode a non-negative int for transfer between processes."""
+    return value.to_bytes((value.bit_length() + 7) // 8, "little")
+
+
+def _from_bytes(data: bytes) -> int:
+    """Decode an int produced by _to_bytes."""
+    return int.from_bytes(data, "little")
+
+
+def _product_range_bytes(lo: int, hi: int) -> bytes:
+    """Worker entry point: product of [lo, hi) as bytes."""
+    return _to_bytes(get_backend().product_range(lo, hi))
+
+
+def _multiply_bytes(left: bytes, right: bytes) -> bytes:
+    """Worker entry point: product of two encoded ints as bytes."""
+    return _to_bytes(get_backend().mul(_from_bytes(left), _from_bytes(right)))
+
+
+def balanced_bounds(lo: int, hi: int, parts: int) -> List[int]:
+    """
+    Split [lo, hi) into ``parts`` ranges whose products have similar bit sizes.
+
+    Boundaries are placed at equal shares of log(hi! / lo!), found by
+    bisection on lgamma, so later (larger) factors get shorter ranges.
+    """
+    lo = max(lo, 1)
+    parts = max(1, min(parts, hi - lo))
+    total = math.lgamma(hi) - math.lgamma(lo)
+    bounds = [lo]
+    for k in range(1, parts):
+        target = math.lgamma(lo) + total * k / parts
+        left, right = bounds[-1] + 1, hi - 1
+        while left < right:
+            mid = (left + right) // 2
+            if math.lgamma(mid) < target:
+                left = mid + 1
+            else:
+                right = mid
+        bounds.append(left)
+    bounds.append(hi)
+    return bounds
+
+
+def worker_count() -> int:
+    """Configured number of worker processes (0 means one per CPU)."""
+    return settings.FACTORIAL_PARALLEL_WORKERS or os.cpu_count() or 1
+
+
+def should_parallelize(n: int) -> bool:
+    """Whether n! is large enough to be worth splitting across processes."""
+    return n >= settings.FACTORIAL_PARALLEL_THRESHOLD and worker_count() > 1
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Return the shared process pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=worker_count())
+    return _pool
+
+
+def shutdown_pool() -> None:
+    """Shut down the shared process pool if it was started."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+        _pool = None
+
+
+async def parallel_product_range(lo: int, hi: int) -> int:
+    """
+    Product of the integers in [lo, hi) computed across the process pool.
+
+    The range is cut into one balanced chunk per worker, and partial products
+    are combined pairwise in a tree. Every multiplication, including the
+    final one, runs in the pool; ints cross process boundaries as raw
+    little-endian bytes, and only the finished product is decoded here.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    bounds = balanced_bounds(lo, hi, worker_count())
+
+    partials = await asyncio.gather(*[
+        loop.run_in_executor(pool, _product_range_bytes, a, b)
+        for a, b in zip(bounds, bounds[1:])
+    ])
+
+    while len(partials) > 1:
+        pairs = [
+            loop.run_in_executor(pool, _multiply_bytes, partials[i], partials[i + 1])
+            for i in range(0, len(partials) - 1, 2)
+        ]
+        leftover = [partials[-1]] if len(partials) % 2 else []
+        partials = list(await asyncio.gather(*pairs)) + leftover
+
+    # Decoding is linear in the size of the result; the multiplications were not
+    return _from_bytes(partials[0])
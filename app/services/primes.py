@@ -0,0 +1,319 @@
+"""Primality testing, prime counting and prime enumeration."""
+import asyncio
+import math
+from array import array
+from typing import List, Optional, Tuple
+
+from app.services.cache import cache_service
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+# Integers covered by one cached sieve segment. Segments store one bit per odd
+# number, so each is SEGMENT_SPAN / 16 bytes.
+SEGMENT_SPAN = 1 << 20
+
+# Bases making Miller-Rabin deterministic below 3.3 * 10**24, covering 64 bits
+_MR_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)
+
+_SMALL_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47)
+
+# flag byte -> ASCII digit, to pack sieve flags into an int bitset
+_TO_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+
+
+def _popcount(bits: int) -> int:
+    return bin(bits).count("1")
+
+
+def _strong_probable_prime(n: int, base: int) -> bool:
+    """Miller-Rabin round: is n a strong probable prime to ``base``?"""
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    x = pow(base, d, n)
+    if x == 1 or x == n - 1:
+        return True
+    for _ in range(s - 1):
+        x = x * x % n
+        if x == n - 1:
+            return True
+    return False
+
+
+def _jacobi(a: int, n: int) -> int:
+    """Jacobi symbol (a/n) for odd positive n."""
+    a %= n
+    result = 1
+    while a:
+        while a % 2 == 0:
+            a //= 2
+            if n % 8 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def _selfridge_parameters(n: int) -> Optional[Tuple[int, int, int]]:
+    """
+    Lucas parameters (D, P, Q) by Selfridge's method A: the first D in
+    5, -7, 9, -11, ... with Jacobi symbol (D/n) = -1, P = 1, Q = (1 - D) / 4.
+
+    Returns:
+        The parameters, or None if the search finds a factor of n
+    """
+    if math.isqrt(n) ** 2 == n:
+        # No such D exists for a perfect square
+        return None
+    d = 5
+    while True:
+        jacobi = _jacobi(d, n)
+        if jacobi == -1:
+            return d, 1, (1 - d) // 4
+        if jacobi == 0 and abs(d) != n:
+            return None
+        d = -d - 2 if d > 0 else -d + 2
+
+
+def _strong_lucas_probable_prime(n: int) -> bool:
+    """Strong Lucas test with Selfridge's parameter choice (method A)."""
+    parameters = _selfridge_parameters(n)
+    if parameters is None:
+        return False
+    d, p, q = parameters
+
+    k, s = n + 1, 0
+    while k % 2 == 0:
+        k //= 2
+        s += 1
+
+    # Compute U_k, V_k, Q^k by binary expansion of k
+    u, v, qk = 0, 2, 1
+    inverse_two = (n + 1) // 2
+    for bit in bin(k)[2:]:
+        u, v = u * v % n, (v * v - 2 * qk) % n
+        qk = qk * qk % n
+        if bit == "1":
+            u, v = (p * u + v) * inverse_two % n, (d * u + p * v) * inverse_two % n
+            qk = qk * q % n
+
+    if u == 0 or v == 0:
+        return True
+    for _ in range(s - 1):
+        v = (v * v - 2 * qk) % n
+        qk = qk * qk % n
+        if v == 0:
+            return True
+    return False
+
+
+def is_prime(n: int) -> bool:
+    """
+    Primality test.
+
+    Deterministic Miller-Rabin below 2**64, Baillie-PSW above (no known
+    counterexamples).
+    """
+    if n < 2:
+        return False
+    for p in _SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+    if n < 1 << 64:
+        return all(_strong_probable_prime(n, base) for base in _MR_BASES)
+    return _strong_probable_prime(n, 2) and _strong_lucas_probable_prime(n)
+
+
+def next_prime(n: int) -> int:
+    """Smallest prime strictly greater than n."""
+    if n < 2:
+        return 2
+    candidate = n + 1 + (n % 2)
+    while not is_prime(candidate):
+        candidate += 2
+    return candidate
+
+
+def small_primes(limit: int) -> List[int]:
+    """All primes <= limit (simple sieve)."""
+    if limit < 2:
+        return []
+    flags = bytearray(b"\x01") * (limit + 1)
+    flags[0] = flags[1] = 0
+    for p in range(2, math.isqrt(limit) + 1):
+        if flags[p]:
+            flags[p * p::p] = bytes(len(range(p * p, limit + 1, p)))
+    return [i for i, flag in enumerate(flags) if flag]
+
+
+def sieve_segment(index: int, base_primes: array) -> int:
+    """
+    Sieve the odd numbers of [index * SEGMENT_SPAN, (index + 1) * SEGMENT_SPAN).
+
+    Args:
+        index: Segment index
+        base_primes: All odd primes up to sqrt of the segment end
+
+    Returns:
+        Bitset as an int; bit i is set when lo + 2i + 1 is prime
+    """
+    lo = index * SEGMENT_SPAN
+    hi = lo + SEGMENT_SPAN
+    size = SEGMENT_SPAN // 2
+    flags = bytearray(b"\x01") * size
+    for p in base_primes:
+        if p * p >= hi:
+            break
+        start = max(p * p, (lo + p) // p * p)
+        if start % 2 == 0:
+            start += p
+        offset = (start - lo - 1) // 2
+        if offset < size:
+            flags[offset::p] = bytes(len(range(offset, size, p)))
+    if index == 0:
+        flags[0] = 0  # 1 is not prime
+    return int(flags.translate(_TO_DIGITS)[::-1], 2)
+
+
+def segment_prime_count(index: int, bits: int) -> int:
+    """Primes in a segment, counting 2 in segment 0."""
+    return _popcount(bits) + (1 if index == 0 else 0)
+
+
+def segment_kth_prime(index: int, bits: int, k: int) -> int:
+    """The k-th prime (1-based) within a segment."""
+    if index == 0:
+        if k == 1:
+            return 2
+        k -= 1
+    digits = bin(bits)[:1:-1]
+    position = -1
+    for _ in range(k):
+        position = digits.index("1", position + 1)
+    return index * SEGMENT_SPAN + 2 * position + 1
+
+
+def _prime_count_lucy(n: int) -> int:
+    """pi(n) with the Lucy_Hedgehog algorithm in O(n^(3/4)) time, O(sqrt(n)) memory."""
+    r = math.isqrt(n)
+    # small[v] = pi-candidates <= v; large[i] = candidates <= n // i
+    if np is not None and n < 1 << 62:
+        small = np.arange(-1, r, dtype=np.int64)
+        small[0] = 0
+        large = np.zeros(r + 1, dtype=np.int64)
+        large[1:] = n // np.arange(1, r + 1, dtype=np.int64) - 1
+        for p in range(2, r + 1):
+            if small[p] == small[p - 1]:
+                continue
+            sp = int(small[p - 1])
+            p2 = p * p
+            limit = min(r, n // p2)
+            i = np.arange(1, limit + 1, dtype=np.int64)
+            ip = i * p
+            inner = ip <= r
+            updated = np.empty(limit, dtype=np.int64)
+            updated[inner] = large[ip[inner]]
+            updated[~inner] = small[n // ip[~inner]]
+            large[1:limit + 1] -= updated - sp
+            if p2 <= r:
+                v = np.arange(p2, r + 1, dtype=np.int64)
+                small[p2:] -= small[v // p] - sp
+        return int(large[1])
+
+    small = [max(v - 1, 0) for v in range(r + 1)]
+    large = [0] + [n // i - 1 for i in range(1, r + 1)]
+    for p in range(2, r + 1):
+        if small[p] == small[p - 1]:
+            continue
+        sp = small[p - 1]
+        p2 = p * p
+        for i in range(1, min(r, n // p2) + 1):
+            ip = i * p
+            large[i] -= (large[ip] if ip <= r else small[n // ip]) - sp
+        for v in range(r, p2 - 1, -1):
+            small[v] -= small[v // p] - sp
+    return large[1]
+
+
+def nth_prime_estimate(n: int) -> int:
+    """Cipolla's asymptotic estimate of the n-th prime."""
+    if n < 6:
+        return 13
+    ln = math.log(n)
+    lnln = math.log(ln)
+    return int(n * (ln + lnln - 1 + (lnln - 2) / ln))
+
+
+async def _base_primes(limit: int) -> array:
+    """Odd primes up to ``limit`` (rounded up to a power of two), via the cache."""
+    bound = 1 << max(limit, 2).bit_length()
+    primes = await cache_service.get("prime_base", bound)
+    if primes is None:
+        loop = asyncio.get_running_loop()
+        primes = array("q", (await loop.run_in_executor(None, small_primes, bound))[1:])
+        await cache_service.set("prime_base", bound, primes)
+    return primes
+
+
+async def get_segment(index: int) -> int:
+    """Sieve segment bitset, via the cache."""
+    bits = await cache_service.get("prime_segment", index)
+    if bits is None:
+        base = await _base_primes(math.isqrt((index + 1) * SEGMENT_SPAN) + 1)
+        loop = asyncio.get_running_loop()
+        bits = await loop.run_in_executor(None, sieve_segment, index, base)
+        await cache_service.set("prime_segment", index, bits)
+    return bits
+
+
+async def prime_count(n: int, sieve_limit: int) -> int:
+    """
+    Number of primes <= n.
+
+    Ranges below ``sieve_limit`` are answered from cached sieve segments;
+    larger ones with Lucy_Hedgehog, which needs only O(sqrt(n)) memory.
+    """
+    if n < 2:
+        return 0
+    if n >= sieve_limit:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, _prime_count_lucy, n)
+
+    last = n // SEGMENT_SPAN
+    count = 0
+    for index in range(last):
+        count += segment_prime_count(index, await get_segment(index))
+    # Odd numbers of the last segment that are <= n
+    odd_slots = (n - last * SEGMENT_SPAN + 1) // 2
+    bits = await get_segment(last) & ((1 << odd_slots) - 1)
+    return count + segment_prime_count(last, bits)
+
+
+async def nth_prime(n: int, sieve_limit: int) -> int:
+    """
+    The n-th prime (1-based).
+
+    Counts primes exactly up to the segment containing an analytic estimate,
+    then walks cached sieve segments forward or backward to the answer.
+    """
+    if n < 1:
+        raise ValueError("nth_prime requires a positive index")
+    index = nth_prime_estimate(n) // SEGMENT_SPAN
+    count = await prime_count(index * SEGMENT_SPAN - 1, sieve_limit) if index else 0
+
+    while count >= n:
+        index -= 1
+        count -= segment_prime_count(index, await get_segment(index))
+    while True:
+        bits = await get_segment(index)
+        in_segment = segment_prime_count(index, bits)
+        if count + in_segment >= n:
+            return segment_kth_prime(index, bits, n - count)
+        count += in_segment
+        index += 1
@@ -0,0 +1,262 @@
+"""Per-client rate limiting by estimated computation cost."""
+import logging
+import math
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from app.core.config import settings
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class Bill:
+    """Computation cost incurred by one request, added up as it runs."""
+
+    def __init__(self):
+        self.cost = 0.0
+
+    def tokens(self) -> float:
+        """What the request costs its client: a flat fee plus its computation."""
+        return settings.RATE_LIMIT_REQUEST_COST + self.cost / settings.RATE_LIMIT_COST_UNIT
+
+
+_current_bill: ContextVar[Optional[Bill]] = ContextVar("rate_limit_bill", default=None)
+
+
+@contextmanager
+def billing() -> Iterator[Bill]:
+    """Collect the cost charged by everything the request runs, including tasks it starts."""
+    bill = Bill()
+    token = _current_bill.set(bill)
+    try:
+        yield bill
+    finally:
+        _current_bill.reset(token)
+
+
+def charge(cost: float) -> None:
+    """
+    Bill estimated work (see OperationSpec.estimate_cost) to the current request.
+
+    Does nothing outside a rate-limited request, e.g. in job workers.
+    """
+    bill = _current_bill.get()
+    if bill is not None:
+        bill.cost += cost
+
+
+class MemoryRateLimiter:
+    """
+    Token buckets and in-flight counts for this process's clients.
+
+    A request is admitted while its client's bucket is not in debt and the
+    client has fewer than ``max_concurrent`` requests running; it is charged
+    once it finishes, when its cost is known. One expensive request can
+    therefore drive the bucket into debt, and the client then waits until
+    the refill pays it off.
+    """
+
+    def __init__(
+        self,
+        capacity: float = None,
+        refill_per_second: float = None,
+        max_concurrent: int = None
+    ):
+        """
+        Args:
+            capacity: Bucket size in tokens; defaults to RATE_LIMIT_CAPACITY
+            refill_per_second: Tokens added per second; defaults to RATE_LIMIT_REFILL_PER_SECOND
+            max_concurrent: Requests one client may have running; defaults to
+                RATE_LIMIT_MAX_CONCURRENT
+        """
+        self.capacity = capacity or settings.RATE_LIMIT_CAPACITY
+        self.refill_per_second = refill_per_second or settings.RATE_LIMIT_REFILL_PER_SECOND
+        self.max_concurrent = max_concurrent or settings.RATE_LIMIT_MAX_CONCURRENT
+        # client -> [tokens, monotonic time of the last update]
+        self._buckets: Dict[str, List[float]] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._next_prune = time.monotonic() + self.capacity / self.refill_per_second
+
+    def _refill(self, client: str, now: float) -> List[float]:
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [self.capacity, now]
+        else:
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.refill_per_second)
+            bucket[1] = now
+        return bucket
+
+    def _prune(self, now: float) -> None:
+        """Forget idle clients whose buckets have refilled, which is the state of a new client."""
+        full_after = self.capacity / self.refill_per_second
+        for client in [
+            client for client, (tokens, updated) in self._buckets.items()
+            if client not in self._in_flight
+            and tokens + (now - updated) * self.refill_per_second >= self.capacity
+        ]:
+            del self._buckets[client]
+        self._next_prune = now + full_after
+
+    async def admit(self, client: str) -> Optional[float]:
+        """
+        Start a request for ``client``.
+
+        Returns:
+            None if admitted (call ``settle`` when it finishes), otherwise
+            seconds to wait before retrying
+        """
+        now = time.monotonic()
+        if now >= self._next_prune:
+            self._prune(now)
+        tokens, _ = self._refill(client, now)
+        if tokens < 0:
+            return -tokens / self.refill_per_second
+        if self._in_flight.get(client, 0) >= self.max_concurrent:
+            return 1.0
+        self._in_flight[client] = self._in_flight.get(client, 0) + 1
+        return None
+
+    async def settle(self, client: str, tokens: float) -> None:
+        """Finish an admitted request, charging it ``tokens``."""
+        remaining = self._in_flight.get(client, 1) - 1
+        if remaining:
+            self._in_flight[client] = remaining
+        else:
+            self._in_flight.pop(client, None)
+        self._refill(client, time.monotonic())[0] -= tokens
+
+    async def close(self) -> None:
+        """Nothing to release."""
+
+
+# KEYS: bucket hash, in-flight sorted set
+# ARGV: capacity, refill per second, max concurrent, now, request id, stale before, expiry
+_ADMIT_SCRIPT = """
+local capacity, rate = tonumber(ARGV[1]), tonumber(ARGV[2])
+local now = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], ARGV[7])
+if tokens < 0 then
+    return tostring(-tokens / rate)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[6])
+if redis.call('ZCARD', KEYS[2]) >= tonumber(ARGV[3]) then
+    return '1'
+end
+redis.call('ZADD', KEYS[2], now, ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[7])
+return ''
+"""
+
+# KEYS: bucket hash, in-flight sorted set
+# ARGV: capacity, refill per second, tokens charged, now, request id, expiry
+_SETTLE_SCRIPT = """
+local capacity, rate = tonumber(ARGV[1]), tonumber(ARGV[2])
+local now = tonumber(ARGV[4])
+redis.call('ZREM', KEYS[2], ARGV[5])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate) - tonumber(ARGV[3])
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+"""
+
+
+class RedisRateLimiter(MemoryRateLimiter):
+    """
+    The same buckets and concurrency caps, kept in Redis for every process and node.
+
+    Each admit and settle is one Lua script, so concurrent requests cannot
+    both spend the same tokens. In-flight requests are members of a sorted
+    set scored by start time; ones older than RATE_LIMIT_STALE_SECONDS
+    (their process died) stop counting. If Redis is unreachable requests
+    are admitted, so an outage of the limiter is not an outage of the
+    service.
+    """
+
+    def __init__(self, url: str = None, client=None, **limits):
+        """
+        Args:
+            url: Redis URL; defaults to RATE_LIMIT_REDIS_URL
+            client: Existing redis.asyncio client to use instead of ``url``
+            limits: capacity, refill_per_second and max_concurrent, as for MemoryRateLimiter
+        """
+        if client is None and redis is None:
+            raise ValueError("The redis rate limit backend requires the redis package")
+        super().__init__(**limits)
+        self._redis = client or redis.from_url(url or settings.RATE_LIMIT_REDIS_URL)
+        self._admit = self._redis.register_script(_ADMIT_SCRIPT)
+        self._settle = self._redis.register_script(_SETTLE_SCRIPT)
+        # Buckets are forgotten once they would have refilled anyway
+        self._expiry = math.ceil(self.capacity / self.refill_per_second) + 1
+        self._requests: Dict[str, List[str]] = {}
+
+    def _keys(self, client: str) -> List[str]:
+        prefix = f"{settings.RATE_LIMIT_REDIS_PREFIX}:{client}"
+        return [f"{prefix}:bucket", f"{prefix}:in_flight"]
+
+    async def admit(self, client: str) -> Optional[float]:
+        now = time.time()
+        request_id = uuid.uuid4().hex
+        try:
+            wait = await self._admit(keys=self._keys(client), args=[
+                self.capacity, self.refill_per_second, self.max_concurrent, now, request_id,
+                now - settings.RATE_LIMIT_STALE_SECONDS,
+                max(self._expiry, math.ceil(settings.RATE_LIMIT_STALE_SECONDS))
+            ])
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter unavailable, admitting request: {e}")
+            return None
+        if wait:
+            return float(wait)
+        self._requests.setdefault(client, []).append(request_id)
+        return None
+
+    async def settle(self, client: str, tokens: float) -> None:
+        requests = self._requests.get(client)
+        if not requests:
+            # Admitted while Redis was unreachable
+            return
+        request_id = requests.pop()
+        if not requests:
+            del self._requests[client]
+        try:
+            await self._settle(keys=self._keys(client), args=[
+                self.capacity, self.refill_per_second, tokens, time.time(), request_id,
+                max(self._expiry, math.ceil(settings.RATE_LIMIT_STALE_SECONDS))
+            ])
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter unavailable, request not charged: {e}")
+
+    async def close(self) -> None:
+        """Close the Redis connection pool."""
+        await self._redis.aclose()
+
+
+def create_rate_limiter() -> Optional[MemoryRateLimiter]:
+    """The limiter selected by RATE_LIMIT_BACKEND, or None unless RATE_LIMIT_ENABLED."""
+    if not settings.RATE_LIMIT_ENABLED:
+        return None
+    backend = settings.RATE_LIMIT_BACKEND.lower()
+    if backend == "redis":
+        return RedisRateLimiter()
+    if backend != "memory":
+        raise ValueError(f"Unknown rate limit backend: {settings.RATE_LIMIT_BACKEND}")
+    return MemoryRateLimiter()
+
+
+# Global rate limiter; None when rate limiting is off
+rate_limiter = create_rate_limiter()
@@ -0,0 +1,137 @@
+"""Terms of constant-coefficient linear recurrences by Kitamasa's method."""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.services.backends import fibonacci_pair, get_backend
+
+# Largest recurrence order accepted; the work grows with its square
+MAX_ORDER = 64
+
+# name -> (coefficients, initial terms) for a(n) = c1*a(n-1) + ... + ck*a(n-k)
+PRESETS: Dict[str, Tuple[Tuple[int, ...], Tuple[int, ...]]] = {
+    "fibonacci": ((1, 1), (0, 1)),
+    "lucas": ((1, 1), (2, 1)),
+    "pell": ((2, 1), (0, 1)),
+    "tribonacci": ((1, 1, 1), (0, 0, 1)),
+}
+
+
+def _reduce(poly: List[int], coefficients: Sequence[int], modulus: Optional[int]) -> List[int]:
+    """Reduce a polynomial modulo x^k - c1*x^(k-1) - ... - ck."""
+    k = len(coefficients)
+    for degree in range(len(poly) - 1, k - 1, -1):
+        top = poly[degree]
+        if top:
+            for i, c in enumerate(coefficients, 1):
+                poly[degree - i] += top * c
+    poly = poly[:k]
+    if modulus is not None:
+        poly = [x % modulus for x in poly]
+    return poly
+
+
+def _multiply(a: List[int], b: List[int], coefficients: Sequence[int],
+              modulus: Optional[int]) -> List[int]:
+    """Product of two residues modulo the characteristic polynomial."""
+    product = [0] * (2 * len(a) - 1)
+    for i, x in enumerate(a):
+        if x:
+            for j, y in enumerate(b):
+                product[i + j] += x * y
+    return _reduce(product, coefficients, modulus)
+
+
+def kitamasa(
+    coefficients: Sequence[int],
+    initial_terms: Sequence[int],
+    n: int,
+    modulus: Optional[int] = None
+) -> int:
+    """
+    n-th term of a(n) = c1*a(n-1) + ... + ck*a(n-k).
+
+    Computes x^n modulo the characteristic polynomial by square-and-multiply,
+    O(k^2 log n) multiplications, and takes its coefficients as weights of
+    the initial terms.
+
+    Args:
+        coefficients: c1..ck
+        initial_terms: a(0)..a(k-1)
+        n: Index of the term
+        modulus: Optional modulus applied throughout
+
+    Returns:
+        a(n), reduced modulo ``modulus`` when given
+    """
+    k = len(coefficients)
+    if n < k:
+        term = initial_terms[n]
+        return term % modulus if modulus is not None else term
+
+    residue = [1] + [0] * (k - 1)
+    for bit in bin(n)[2:]:
+        residue = _multiply(residue, residue, coefficients, modulus)
+        if bit == "1":
+            # Multiply by x: shift up one degree and fold the overflow back
+            residue = _reduce([0] + residue, coefficients, modulus)
+
+    if modulus is None:
+        backend = get_backend()
+        return sum(backend.mul(r, a) for r, a in zip(residue, initial_terms))
+    return sum(r * a for r, a in zip(residue, initial_terms)) % modulus
+
+
+def resolve(
+    coefficients: Optional[Sequence[int]] = None,
+    initial_terms: Optional[Sequence[int]] = None,
+    preset: Optional[str] = None
+) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    """
+    Validate a recurrence given by preset name or explicit terms.
+
+    Returns:
+        Tuple of (coefficients, initial_terms)
+    """
+    if preset is not None:
+        if coefficients is not None or initial_terms is not None:
+            raise ValueError("Give either a preset or coefficients and initial terms, not both")
+        if preset not in PRESETS:
+            raise ValueError(f"Unknown recurrence preset: {preset}")
+        return PRESETS[preset]
+
+    if not coefficients or initial_terms is None:
+        raise ValueError("A recurrence needs a preset or coefficients and initial terms")
+    if len(coefficients) != len(initial_terms):
+        raise ValueError("Coefficients and initial terms must have the same length")
+    if len(coefficients) > MAX_ORDER:
+        raise ValueError(f"Recurrence order must not exceed {MAX_ORDER}")
+    return tuple(coefficients), tuple(initial_terms)
+
+
+def linear_recurrence(
+    n: int,
+    coefficients: Optional[Sequence[int]] = None,
+    initial_terms: Optional[Sequence[int]] = None,
+    preset: Optional[str] = None,
+    modulus: Optional[int] = None
+) -> int:
+    """
+    n-th term of a linear recurrence, optionally modulo ``modulus``.
+
+    Fibonacci (by preset or by its terms) goes to fast doubling or the
+    backend's native fib; everything else uses Kitamasa's method.
+    """
+    if n < 0:
+        raise ValueError("Recurrence index must be non-negative")
+    coefficients, initial_terms = resolve(coefficients, initial_terms, preset)
+
+    if (coefficients, initial_terms) == PRESETS["fibonacci"]:
+        if modulus is None:
+            return get_backend().fib(n)
+        return fibonacci_pair(n, modulus)[0]
+    return kitamasa(coefficients, initial_terms, n, modulus)
+
+
+def growth_bits(coefficients: Sequence[int]) -> float:
+    """Upper bound on the bits added per term: log2 of the sum of |ci|."""
+    return math.log2(max(sum(abs(c) for c in coefficients), 2))
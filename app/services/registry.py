@@ -0,0 +1,535 @@
+"""Registry of supported operations and how to execute them."""
+import asyncio
+import hashlib
+import json
+import math
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.services import combinatorics
+from app.services import parallel
+from app.services import primes
+from app.services import ratelimit
+from app.services import recurrence
+from app.services import vectorized
+from app.services.backends import get_backend
+from app.services.cache import cache_service
+from app.services.calculator import CalculatorService
+from app.services.scheduler import scheduler
+from app.services.stats import metrics
+
+# Where an operation prefers to run once it is too expensive to run inline
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+EXECUTORS = (INLINE, THREAD, PROCESS)
+
+
+def _always(value: int, exponent: Optional[int] = None) -> bool:
+    return True
+
+
+def _never(value: int, exponent: Optional[int] = None) -> bool:
+    return False
+
+
+def _format_number(value: Any) -> str:
+    """Serialize an int or float; large ints use the backend's fast conversion."""
+    if type(value) is int:
+        return get_backend().to_decimal(value)
+    return str(value)
+
+
+def _parse_number(text: str) -> Any:
+    """Parse a serialized int or float."""
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+@dataclass(frozen=True)
+class OperationSpec:
+    """
+    Everything the service needs to know to run one operation.
+
+    Attributes:
+        name: Operation name as used in requests, cache keys and history
+        compute: Pure function (value, exponent, **params) -> result; must be
+            picklable for the process executor. Coroutine functions are awaited
+            directly and manage their own offloading.
+        estimate_cost: (value, exponent, **params) -> estimated work, in units
+            of result bits for the arithmetic operations
+        cacheable: (value, exponent) -> whether results go through the cache
+        executor: Preferred executor for calls above INLINE_COST_THRESHOLD
+        serialize: Result -> text stored in history
+        deserialize: History text -> result
+        compute_many: Optional vectorized (values, exponents) -> results used
+            by batch requests instead of the cache; None marks an element
+            left to execute()
+        parallel_compute: Optional coroutine (value, exponent) -> result that
+            spreads one call across the process pool
+        parallelizable: (value, exponent) -> whether to use parallel_compute
+        params: Names of the extra keyword parameters compute accepts
+    """
+    name: str
+    compute: Callable[..., Any]
+    estimate_cost: Callable[..., float]
+    cacheable: Callable[[int, Optional[int]], bool] = _always
+    executor: str = INLINE
+    serialize: Callable[[Any], str] = _format_number
+    deserialize: Callable[[str], Any] = _parse_number
+    compute_many: Optional[Callable[[Sequence[int], Sequence[Optional[int]]], List[Any]]] = None
+    parallel_compute: Optional[Callable[[int, Optional[int]], Awaitable[Any]]] = None
+    parallelizable: Callable[[int, Optional[int]], bool] = _never
+    params: Tuple[str, ...] = ()
+
+
+_operations: Dict[str, OperationSpec] = {}
+
+
+def register(spec: OperationSpec) -> OperationSpec:
+    """Add an operation to the registry."""
+    if spec.executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor: {spec.executor}")
+    _operations[spec.name] = spec
+    return spec
+
+
+def get_operation(name: str) -> OperationSpec:
+    """Look up an operation by name."""
+    try:
+        return _operations[name]
+    except KeyError:
+        raise ValueError(f"Unsupported operation: {name}")
+
+
+def operation_names() -> List[str]:
+    """Names of all registered operations."""
+    return list(_operations)
+
+
+def deserialize_result(operation: str, text: str) -> Any:
+    """Parse a history result, including records of unregistered operations."""
+    spec = _operations.get(operation)
+    if spec is not None:
+        return spec.deserialize(text)
+    return json.loads(text) if text.startswith('[') else _parse_number(text)
+
+
+def _check_params(spec: OperationSpec, params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Drop unset parameters and reject ones the operation does not take."""
+    params = {name: value for name, value in (params or {}).items() if value is not None}
+    for name in params:
+        if name not in spec.params:
+            raise ValueError(f"{spec.name} does not accept {name}")
+    return params
+
+
+def request_key(
+    operation: str,
+    value: int,
+    exponent: Optional[int] = None,
+    params: Optional[Dict[str, Any]] = None
+) -> str:
+    """Digest identifying a calculation; equal for requests with equal results."""
+    params = {name: param for name, param in (params or {}).items() if param is not None}
+    text = json.dumps([operation, value, exponent, params], sort_keys=True)
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def estimate_cost(
+    operation: str,
+    value: int,
+    exponent: Optional[int] = None,
+    params: Optional[Dict[str, Any]] = None
+) -> float:
+    """Estimated work for an operation, see OperationSpec.estimate_cost."""
+    spec = get_operation(operation)
+    return spec.estimate_cost(value, exponent, **_check_params(spec, params))
+
+
+async def run(
+    spec: OperationSpec,
+    value: int,
+    exponent: Optional[int] = None,
+    params: Optional[Dict[str, Any]] = None,
+    shed: bool = True
+) -> Tuple[Any, float]:
+    """
+    Compute a result without the cache, on the executor its cost calls for.
+
+    Offloaded computations first wait for a scheduler slot, which they may
+    be refused (OverloadedError) unless ``shed`` is False; the wait is not
+    part of the computation time.
+
+    Returns:
+        Tuple of (result, computation_time_ms)
+    """
+    params = _check_params(spec, params)
+    cost = spec.estimate_cost(value, exponent, **params)
+
+    if _runs_inline(spec, value, exponent, params, cost):
+        start_time = time.time()
+        result = spec.compute(value, exponent, **params)
+    else:
+        async with scheduler.slot(cost, shed=shed):
+            start_time = time.time()
+            result = await _offload(spec, value, exponent, params)
+
+    computation_time = (time.time() - start_time) * 1000
+    return result, computation_time
+
+
+def _parallel(spec: OperationSpec, value: int, exponent: Optional[int], params: Dict[str, Any]) -> bool:
+    return (spec.parallel_compute is not None and not params
+            and spec.parallelizable(value, exponent))
+
+
+def _runs_inline(
+    spec: OperationSpec,
+    value: int,
+    exponent: Optional[int],
+    params: Dict[str, Any],
+    cost: float
+) -> bool:
+    """Whether a computation is cheap enough to run on the event loop."""
+    return (not _parallel(spec, value, exponent, params)
+            and not asyncio.iscoroutinefunction(spec.compute)
+            and (spec.executor == INLINE or cost < settings.INLINE_COST_THRESHOLD))
+
+
+async def _offload(
+    spec: OperationSpec,
+    value: int,
+    exponent: Optional[int],
+    params: Dict[str, Any]
+) -> Any:
+    """Compute off the event loop: across the process pool, as a coroutine, or on an executor."""
+    if _parallel(spec, value, exponent, params):
+        return await spec.parallel_compute(value, exponent)
+    if asyncio.iscoroutinefunction(spec.compute):
+        return await spec.compute(value, exponent, **params)
+    loop = asyncio.get_running_loop()
+    pool = parallel.get_pool() if spec.executor == PROCESS else None
+    return await loop.run_in_executor(pool, partial(spec.compute, **params), value, exponent)
+
+
+async def execute(
+    operation: str,
+    value: int,
+    exponent: Optional[int] = None,
+    params: Optional[Dict[str, Any]] = None,
+    shed: bool = True
+) -> Tuple[Any, float, bool]:
+    """
+    Execute an operation through the cache.
+
+    Cache hits return at once; misses are computed by run(), passing ``shed`` on.
+
+    Returns:
+        Tuple of (result, computation_time_ms, cached)
+    """
+    spec = get_operation(operation)
+    params = _check_params(spec, params)
+    cacheable = spec.cacheable(value, exponent)
+
+    if cacheable:
+        cached_result = await cache_service.get(spec.name, value, exponent, params)
+        if cached_result is not None:
+            return cached_result, 0.0, True
+
+    ratelimit.charge(spec.estimate_cost(value, exponent, **params))
+    result, computation_time = await run(spec, value, exponent, params, shed)
+    metrics.histogram(f"compute.{spec.name}").record(computation_time / 1000)
+
+    if cacheable:
+        # Keep results that were expensive to compute for longer
+        ttl = (settings.CACHE_EXPENSIVE_TTL_SECONDS
+               if computation_time >= settings.CACHE_EXPENSIVE_THRESHOLD_MS else None)
+        await cache_service.set(spec.name, value, result, exponent, params, ttl)
+    return result, computation_time, False
+
+
+async def _run_many(
+    spec: OperationSpec,
+    values: Sequence[int],
+    exponents: Sequence[Optional[int]]
+) -> Tuple[List[Any], float]:
+    """
+    Run ``compute_many`` like run() runs compute: inline when the group is cheap,
+    otherwise on a thread once the scheduler grants a slot.
+
+    Returns:
+        Tuple of (results, computation_time_ms)
+    """
+    cost = sum(spec.estimate_cost(value, exponent) for value, exponent in zip(values, exponents))
+    if cost < settings.INLINE_COST_THRESHOLD:
+        start_time = time.time()
+        results = spec.compute_many(values, exponents)
+    else:
+        async with scheduler.slot(cost):
+            start_time = time.time()
+            results = await asyncio.to_thread(spec.compute_many, values, exponents)
+    return results, (time.time() - start_time) * 1000
+
+
+async def execute_many(
+    requests: Sequence[Tuple[str, int, Optional[int], Optional[Dict[str, Any]]]]
+) -> List[Tuple[Any, float, bool]]:
+    """
+    Execute many operations, vectorizing where an operation supports it.
+
+    Operations with ``compute_many`` and no extra parameters are evaluated
+    together and bypass the cache (recomputing them is cheaper than a
+    lookup). Elements ``compute_many`` leaves out, such as powers too large
+    for machine types, go through execute() like every other request, so
+    they are cached and offloaded under the scheduler.
+
+    Args:
+        requests: (operation, value, exponent, params) tuples
+
+    Returns:
+        (result, computation_time_ms, cached) per request, in order
+    """
+    outcomes: List[Optional[Tuple[Any, float, bool]]] = [None] * len(requests)
+    vector_groups: Dict[str, List[int]] = defaultdict(list)
+
+    for i, (operation, value, exponent, params) in enumerate(requests):
+        spec = get_operation(operation)
+        if spec.compute_many is not None and not _check_params(spec, params):
+            vector_groups[operation].append(i)
+
+    for operation, indices in vector_groups.items():
+        spec = get_operation(operation)
+        results, elapsed = await _run_many(
+            spec, [requests[i][1] for i in indices], [requests[i][2] for i in indices]
+        )
+        done = [(i, result) for i, result in zip(indices, results) if result is not None]
+        if done:
+            ratelimit.charge(sum(spec.estimate_cost(*requests[i][1:3]) for i, _ in done))
+        for i, result in done:
+            outcomes[i] = (result, elapsed / len(done), False)
+
+    for i, (operation, value, exponent, params) in enumerate(requests):
+        if outcomes[i] is None:
+            outcomes[i] = await execute(operation, value, exponent, params)
+
+    return outcomes
+
+
+def _power_cost(value: int, exponent: Optional[int] = None, **params) -> float:
+    if exponent < 0:
+        return 64.0
+    magnitude = abs(value)
+    if magnitude <= 1:
+        return 1.0
+    return exponent * math.log2(magnitude)
+
+
+def _fibonacci(value: int, exponent: Optional[int] = None, modulus: Optional[int] = None) -> int:
+    if value < 0:
+        raise ValueError("Fibonacci is not defined for negative numbers")
+    return recurrence.linear_recurrence(value, preset="fibonacci", modulus=modulus)
+
+
+def _fibonacci_cost(value: int, exponent: Optional[int] = None, **params) -> float:
+    if params.get("modulus") is not None:
+        return max(value, 1).bit_length() * params["modulus"].bit_length()
+    # log2 of the golden ratio
+    return 0.6942 * max(value, 0) + 1
+
+
+def _linear_recurrence(value: int, exponent: Optional[int] = None, **params) -> int:
+    return recurrence.linear_recurrence(value, **params)
+
+
+def _linear_recurrence_cost(value: int, exponent: Optional[int] = None, **params) -> float:
+    coefficients, _ = recurrence.resolve(
+        params.get("coefficients"), params.get("initial_terms"), params.get("preset")
+    )
+    order = len(coefficients)
+    if params.get("modulus") is not None:
+        return order * order * max(value, 1).bit_length() * params["modulus"].bit_length()
+    return order * recurrence.growth_bits(coefficients) * max(value, 0) + 1
+
+
+def _factorial(value: int, exponent: Optional[int] = None) -> int:
+    if value < 0:
+        raise ValueError("Factorial is not defined for negative numbers")
+    return get_backend().fac(value)
+
+
+async def _factorial_parallel(value: int, exponent: Optional[int] = None) -> int:
+    return await parallel.parallel_product_range(2, value + 1)
+
+
+def _factorial_parallelizable(value: int, exponent: Optional[int] = None) -> bool:
+    return parallel.should_parallelize(value)
+
+
+def _factorial_cost(value: int, exponent: Optional[int] = None, **params) -> float:
+    return math.lgamma(max(value, 0) + 1) / math.log(2) + 1
+
+
+register(OperationSpec(
+    name="power",
+    compute=CalculatorService._power_value,
+    estimate_cost=_power_cost,
+    executor=THREAD,
+    compute_many=vectorized.power_small,
+))
+
+register(OperationSpec(
+    name="fibonacci",
+    compute=_fibonacci,
+    estimate_cost=_fibonacci_cost,
+    executor=THREAD,
+    deserialize=int,
+    params=("modulus",),
+))
+
+register(OperationSpec(
+    name="linear_recurrence",
+    compute=_linear_recurrence,
+    estimate_cost=_linear_recurrence_cost,
+    executor=THREAD,
+    deserialize=int,
+    params=("coefficients", "initial_terms", "preset", "modulus"),
+))
+
+register(OperationSpec(
+    name="factorial",
+    compute=_factorial,
+    estimate_cost=_factorial_cost,
+    executor=PROCESS,
+    deserialize=int,
+    parallel_compute=_factorial_parallel,
+    parallelizable=_factorial_parallelizable,
+))
+
+
+def _is_prime(value: int, exponent: Optional[int] = None) -> bool:
+    return primes.is_prime(value)
+
+
+def _next_prime(value: int, exponent: Optional[int] = None) -> int:
+    return primes.next_prime(value)
+
+
+def _primality_cost(value: int, exponent: Optional[int] = None, **params) -> float:
+    # Each modular exponentiation is ~bits^2 word operations
+    bits = max(abs(value).bit_length(), 1)
+    return bits * bits / 64
+
+
+def _next_prime_cost(value: int, exponent: Optional[int] = None, **params) -> float:
+    # Expected gap ~ ln(value) candidates, half of them odd
+    bits = max(abs(value).bit_length(), 1)
+    return _primality_cost(value) * bits * 0.35
+
+
+def _check_prime_range(value: int) -> None:
+    if value > settings.PRIME_COUNT_MAX:
+        raise ValueError(f"Prime counting is limited to {settings.PRIME_COUNT_MAX}")
+
+
+async def _prime_count(value: int, exponent: Optional[int] = None) -> int:
+    _check_prime_range(value)
+    return await primes.prime_count(value, settings.PRIME_SIEVE_LIMIT)
+
+
+async def _nth_prime(value: int, exponent: Optional[int] = None) -> int:
+    _check_prime_range(primes.nth_prime_estimate(value))
+    return await primes.nth_prime(value, settings.PRIME_SIEVE_LIMIT)
+
+
+def _prime_count_cost(value: int, exponent: Optional[int] = None, **params) -> float:
+    return max(value, 1) ** 0.75
+
+
+def _nth_prime_cost(value: int, exponent: Optional[int] = None, **params) -> float:
+    return _prime_count_cost(primes.nth_prime_estimate(max(value, 1)))
+
+
+register(OperationSpec(
+    name="is_prime",
+    compute=_is_prime,
+    estimate_cost=_primality_cost,
+    executor=THREAD,
+    serialize=json.dumps,
+    deserialize=json.loads,
+))
+
+register(OperationSpec(
+    name="next_prime",
+    compute=_next_prime,
+    estimate_cost=_next_prime_cost,
+    executor=THREAD,
+    deserialize=int,
+))
+
+register(OperationSpec(
+    name="nth_prime",
+    compute=_nth_prime,
+    estimate_cost=_nth_prime_cost,
+    deserialize=int,
+))
+
+register(OperationSpec(
+    name="prime_count",
+    compute=_prime_count,
+    estimate_cost=_prime_count_cost,
+    deserialize=int,
+))
+
+
+def _binomial(value: int, exponent: Optional[int] = None, modulus: Optional[int] = None) -> int:
+    return combinatorics.binomial(value, exponent, modulus, settings.COMBINATORICS_SIEVE_LIMIT)
+
+
+def _binomial_cost(value: int, exponent: Optional[int] = None, **params) -> float:
+    k = min(exponent, value - exponent) if 0 <= exponent <= value else 0
+    modulus = params.get("modulus")
+    if modulus is not None and (
+        value <= settings.COMBINATORICS_SIEVE_LIMIT
+        or combinatorics.squarefree_prime_factors(modulus) is not None
+    ):
+        # Lucas digits or one pass over the primes up to n
+        return float(min(k, value) + 1)
+    # Otherwise the exact coefficient is computed, then reduced
+    return (math.lgamma(value + 1) - math.lgamma(k + 1) - math.lgamma(value - k + 1)) / math.log(2) + 1
+
+
+def _permutation(value: int, exponent: Optional[int] = None, modulus: Optional[int] = None) -> int:
+    return combinatorics.permutation(value, exponent, modulus)
+
+
+def _permutation_cost(value: int, exponent: Optional[int] = None, **params) -> float:
+    k = exponent if 0 <= exponent <= value else 0
+    if params.get("modulus") is not None:
+        return float(k + 1)
+    return (math.lgamma(value + 1) - math.lgamma(value - k + 1)) / math.log(2) + 1
+
+
+register(OperationSpec(
+    name="binomial",
+    compute=_binomial,
+    estimate_cost=_binomial_cost,
+    executor=THREAD,
+    deserialize=int,
+    params=("modulus",),
+))
+
+register(OperationSpec(
+    name="permutation",
+    compute=_permutation,
+    estimate_cost=_permutation_cost,
+    executor=THREAD,
+    deserialize=int,
+    params=("modulus",),
+))
@@ -0,0 +1,228 @@
+"""History retention: old operation history moves to compressed NDJSON archives."""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
+from app.models.database import OperationHistory
+from app.services.history import recent_history
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+_LABEL_FORMAT = "%Y%m%dT%H%M"
+# history-<bucket start>-<bucket end>-<first id>-<last id>.ndjson.gz
+_FILE_PATTERN = re.compile(r"history-(\d{8}T\d{4})-(\d{8}T\d{4})-(\d+)-(\d+)\.ndjson\.gz$")
+_COLUMNS = (
+    "id", "operation", "input_value", "exponent", "result",
+    "computation_time_ms", "created_at", "ip_address"
+)
+# SQLite limits the number of bound parameters per statement
+_DELETE_CHUNK = 500
+
+
+def _row_to_record(row: OperationHistory) -> Dict[str, Any]:
+    record = {column: getattr(row, column) for column in _COLUMNS}
+    record["created_at"] = row.created_at.isoformat()
+    return record
+
+
+def record_to_row(record: Dict[str, Any]) -> OperationHistory:
+    """An archived record as a (detached) history row."""
+    return OperationHistory(**{
+        **record, "created_at": datetime.fromisoformat(record["created_at"])
+    })
+
+
+class HistoryArchiver:
+    """
+    Moves operation history older than the retention window into archive files.
+
+    Rows are bucketed by creation time (HISTORY_ARCHIVE_BUCKET_HOURS) and
+    only buckets that lie wholly outside the window are archived, oldest
+    first, in batches. Each batch is written per bucket to a gzipped NDJSON
+    file named by the bucket's time span and the batch's id range, made
+    visible by an atomic rename, and only then deleted from the database.
+    Because the names are derived from the rows, archiving the same rows
+    twice (after a crash, or from two workers) rewrites the same file.
+
+    The hot table therefore holds only the retention window; SQLite reuses
+    the freed pages, so it stops growing.
+    """
+
+    def __init__(
+        self,
+        directory: str = None,
+        retention_days: float = None,
+        bucket_hours: int = None,
+        batch_size: int = None,
+        session_factory=AsyncSessionLocal
+    ):
+        """
+        Args:
+            directory: Where archives are written; defaults to HISTORY_ARCHIVE_DIR
+            retention_days: Age beyond which rows are archived; defaults to
+                HISTORY_RETENTION_DAYS (0 disables archiving)
+            bucket_hours: Time span of one archive bucket; defaults to HISTORY_ARCHIVE_BUCKET_HOURS
+            batch_size: Rows read, written and deleted at a time; defaults to HISTORY_ARCHIVE_BATCH
+            session_factory: Database session factory
+        """
+        self.directory = Path(directory or settings.HISTORY_ARCHIVE_DIR)
+        self.retention_days = (settings.HISTORY_RETENTION_DAYS
+                               if retention_days is None else retention_days)
+        self.bucket = timedelta(hours=bucket_hours or settings.HISTORY_ARCHIVE_BUCKET_HOURS)
+        self.batch_size = batch_size or settings.HISTORY_ARCHIVE_BATCH
+        self._session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+
+    def _bucket_start(self, moment: datetime) -> datetime:
+        return _EPOCH + (moment - _EPOCH) // self.bucket * self.bucket
+
+    def cutoff(self, now: Optional[datetime] = None) -> datetime:
+        """Rows created before this are archived: the start of the oldest bucket still kept."""
+        now = now or datetime.utcnow()
+        return self._bucket_start(now - timedelta(days=self.retention_days))
+
+    def _write(self, bucket_start: datetime, records: List[Dict[str, Any]]) -> Path:
+        """Write one bucket's share of a batch to its archive file."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = (
+            f"history-{bucket_start.strftime(_LABEL_FORMAT)}"
+            f"-{(bucket_start + self.bucket).strftime(_LABEL_FORMAT)}"
+            f"-{min(r['id'] for r in records)}-{max(r['id'] for r in records)}.ndjson.gz"
+        )
+        path = self.directory / name
+        partial = path.with_name(name + ".tmp")
+        with open(partial, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+                for record in records:
+                    archive.write(json.dumps(record).encode())
+                    archive.write(b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(partial, path)
+        return path
+
+    def _write_batch(self, records: List[Dict[str, Any]]) -> None:
+        for bucket_start, group in groupby(
+            records, key=lambda r: self._bucket_start(datetime.fromisoformat(r["created_at"]))
+        ):
+            self._write(bucket_start, list(group))
+
+    async def archive(self, now: Optional[datetime] = None) -> int:
+        """
+        Archive every row older than the retention window.
+
+        Returns:
+            Number of rows moved out of the database
+        """
+        if self.retention_days <= 0:
+            return 0
+        cutoff = self.cutoff(now)
+        moved = 0
+        while True:
+            async with self._session_factory() as db:
+                records = [_row_to_record(row) for row in (await db.execute(
+                    select(OperationHistory)
+                    .where(OperationHistory.created_at < cutoff)
+                    .order_by(OperationHistory.created_at, OperationHistory.id)
+                    .limit(self.batch_size)
+                )).scalars()]
+            # The connection is released so writers are not held up while files are compressed
+            if not records:
+                return moved
+
+            await asyncio.to_thread(self._write_batch, records)
+            ids = [record["id"] for record in records]
+            async with self._session_factory() as db:
+                for start in range(0, len(ids), _DELETE_CHUNK):
+                    await db.execute(delete(OperationHistory).where(
+                        OperationHistory.id.in_(ids[start:start + _DELETE_CHUNK])
+                    ))
+                await db.commit()
+            recent_history.discard_before(cutoff)
+            moved += len(records)
+
+    def files(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> List[Tuple[datetime, datetime, Path]]:
+        """Archive files whose buckets overlap [start, end), oldest first."""
+        if not self.directory.is_dir():
+            return []
+        found = []
+        for path in self.directory.iterdir():
+            match = _FILE_PATTERN.match(path.name)
+            if match is None:
+                continue
+            bucket_start = datetime.strptime(match.group(1), _LABEL_FORMAT)
+            bucket_end = datetime.strptime(match.group(2), _LABEL_FORMAT)
+            if (start is None or bucket_end > start) and (end is None or bucket_start < end):
+                found.append((bucket_start, int(match.group(3)), bucket_end, path))
+        return [(bucket_start, bucket_end, path)
+                for bucket_start, _, bucket_end, path in sorted(found)]
+
+    def read(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        operation: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Archived records created in [start, end), optionally of one operation, oldest first."""
+        start_text = start.isoformat() if start is not None else None
+        end_text = end.isoformat() if end is not None else None
+        for _, _, path in self.files(start, end):
+            with gzip.open(path, "rb") as archive:
+                for line in archive:
+                    record = json.loads(line)
+                    # ISO 8601 timestamps without offsets order as text
+                    created_at = record["created_at"]
+                    if start_text is not None and created_at < start_text:
+                        continue
+                    if end_text is not None and created_at >= end_text:
+                        continue
+                    if operation is not None and record["operation"] != operation:
+                        continue
+                    yield record
+
+    async def _run(self, interval: float) -> None:
+        while True:
+            try:
+                moved = await self.archive()
+                if moved:
+                    logger.info(f"Archived {moved} history rows to {self.directory}")
+            except Exception:
+                logger.exception("History archiving failed; retrying next interval")
+            await asyncio.sleep(interval)
+
+    def start(self, interval: Optional[float] = None) -> None:
+        """Start archiving on a schedule, if a retention window is configured."""
+        if self.retention_days > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(
+                self._run(interval or settings.HISTORY_ARCHIVE_INTERVAL_SECONDS)
+            )
+
+    async def stop(self) -> None:
+        """Stop the archiving task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global archiver instance
+history_archiver = HistoryArchiver()
@@ -0,0 +1,265 @@
+"""Per-operation analytics rolled up by minute and hour as calculations are recorded."""
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+
+from app.core.config import settings
+from app.db.base import AsyncReadSessionLocal, AsyncSessionLocal
+from app.models.database import OperationRollup
+from app.services.stats import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+MINUTE = "minute"
+HOUR = "hour"
+GRANULARITIES = {MINUTE: timedelta(minutes=1), HOUR: timedelta(hours=1)}
+# Buckets covered by a query without a start
+DEFAULT_BUCKETS = 60
+
+_EPOCH = datetime(1970, 1, 1)
+
+# (granularity, bucket start, operation)
+RollupKey = Tuple[str, datetime, str]
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    """Start of the ``granularity`` bucket holding ``moment``."""
+    width = GRANULARITIES[granularity]
+    return _EPOCH + (moment - _EPOCH) // width * width
+
+
+class _Aggregate:
+    """Calls, cache hits and computation times of one operation over one bucket."""
+
+    __slots__ = ("count", "cache_hits", "computation")
+
+    def __init__(self):
+        self.count = 0
+        self.cache_hits = 0
+        # Misses only: a hit computes nothing
+        self.computation = LatencyHistogram()
+
+    @classmethod
+    def from_row(cls, row: OperationRollup) -> "_Aggregate":
+        aggregate = cls()
+        aggregate.count = row.count
+        aggregate.cache_hits = row.cache_hits
+        aggregate.computation = LatencyHistogram.from_dict(json.loads(row.sketch))
+        return aggregate
+
+    def add(self, cached: bool, computation_time_ms: float) -> None:
+        self.count += 1
+        if cached:
+            self.cache_hits += 1
+        else:
+            self.computation.record(computation_time_ms / 1000)
+
+    def merge(self, other: "_Aggregate") -> None:
+        self.count += other.count
+        self.cache_hits += other.cache_hits
+        self.computation.merge(other.computation)
+
+    def store(self, row: OperationRollup) -> None:
+        row.count = self.count
+        row.cache_hits = self.cache_hits
+        row.sketch = json.dumps(self.computation.to_dict())
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "cache_hits": self.cache_hits,
+            "cache_hit_ratio": self.cache_hits / self.count if self.count else 0.0,
+            "computation": self.computation.snapshot(),
+        }
+
+
+class OperationRollups:
+    """
+    Call counts, cache-hit ratios and computation-time percentiles per operation,
+    per minute and per hour.
+
+    Each recorded calculation is added to in-memory aggregates for its
+    minute and hour; every ROLLUP_FLUSH_INTERVAL_SECONDS they are merged
+    into the operation_rollups table, one row per bucket and operation.
+    Computation times are kept as log-bucketed histograms, which merge by
+    adding counts, so aggregates from any number of flushes and worker
+    processes combine into the same percentiles (within the histogram's
+    ~12% resolution). A dashboard query then reads one row per bucket
+    instead of scanning operation history.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = None,
+        session_factory=AsyncSessionLocal,
+        read_session_factory=AsyncReadSessionLocal
+    ):
+        """
+        Args:
+            flush_interval: Seconds between writes; defaults to ROLLUP_FLUSH_INTERVAL_SECONDS
+            session_factory: Database session factory for writes
+            read_session_factory: Database session factory for queries
+        """
+        self.flush_interval = flush_interval or settings.ROLLUP_FLUSH_INTERVAL_SECONDS
+        self._session_factory = session_factory
+        self._read_session_factory = read_session_factory
+        self._pending: Dict[RollupKey, _Aggregate] = {}
+        # One flush at a time, so a failed flush's counts are put back before the next
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _aggregate(self, key: RollupKey) -> _Aggregate:
+        aggregate = self._pending.get(key)
+        if aggregate is None:
+            aggregate = self._pending[key] = _Aggregate()
+        return aggregate
+
+    def record(
+        self,
+        operation: str,
+        cached: bool,
+        computation_time_ms: float,
+        moment: Optional[datetime] = None
+    ) -> None:
+        """Count one calculation made at ``moment`` (default now, UTC)."""
+        moment = moment or datetime.utcnow()
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(moment, granularity), operation)
+            self._aggregate(key).add(cached, computation_time_ms)
+
+    async def _merge(self, db, pending: Dict[RollupKey, _Aggregate]) -> None:
+        """Add pending aggregates to their rows, creating the rows that do not exist yet."""
+        existing: Dict[RollupKey, OperationRollup] = {}
+        for granularity in {key[0] for key in pending}:
+            starts = {key[1] for key in pending if key[0] == granularity}
+            rows = (await db.execute(
+                select(OperationRollup)
+                .where(OperationRollup.granularity == granularity)
+                .where(OperationRollup.bucket_start.in_(starts))
+                # Servers lock the rows being merged into; SQLite already has a single writer
+                .with_for_update()
+            )).scalars()
+            for row in rows:
+                existing[(row.granularity, row.bucket_start, row.operation)] = row
+
+        for key, aggregate in pending.items():
+            row = existing.get(key)
+            if row is None:
+                row = OperationRollup(granularity=key[0], bucket_start=key[1], operation=key[2])
+                aggregate.store(row)
+                db.add(row)
+            else:
+                merged = _Aggregate.from_row(row)
+                merged.merge(aggregate)
+                merged.store(row)
+
+    async def flush(self) -> int:
+        """
+        Write pending aggregates to the database.
+
+        Returns:
+            Number of rollup rows updated or created
+        """
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            try:
+                async with self._session_factory() as db:
+                    await self._merge(db, pending)
+                    cutoff = datetime.utcnow() - timedelta(days=settings.ROLLUP_MINUTE_RETENTION_DAYS)
+                    await db.execute(
+                        delete(OperationRollup)
+                        .where(OperationRollup.granularity == MINUTE)
+                        .where(OperationRollup.bucket_start < cutoff)
+                    )
+                    await db.commit()
+            except Exception:
+                # Nothing was written; keep the counts for the next flush
+                for key, aggregate in pending.items():
+                    self._aggregate(key).merge(aggregate)
+                raise
+            return len(pending)
+
+    async def query(
+        self,
+        granularity: str = MINUTE,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        operation: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Rollups of buckets starting in [start, end), oldest first.
+
+        Counts this process has not flushed yet are included. Bounds are
+        naive UTC; ``end`` defaults to now and ``start`` to DEFAULT_BUCKETS
+        buckets before it.
+
+        Raises:
+            ValueError: If the granularity is unknown
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        end = end or datetime.utcnow()
+        start = bucket_start(start or end - DEFAULT_BUCKETS * GRANULARITIES[granularity], granularity)
+
+        query = (
+            select(OperationRollup)
+            .where(OperationRollup.granularity == granularity)
+            .where(OperationRollup.bucket_start >= start)
+            .where(OperationRollup.bucket_start < end)
+        )
+        if operation is not None:
+            query = query.where(OperationRollup.operation == operation)
+        async with self._read_session_factory() as db:
+            rows = (await db.execute(query)).scalars().all()
+        aggregates = {(row.bucket_start, row.operation): _Aggregate.from_row(row) for row in rows}
+
+        for (key_granularity, key_start, key_operation), pending in list(self._pending.items()):
+            if (key_granularity != granularity or not start <= key_start < end
+                    or operation is not None and key_operation != operation):
+                continue
+            aggregate = aggregates.get((key_start, key_operation))
+            if aggregate is None:
+                aggregate = aggregates[(key_start, key_operation)] = _Aggregate()
+            aggregate.merge(pending)
+
+        return [
+            {"bucket_start": key_start, "operation": key_operation, **aggregate.summary()}
+            for (key_start, key_operation), aggregate in sorted(aggregates.items())
+        ]
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Writing operation rollups failed; retrying next interval")
+
+    def start(self) -> None:
+        """Start writing rollups on a schedule."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the schedule and write what is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Writing operation rollups failed at shutdown")
+
+
+# Global rollups instance
+operation_rollups = OperationRollups()
@@ -0,0 +1,176 @@
+"""Consistent-hash routing of requests to the node that caches their result."""
+import asyncio
+import bisect
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Set on forwarded requests so the receiving node never forwards them again
+FORWARDED_HEADER = "x-math-ops-forwarded-by"
+# Set on forwarded requests to the address of the client that sent them
+CLIENT_HEADER = "x-math-ops-client"
+# Set on forwarded requests to CLUSTER_SECRET, proving they come from a peer
+SECRET_HEADER = "x-math-ops-cluster-secret"
+# Set on responses to say which node computed them
+NODE_HEADER = "x-math-ops-node"
+
+
+def _position(label: str) -> int:
+    return int.from_bytes(hashlib.blake2b(label.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent-hash ring with virtual nodes.
+
+    Each node is placed at ``replicas`` points on a 64-bit ring and a key
+    belongs to the first point clockwise from its hash, so adding or
+    removing a node only moves the keys on the arcs it owned.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = None):
+        self.replicas = replicas or settings.CLUSTER_VIRTUAL_NODES
+        self.nodes: List[str] = sorted(set(nodes))
+        points = sorted(
+            (_position(f"{node}#{replica}"), node)
+            for node in self.nodes for replica in range(self.replicas)
+        )
+        self._positions = [position for position, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> Optional[str]:
+        """The node that owns ``key``, or None if the ring is empty."""
+        if not self._positions:
+            return None
+        index = bisect.bisect(self._positions, _position(key)) % len(self._positions)
+        return self._owners[index]
+
+
+class ClusterRouter:
+    """
+    Ring membership, health checks and forwarding for one node of a cluster.
+
+    Peers that fail a health check or a forwarded request leave the ring
+    until they pass a health check again; this node never leaves it, so
+    with every peer down all keys are computed locally.
+    """
+
+    def __init__(
+        self,
+        node_url: str = None,
+        peers: Iterable[str] = None,
+        replicas: int = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Args:
+            node_url: This node's base URL as its peers reach it
+            peers: Base URLs of the cluster's nodes; this node may be included
+            replicas: Virtual nodes per node on the ring
+            transport: httpx transport for forwarded requests and health checks
+        """
+        self.node_url = (node_url or settings.CLUSTER_NODE_URL).rstrip("/")
+        self.peers = sorted(
+            {peer.rstrip("/") for peer in (peers or settings.CLUSTER_PEERS)} - {self.node_url}
+        )
+        self._replicas = replicas
+        self._healthy = set(self.peers)
+        self.ring = HashRing([self.node_url, *self.peers], replicas)
+        # One pooled client, so forwarded requests reuse keep-alive connections
+        self._client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(settings.CLUSTER_FORWARD_TIMEOUT_SECONDS, connect=1.0),
+            limits=httpx.Limits(
+                max_connections=settings.CLUSTER_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.CLUSTER_MAX_CONNECTIONS
+            )
+        )
+        self._health_task: Optional[asyncio.Task] = None
+
+    def owner(self, operation: str, value: int, exponent: Optional[int] = None) -> str:
+        """The node responsible for computing and caching this request."""
+        return self.ring.node_for(f"{operation}:{value}:{exponent}")
+
+    def _set_health(self, peer: str, healthy: bool) -> None:
+        if healthy == (peer in self._healthy):
+            return
+        if healthy:
+            self._healthy.add(peer)
+            logger.info(f"Peer {peer} is healthy; adding it to the ring")
+        else:
+            self._healthy.discard(peer)
+            logger.warning(f"Peer {peer} is unreachable; removing it from the ring")
+        self.ring = HashRing([self.node_url, *self._healthy], self._replicas)
+
+    def mark_down(self, peer: str) -> None:
+        """Take a peer out of the ring until its next successful health check."""
+        self._set_health(peer, False)
+
+    async def forward(
+        self,
+        peer: str,
+        method: str,
+        path: str,
+        body: bytes,
+        headers: Dict[str, str]
+    ) -> httpx.Response:
+        """Send a request to ``peer``, marked so that it will not be forwarded again."""
+        headers = {**headers, FORWARDED_HEADER: self.node_url}
+        if settings.CLUSTER_SECRET:
+            headers[SECRET_HEADER] = settings.CLUSTER_SECRET
+        return await self._client.request(method, peer + path, content=body, headers=headers)
+
+    async def check_health(self) -> None:
+        """Probe every peer's health endpoint and update ring membership."""
+        async def probe(peer: str) -> None:
+            try:
+                response = await self._client.get(
+                    f"{peer}{settings.API_V1_STR}/health",
+                    timeout=settings.CLUSTER_HEALTH_TIMEOUT_SECONDS
+                )
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            self._set_health(peer, healthy)
+
+        await asyncio.gather(*(probe(peer) for peer in self.peers))
+
+    async def _run_health_checks(self, interval: float) -> None:
+        while True:
+            await self.check_health()
+            await asyncio.sleep(interval)
+
+    def start_health_checks(self, interval: Optional[float] = None) -> None:
+        """Start probing peers in the background."""
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(
+                self._run_health_checks(interval or settings.CLUSTER_HEALTH_INTERVAL_SECONDS)
+            )
+
+    async def close(self) -> None:
+        """Stop health checks and close pooled connections."""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+        await self._client.aclose()
+
+
+def create_cluster_router() -> Optional[ClusterRouter]:
+    """The cluster router, if CLUSTER_PEERS and CLUSTER_NODE_URL configure one."""
+    if not settings.CLUSTER_PEERS or not settings.CLUSTER_NODE_URL:
+        return None
+    return ClusterRouter()
+
+
+# Global router; None when running as a single node
+cluster_router = create_cluster_router()
@@ -0,0 +1,206 @@
+"""Admission control for computations: bounded concurrency, priority lanes and load shedding."""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from app.core.config import settings
+from app.services.stats import MetricsRegistry, metrics as default_metrics
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+
+class OverloadedError(Exception):
+    """No slot freed up for a computation before its lane's deadline."""
+
+    def __init__(self, lane: str, retry_after: float):
+        super().__init__(f"Service overloaded: no capacity for {lane} work, retry later")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class _Lane:
+    def __init__(self, name: str, weight: int, limit: int, timeout: float):
+        self.name = name
+        self.weight = weight
+        # Slots this lane may hold at once
+        self.limit = limit
+        # Longest a computation waits for a slot before it is shed
+        self.timeout = timeout
+        # Futures resolved when granted a slot; abandoned ones are skipped when reached
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.waiting = 0
+        self.running = 0
+        # Smooth weighted round-robin state
+        self.current = 0
+
+
+class AdmissionScheduler:
+    """
+    Bounds the computations running at once and picks which waiting one runs next.
+
+    Computations estimated below SCHEDULER_BULK_COST are interactive, the
+    rest bulk. Bulk work may hold at most ``bulk_limit`` of the
+    ``max_concurrent`` slots, so cheap requests always have a slot to get;
+    when one frees, lanes with waiters are served by smooth weighted round
+    robin, so neither starves. A computation still waiting at its lane's
+    deadline, or arriving at a full queue, is shed with OverloadedError:
+    under a spike, requests fail fast instead of all getting slow.
+
+    Only offloaded computations come through here; cache hits and inline
+    work never wait, and neither do endpoints such as /health.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = None,
+        bulk_limit: int = None,
+        max_queue: int = None,
+        metrics: MetricsRegistry = default_metrics
+    ):
+        """
+        Args:
+            max_concurrent: Computations running at once; defaults to
+                SCHEDULER_MAX_CONCURRENT, or two per CPU
+            bulk_limit: Slots bulk work may hold; defaults to SCHEDULER_BULK_MAX_CONCURRENT,
+                or half of max_concurrent
+            max_queue: Computations one lane may have waiting; defaults to SCHEDULER_MAX_QUEUE
+            metrics: Registry for wait times and shedding counts
+        """
+        self.max_concurrent = max(
+            2, max_concurrent or settings.SCHEDULER_MAX_CONCURRENT or 2 * (os.cpu_count() or 1)
+        )
+        bulk_limit = bulk_limit or settings.SCHEDULER_BULK_MAX_CONCURRENT or self.max_concurrent // 2
+        self.max_queue = max_queue or settings.SCHEDULER_MAX_QUEUE
+        self.metrics = metrics
+        self._lanes = {
+            INTERACTIVE: _Lane(
+                INTERACTIVE, settings.SCHEDULER_INTERACTIVE_WEIGHT, self.max_concurrent,
+                settings.SCHEDULER_INTERACTIVE_TIMEOUT_SECONDS
+            ),
+            # Always leave interactive work at least one slot
+            BULK: _Lane(
+                BULK, settings.SCHEDULER_BULK_WEIGHT, min(bulk_limit, self.max_concurrent - 1),
+                settings.SCHEDULER_BULK_TIMEOUT_SECONDS
+            ),
+        }
+        self._running = 0
+
+    def lane_for(self, cost: float) -> str:
+        """The lane for a computation of estimated ``cost``."""
+        return INTERACTIVE if cost < settings.SCHEDULER_BULK_COST else BULK
+
+    def _can_start(self, lane: _Lane) -> bool:
+        return self._running < self.max_concurrent and lane.running < lane.limit
+
+    def _start(self, lane: _Lane) -> None:
+        self._running += 1
+        lane.running += 1
+
+    def _next_lane(self) -> Optional[_Lane]:
+        """Smooth weighted round robin over lanes that have waiters and may start one."""
+        eligible = [lane for lane in self._lanes.values() if lane.waiting and self._can_start(lane)]
+        if not eligible:
+            return None
+        for lane in eligible:
+            lane.current += lane.weight
+        chosen = max(eligible, key=lambda lane: lane.current)
+        chosen.current -= sum(lane.weight for lane in eligible)
+        return chosen
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters; a slot is taken on the waiter's behalf when granted."""
+        while (lane := self._next_lane()) is not None:
+            while lane.waiters:
+                waiter = lane.waiters.popleft()
+                if not waiter.done():
+                    lane.waiting -= 1
+                    self._start(lane)
+                    waiter.set_result(None)
+                    break
+
+    def _release(self, lane: _Lane) -> None:
+        self._running -= 1
+        lane.running -= 1
+        self._dispatch()
+
+    async def _wait(self, lane: _Lane, timeout: Optional[float]) -> None:
+        if lane.waiting >= self.max_queue:
+            raise OverloadedError(lane.name, lane.timeout)
+        waiter = asyncio.get_running_loop().create_future()
+        lane.waiters.append(waiter)
+        lane.waiting += 1
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            lane.waiting -= 1
+            raise OverloadedError(lane.name, lane.timeout)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted a slot just as the request went away: pass it on
+                self._release(lane)
+            else:
+                lane.waiting -= 1
+            raise
+
+    @asynccontextmanager
+    async def slot(self, cost: float, shed: bool = True) -> AsyncIterator[str]:
+        """
+        Hold a computation slot for the duration of the block.
+
+        Args:
+            cost: Estimated work, which selects the lane
+            shed: Whether to give up at the lane's deadline; background jobs wait
+
+        Yields:
+            The lane the computation ran in
+
+        Raises:
+            OverloadedError: If shed and no slot freed up in time
+        """
+        lane = self._lanes[self.lane_for(cost)]
+        start = time.perf_counter()
+        if not lane.waiting and self._can_start(lane):
+            self._start(lane)
+        else:
+            try:
+                await self._wait(lane, lane.timeout if shed else None)
+            except OverloadedError:
+                self.metrics.counter(f"scheduler.shed.{lane.name}").add()
+                raise
+        self.metrics.histogram(f"scheduler.wait.{lane.name}").record(time.perf_counter() - start)
+        try:
+            yield lane.name
+        finally:
+            self._release(lane)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Slots in use and queue depth per lane."""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self._running,
+            "lanes": {
+                lane.name: {
+                    "running": lane.running,
+                    "waiting": lane.waiting,
+                    "limit": lane.limit,
+                    "weight": lane.weight,
+                    "timeout_seconds": lane.timeout,
+                }
+                for lane in self._lanes.values()
+            }
+        }
+
+
+def retry_after(error: OverloadedError) -> str:
+    """Retry-After header value for a shed request."""
+    return str(max(1, math.ceil(error.retry_after)))
+
+
+# Global scheduler instance
+scheduler = AdmissionScheduler()
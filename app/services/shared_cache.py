@@ -0,0 +1,346 @@
+"""Result cache in shared memory, shared by every worker process on a host."""
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from app.core.config import settings
+from app.services.cache import CacheService
+from app.services.stats import CacheMetrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - fcntl is POSIX only
+    fcntl = None
+
+_MAGIC = b"MOSC"
+_VERSION = 1
+
+# magic, version, slot count, arena size, arena head (absolute write position)
+_HEADER = struct.Struct("<4sIQQQ")
+_HEAD_OFFSET = 4 + 4 + 8 + 8
+# key digest, expires_at (epoch seconds), arena position, payload length
+_SLOT = struct.Struct("<16sdQI4x")
+
+# Slots probed per key; a key lives in one bucket of this many slots
+BUCKET_SLOTS = 8
+
+# Results larger than this fraction of the arena are not cached
+_MAX_PAYLOAD_FRACTION = 4
+
+_EMPTY_SLOT = bytes(_SLOT.size)
+
+# Segments are files here, mapped by every worker; /dev/shm keeps them in RAM
+SEGMENT_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# fcntl lock bytes: segment setup, arena reservation, then one per stripe
+_INIT_LOCK = 0
+_ARENA_LOCK = 1
+_STRIPE_BASE = 2
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+
+class SharedMemoryCache(CacheService):
+    """
+    Fixed-slot hash table plus a ring arena in one shared memory segment.
+
+    Keys are 16-byte BLAKE2b digests hashed into buckets of BUCKET_SLOTS
+    slots; a full bucket evicts the entry closest to expiry. Pickled results
+    are appended to a ring arena at an ever-increasing write position, so a
+    slot's bytes are valid until the head has moved a full arena past them;
+    readers check this after copying, which makes overwritten entries misses
+    rather than torn reads.
+
+    The segment is a file in SEGMENT_DIR mapped by every process. Writers
+    serialize per bucket stripe with fcntl byte-range locks on it (readers
+    take them shared), and briefly on one extra byte to reserve arena space.
+    Lock hold times never span an await, so coroutines in one process cannot
+    interleave inside them.
+    """
+
+    def __init__(
+        self,
+        name: str = None,
+        slots: int = None,
+        arena_bytes: int = None,
+        ttl_seconds: int = None,
+        stripes: int = None
+    ):
+        """
+        Attach to the named segment, creating it if it does not exist.
+
+        Args:
+            name: Segment file name in SEGMENT_DIR; defaults to SHARED_CACHE_NAME
+            slots: Slot count when creating; rounded up to whole buckets
+            arena_bytes: Arena size when creating
+            ttl_seconds: Default time-to-live for entries
+            stripes: Number of lock stripes
+        """
+        if fcntl is None:
+            raise ValueError("The shared cache backend requires fcntl (POSIX)")
+        self.name = name or settings.SHARED_CACHE_NAME
+        self._ttl_seconds = ttl_seconds or settings.CACHE_TTL_SECONDS
+        self._stripes = stripes or settings.SHARED_CACHE_LOCK_STRIPES
+        self._metrics = CacheMetrics()
+        self._expiry_task = None
+        self._expiry_cursor = 0
+
+        self.path = os.path.join(SEGMENT_DIR, self.name)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        # Whether this attachment created the segment, and so is the one to unlink it
+        self.owner = self._open(
+            slots or settings.SHARED_CACHE_SLOTS,
+            arena_bytes or settings.SHARED_CACHE_ARENA_BYTES
+        )
+        magic, version, self._slots, self._arena_size, _ = _HEADER.unpack_from(self._buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError(f"{self.path} is not a shared cache segment")
+        self._buckets = self._slots // BUCKET_SLOTS
+        self._max_size = self._slots
+        self._table_offset = _HEADER.size
+        self._arena_offset = self._table_offset + self._slots * _SLOT.size
+
+    def _open(self, slots: int, arena_bytes: int) -> bool:
+        """Map the segment, sizing it first if it is new; returns whether it was."""
+        with self._locked(_INIT_LOCK):
+            created = os.fstat(self._fd).st_size == 0
+            if created:
+                slots = -(-slots // BUCKET_SLOTS) * BUCKET_SLOTS
+                os.ftruncate(self._fd, _HEADER.size + slots * _SLOT.size + arena_bytes)
+            self._mmap = mmap.mmap(self._fd, 0)
+            self._buf = memoryview(self._mmap)
+            if created:
+                _HEADER.pack_into(self._buf, 0, _MAGIC, _VERSION, slots, arena_bytes, 0)
+        return created
+
+    def close(self) -> None:
+        """Detach from the segment."""
+        self._buf.release()
+        self._mmap.close()
+        os.close(self._fd)
+
+    def unlink(self) -> None:
+        """Remove the segment; call once, from the ``owner`` attachment."""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def _locked(self, start: int, shared: bool = False, length: int = 1) -> Iterator[None]:
+        fcntl.lockf(self._fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX, length, start)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+    def _stripe(self, bucket: int) -> int:
+        return _STRIPE_BASE + bucket % self._stripes
+
+    def _slot_offset(self, index: int) -> int:
+        return self._table_offset + index * _SLOT.size
+
+    def _bucket(self, digest: bytes) -> int:
+        return int.from_bytes(digest[:8], "little") % self._buckets
+
+    def _head(self) -> int:
+        return struct.unpack_from("<Q", self._buf, _HEAD_OFFSET)[0]
+
+    def _read(self, digest: bytes, now: float) -> Optional[bytes]:
+        """Payload stored under ``digest``, if present, unexpired and not overwritten."""
+        buf = self._buf
+        bucket = self._bucket(digest)
+        with self._locked(self._stripe(bucket), shared=True):
+            for index in range(bucket * BUCKET_SLOTS, (bucket + 1) * BUCKET_SLOTS):
+                slot_digest, expires_at, position, length = _SLOT.unpack_from(
+                    buf, self._slot_offset(index)
+                )
+                if length and slot_digest == digest:
+                    break
+            else:
+                return None
+        if expires_at <= now or self._head() > position + self._arena_size:
+            return None
+        start = self._arena_offset + position % self._arena_size
+        payload = bytes(buf[start:start + length])
+        # The head moving a full arena past us means a writer may have reused these bytes
+        if self._head() > position + self._arena_size:
+            return None
+        return payload
+
+    def _reserve(self, length: int) -> int:
+        """Claim ``length`` contiguous arena bytes; returns their absolute position."""
+        with self._locked(_ARENA_LOCK):
+            position = self._head()
+            offset = position % self._arena_size
+            if offset + length > self._arena_size:
+                # Records never wrap: skip to the start of the next lap
+                position += self._arena_size - offset
+            struct.pack_into("<Q", self._buf, _HEAD_OFFSET, position + length)
+        return position
+
+    def _write(self, digest: bytes, payload: bytes, expires_at: float) -> bool:
+        """Store a payload; returns whether another entry was evicted for it."""
+        buf = self._buf
+        position = self._reserve(len(payload))
+        start = self._arena_offset + position % self._arena_size
+        buf[start:start + len(payload)] = payload
+
+        bucket = self._bucket(digest)
+        with self._locked(self._stripe(bucket)):
+            target = None
+            victim, victim_expiry = None, None
+            for index in range(bucket * BUCKET_SLOTS, (bucket + 1) * BUCKET_SLOTS):
+                slot_digest, slot_expiry, _, length = _SLOT.unpack_from(buf, self._slot_offset(index))
+                if length and slot_digest == digest:
+                    target = index
+                    break
+                if not length:
+                    if target is None:
+                        target = index
+                elif victim_expiry is None or slot_expiry < victim_expiry:
+                    victim, victim_expiry = index, slot_expiry
+            evicted = target is None
+            if evicted:
+                target = victim
+            _SLOT.pack_into(
+                buf, self._slot_offset(target), digest, expires_at, position, len(payload)
+            )
+        return evicted
+
+    async def get(
+        self,
+        operation: str,
+        value: int,
+        exponent: Optional[int] = None,
+        params: Optional[Dict[str, Any]] = None
+    ) -> Optional[Any]:
+        """
+        Get value from cache.
+
+        Args:
+            operation: Operation type
+            value: Input value
+            exponent: Optional exponent for power operation
+            params: Optional extra operation parameters (e.g. modulus)
+
+        Returns:
+            Cached result if found and not expired, None otherwise
+        """
+        key = self._generate_key(operation, value, exponent, params)
+        metrics = self._metrics
+        sampled = metrics.sample()
+        if sampled:
+            start = time.perf_counter()
+            metrics.hot_keys.add(key)
+
+        payload = self._read(_digest(key), time.time())
+        result = pickle.loads(payload) if payload is not None else None
+
+        if result is None:
+            metrics.miss(operation)
+        else:
+            metrics.hit(operation)
+        if sampled:
+            metrics.get_latency.record(time.perf_counter() - start)
+        return result
+
+    async def set(
+        self,
+        operation: str,
+        value: int,
+        result: Any,
+        exponent: Optional[int] = None,
+        params: Optional[Dict[str, Any]] = None,
+        ttl_seconds: Optional[float] = None
+    ) -> None:
+        """
+        Set value in cache.
+
+        Args:
+            operation: Operation type
+            value: Input value
+            result: Calculation result
+            exponent: Optional exponent for power operation
+            params: Optional extra operation parameters (e.g. modulus)
+            ttl_seconds: Time-to-live for this entry; defaults to the cache's TTL
+        """
+        key = self._generate_key(operation, value, exponent, params)
+        sampled = self._metrics.sample()
+        if sampled:
+            start = time.perf_counter()
+
+        payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) <= self._arena_size // _MAX_PAYLOAD_FRACTION:
+            ttl = self._ttl_seconds if ttl_seconds is None else ttl_seconds
+            if self._write(_digest(key), payload, time.time() + ttl):
+                self._metrics.evictions.add()
+
+        if sampled:
+            self._metrics.set_latency.record(time.perf_counter() - start)
+
+    async def expire(self, max_entries: Optional[int] = None) -> int:
+        """
+        Free expired slots, scanning at most ``max_entries`` slots from where the last call stopped.
+
+        Returns:
+            Number of entries freed
+        """
+        budget = min(max_entries or settings.CACHE_EXPIRY_BATCH, self._slots)
+        buf = self._buf
+        now = time.time()
+        freed = 0
+        first = self._expiry_cursor - self._expiry_cursor % BUCKET_SLOTS
+        for bucket_start in range(first, first + budget, BUCKET_SLOTS):
+            bucket_start %= self._slots
+            bucket = bucket_start // BUCKET_SLOTS
+            with self._locked(self._stripe(bucket)):
+                for index in range(bucket_start, bucket_start + BUCKET_SLOTS):
+                    offset = self._slot_offset(index)
+                    _, expires_at, _, length = _SLOT.unpack_from(buf, offset)
+                    if length and expires_at <= now:
+                        buf[offset:offset + _SLOT.size] = _EMPTY_SLOT
+                        freed += 1
+        self._expiry_cursor = (first + budget) % self._slots
+        self._metrics.expirations.add(freed)
+        return freed
+
+    async def clear(self) -> None:
+        """Clear all cache entries, in every worker."""
+        with self._locked(_STRIPE_BASE, length=self._stripes):
+            end = self._arena_offset
+            self._buf[self._table_offset:end] = bytes(end - self._table_offset)
+
+    def _count_live(self) -> int:
+        now = time.time()
+        oldest = self._head() - self._arena_size
+        table = self._buf[self._table_offset:self._arena_offset]
+        try:
+            return sum(
+                1 for _, expires_at, position, length in _SLOT.iter_unpack(table)
+                if length and expires_at > now and position >= oldest
+            )
+        finally:
+            table.release()
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics; counts and latencies are this worker's own."""
+        size = self._count_live()
+        return {
+            'size': size,
+            'max_size': self._max_size,
+            'ttl_seconds': self._ttl_seconds,
+            'policy': 'shared',
+            'arena_bytes': self._arena_size,
+            'arena_written_bytes': self._head(),
+            **self._metrics.snapshot()
+        }
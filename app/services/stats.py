@@ -0,0 +1,336 @@
+"""Lightweight in-process metrics: counters, latency histograms and hot keys."""
+import time
+from typing import Any, Dict, Hashable, List, Optional
+
+from app.core.config import settings
+
+_MASK64 = (1 << 64) - 1
+
+# Each count-min row indexes with its own 16 bits of a 64-bit hash
+_ROW_BITS = 16
+_MAX_DEPTH = 64 // _ROW_BITS
+
+# Histogram resolution: 2**_SUB_BITS buckets per power of two (~12% wide)
+_SUB_BITS = 3
+_SUB_COUNT = 1 << _SUB_BITS
+# Largest tracked latency is about 2**36 microseconds (19 hours)
+_MAX_SHIFT = 33
+
+
+class Counter:
+    """
+    Monotonic counter.
+
+    Updated only from the event loop thread, where an increment cannot be
+    interleaved with another, so no lock is needed.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def add(self, amount: int = 1) -> None:
+        """Increase the counter."""
+        self.value += amount
+
+
+class Sampler:
+    """Deterministic 1-in-N sampling; a rate of 0 disables sampling."""
+
+    __slots__ = ("_stride", "_tick")
+
+    def __init__(self, rate: float):
+        self._stride = max(1, round(1 / rate)) if rate > 0 else 0
+        self._tick = 0
+
+    def __call__(self) -> bool:
+        if not self._stride:
+            return False
+        self._tick += 1
+        if self._tick >= self._stride:
+            self._tick = 0
+            return True
+        return False
+
+
+def _bucket_index(micros: int) -> int:
+    if micros < _SUB_COUNT:
+        return micros
+    shift = min(micros.bit_length() - _SUB_BITS - 1, _MAX_SHIFT)
+    mantissa = min(micros >> shift, 2 * _SUB_COUNT - 1)
+    return _SUB_COUNT + shift * _SUB_COUNT + mantissa - _SUB_COUNT
+
+
+def _bucket_upper(index: int) -> int:
+    """Largest value (in microseconds) falling in a bucket."""
+    if index < _SUB_COUNT:
+        return index
+    shift, offset = divmod(index - _SUB_COUNT, _SUB_COUNT)
+    return ((_SUB_COUNT + offset + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket log-linear histogram in the style of HdrHistogram.
+
+    Values are bucketed by their leading bits, so every bucket is within
+    ~12% of its neighbours and recording is O(1) with no allocation.
+    """
+
+    PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+    def __init__(self):
+        self._buckets = [0] * (_SUB_COUNT + (_MAX_SHIFT + 1) * _SUB_COUNT)
+        self.count = 0
+        self.total_micros = 0
+        self.max_micros = 0
+
+    def record(self, seconds: float) -> None:
+        """Record one latency."""
+        micros = int(seconds * 1_000_000)
+        self._buckets[_bucket_index(micros)] += 1
+        self.count += 1
+        self.total_micros += micros
+        if micros > self.max_micros:
+            self.max_micros = micros
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """Add another histogram's values to this one; bucket counts simply add up."""
+        buckets = self._buckets
+        for index, count in enumerate(other._buckets):
+            if count:
+                buckets[index] += count
+        self.count += other.count
+        self.total_micros += other.total_micros
+        self.max_micros = max(self.max_micros, other.max_micros)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The non-empty buckets and totals, for storage as JSON."""
+        return {
+            "buckets": {str(index): count for index, count in enumerate(self._buckets) if count},
+            "count": self.count,
+            "total_micros": self.total_micros,
+            "max_micros": self.max_micros,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        """Rebuild a histogram stored with ``to_dict``."""
+        histogram = cls()
+        for index, count in data["buckets"].items():
+            histogram._buckets[int(index)] = count
+        histogram.count = data["count"]
+        histogram.total_micros = data["total_micros"]
+        histogram.max_micros = data["max_micros"]
+        return histogram
+
+    def percentile(self, percent: float) -> float:
+        """Latency in milliseconds at or below which ``percent`` of values fall."""
+        if not self.count:
+            return 0.0
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index, bucket in enumerate(self._buckets):
+            seen += bucket
+            if seen >= rank:
+                return min(_bucket_upper(index), self.max_micros) / 1000
+        return self.max_micros / 1000
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Summary of the recorded values in milliseconds."""
+        summary = {
+            "count": self.count,
+            "mean_ms": self.total_micros / self.count / 1000 if self.count else 0.0,
+            "max_ms": self.max_micros / 1000,
+        }
+        for percent in self.PERCENTILES:
+            summary[f"p{percent:g}_ms"] = self.percentile(percent)
+        return summary
+
+
+class CountMinSketch:
+    """
+    Approximate frequency counts in fixed memory.
+
+    Estimates never undercount; with ``reset_after`` set, all counters are
+    halved after that many increments so old popularity decays.
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4, reset_after: Optional[int] = None):
+        self._width = 1 << min(max(width - 1, 1).bit_length(), _ROW_BITS)
+        self._depth = min(depth, _MAX_DEPTH)
+        self._table = [0] * (self._width * self._depth)
+        self._reset_after = reset_after
+        self._additions = 0
+
+    def _slots(self, key: Hashable) -> List[int]:
+        # splitmix64 finalizer, so rows index with independent bits even for int keys
+        h = hash(key) & _MASK64
+        h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+        h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & _MASK64
+        h ^= h >> 31
+        width = self._width
+        mask = width - 1
+        return [
+            row * width + ((h >> (row * _ROW_BITS)) & mask) for row in range(self._depth)
+        ]
+
+    def add(self, key: Hashable) -> int:
+        """Count one occurrence of ``key`` and return its new estimate."""
+        table = self._table
+        estimate = None
+        for slot in self._slots(key):
+            table[slot] += 1
+            if estimate is None or table[slot] < estimate:
+                estimate = table[slot]
+        self._additions += 1
+        if self._reset_after and self._additions >= self._reset_after:
+            self.halve()
+        return estimate
+
+    def estimate(self, key: Hashable) -> int:
+        """Estimated occurrences of ``key``."""
+        table = self._table
+        return min(table[slot] for slot in self._slots(key))
+
+    def halve(self) -> None:
+        """Halve every counter."""
+        self._table = [count >> 1 for count in self._table]
+        self._additions //= 2
+
+    def clear(self) -> None:
+        """Forget all counts."""
+        self._table = [0] * len(self._table)
+        self._additions = 0
+
+
+class TopKeys:
+    """Heavy hitters: a count-min sketch plus a bounded set of candidates."""
+
+    def __init__(self, size: int = 10, width: int = 2048):
+        self._size = size
+        self._capacity = size * 4
+        self._sketch = CountMinSketch(width)
+        self._candidates: Dict[Hashable, int] = {}
+        self._floor = 0
+
+    def add(self, key: Hashable) -> None:
+        """Count one occurrence of ``key``."""
+        estimate = self._sketch.add(key)
+        candidates = self._candidates
+        if key in candidates or len(candidates) < self._capacity:
+            candidates[key] = estimate
+        elif estimate > self._floor:
+            coldest = min(candidates, key=candidates.get)
+            del candidates[coldest]
+            candidates[key] = estimate
+            self._floor = min(candidates.values())
+
+    def top(self) -> List[Dict[str, Any]]:
+        """The hottest keys with their estimated counts, hottest first."""
+        ranked = sorted(self._candidates.items(), key=lambda item: item[1], reverse=True)
+        return [{"key": str(key), "count": count} for key, count in ranked[:self._size]]
+
+    def clear(self) -> None:
+        """Forget all keys."""
+        self._sketch.clear()
+        self._candidates.clear()
+        self._floor = 0
+
+
+class MetricsRegistry:
+    """Named counters and histograms, created on first use."""
+
+    def __init__(self, sample_rate: Optional[float] = None):
+        self.sample_rate = settings.STATS_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.sample = Sampler(self.sample_rate)
+        self.started_at = time.time()
+        self._counters: Dict[str, Counter] = {}
+        self._histograms: Dict[str, LatencyHistogram] = {}
+
+    def counter(self, name: str) -> Counter:
+        """Return the counter called ``name``."""
+        counter = self._counters.get(name)
+        if counter is None:
+            counter = self._counters[name] = Counter()
+        return counter
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        """Return the histogram called ``name``."""
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = LatencyHistogram()
+        return histogram
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All counters and histogram summaries."""
+        return {
+            "uptime_seconds": time.time() - self.started_at,
+            "sample_rate": self.sample_rate,
+            "counters": {name: counter.value for name, counter in sorted(self._counters.items())},
+            "histograms": {
+                name: histogram.snapshot() for name, histogram in sorted(self._histograms.items())
+            },
+        }
+
+
+class CacheMetrics:
+    """Hit, miss, expiry and eviction counts plus sampled latencies for a cache."""
+
+    def __init__(self, sample_rate: Optional[float] = None, top_keys: int = 10):
+        self.sample_rate = settings.STATS_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.sample = Sampler(self.sample_rate)
+        self.expirations = Counter()
+        self.evictions = Counter()
+        self.get_latency = LatencyHistogram()
+        self.set_latency = LatencyHistogram()
+        self.hot_keys = TopKeys(top_keys)
+        # operation -> (hits, misses)
+        self._operations: Dict[str, tuple] = {}
+
+    def _counters(self, operation: str) -> tuple:
+        counters = self._operations.get(operation)
+        if counters is None:
+            counters = self._operations[operation] = (Counter(), Counter())
+        return counters
+
+    def hit(self, operation: str) -> None:
+        """Count a cache hit."""
+        self._counters(operation)[0].add()
+
+    def miss(self, operation: str) -> None:
+        """Count a cache miss."""
+        self._counters(operation)[1].add()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counts, hit ratios, latency summaries and the hottest keys."""
+        operations = {}
+        hits = misses = 0
+        for operation, (op_hits, op_misses) in sorted(self._operations.items()):
+            lookups = op_hits.value + op_misses.value
+            operations[operation] = {
+                "hits": op_hits.value,
+                "misses": op_misses.value,
+                "hit_ratio": op_hits.value / lookups if lookups else 0.0,
+            }
+            hits += op_hits.value
+            misses += op_misses.value
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "expirations": self.expirations.value,
+            "evictions": self.evictions.value,
+            "operations": operations,
+            "latency": {
+                "sample_rate": self.sample_rate,
+                "get": self.get_latency.snapshot(),
+                "set": self.set_latency.snapshot(),
+            },
+            "hot_keys": self.hot_keys.top(),
+        }
+
+
+# Global metrics instance
+metrics = MetricsRegistry()
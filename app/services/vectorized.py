@@ -0,0 +1,93 @@
+"""Vectorized fast path for batches of small power operations."""
+from typing import Any, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+# Batches smaller than this are cheaper to evaluate with plain pow()
+MIN_VECTOR_SIZE = 16
+
+# Integer results must stay below 2**62 so float rounding in the bit-length
+# estimate can never let an int64 overflow slip through
+SAFE_INT_BITS = 62
+
+
+def _exact_power(base: int, exponent: int) -> Any:
+    """Exact big-int/float power with the same semantics as CalculatorService.power."""
+    try:
+        return pow(base, exponent)
+    except ZeroDivisionError:
+        raise ValueError("0 cannot be raised to a negative power")
+
+
+def power_small(bases: Sequence[int], exponents: Sequence[int]) -> List[Optional[Any]]:
+    """
+    Evaluate base ** exponent element-wise where machine types suffice.
+
+    Elements with non-negative exponents whose result provably fits in
+    int64 are computed in one NumPy pass and equal pow() on the pair. Every
+    other element is left as None, as is the whole batch when NumPy is
+    missing or the batch is too small to be worth it. Negative exponents
+    are always left out: NumPy's float power is not correctly rounded, so
+    it can differ from pow() in the last bit.
+
+    Args:
+        bases: Base numbers
+        exponents: Exponents, same length as bases
+
+    Returns:
+        List of results as Python ints, None where not computed
+    """
+    if len(bases) != len(exponents):
+        raise ValueError("Bases and exponents must have the same length")
+
+    results: List[Optional[Any]] = [None] * len(bases)
+    if np is None or len(bases) < MIN_VECTOR_SIZE:
+        return results
+
+    try:
+        b = np.asarray(bases, dtype=np.int64)
+        e = np.asarray(exponents, dtype=np.int64)
+    except (OverflowError, TypeError, ValueError):
+        # Some operand does not fit in int64
+        return results
+
+    with np.errstate(all="ignore"):
+        abs_b = np.abs(b)
+        # abs(INT64_MIN) wraps negative; leave it to the exact path
+        valid = abs_b >= 0
+
+        # |b| <= 1 always fits, otherwise bound the bit length
+        bits = e * np.log2(np.maximum(abs_b, 1).astype(np.float64))
+        int_mask = valid & (e >= 0) & ((abs_b <= 1) | (bits <= SAFE_INT_BITS))
+        if int_mask.all():
+            return np.power(b, e).tolist()
+        if int_mask.any():
+            values = np.power(b[int_mask], e[int_mask])
+            for index, value in zip(np.flatnonzero(int_mask).tolist(), values.tolist()):
+                results[index] = value
+
+    return results
+
+
+def power_many(bases: Sequence[int], exponents: Sequence[int]) -> List[Any]:
+    """
+    Evaluate base ** exponent element-wise.
+
+    Small elements go through power_small(); the rest fall back to the exact
+    path per element. Results are identical to calling pow() on each pair.
+
+    Args:
+        bases: Base numbers
+        exponents: Exponents, same length as bases
+
+    Returns:
+        List of results as Python ints/floats
+    """
+    results = power_small(bases, exponents)
+    return [
+        _exact_power(int(base), int(exponent)) if result is None else result
+        for result, base, exponent in zip(results, bases, exponents)
+    ]
@@ -0,0 +1,130 @@
+"""Fast JSON encoding for responses that would otherwise go through Pydantic."""
+import math
+from datetime import datetime
+from enum import Enum
+from json.encoder import encode_basestring
+from typing import Any, Callable, Dict, List
+
+from pydantic import BaseModel
+from starlette.responses import Response
+
+from app.services.backends import get_backend
+
+# Ints at least this wide are converted by the arithmetic backend, which is
+# subquadratic where CPython's str() is not
+_BIG_INT_BITS = 1 << 13
+
+
+class RawJSON(str):
+    """Text that is already valid JSON, written out verbatim (e.g. the digits of a stored result)."""
+
+
+def _encode_str(value: str, parts: List[str]) -> None:
+    parts.append(encode_basestring(value))
+
+
+def _encode_raw(value: RawJSON, parts: List[str]) -> None:
+    parts.append(value)
+
+
+def _encode_int(value: int, parts: List[str]) -> None:
+    if value.bit_length() < _BIG_INT_BITS:
+        parts.append(int.__repr__(value))
+    else:
+        parts.append(get_backend().to_decimal(value))
+
+
+def _encode_float(value: float, parts: List[str]) -> None:
+    if not math.isfinite(value):
+        raise ValueError(f"Out of range float values are not JSON compliant: {value!r}")
+    parts.append(float.__repr__(value))
+
+
+def _encode_dict(value: Dict[str, Any], parts: List[str]) -> None:
+    parts.append("{")
+    first = True
+    for key, item in value.items():
+        if not first:
+            parts.append(",")
+        first = False
+        parts.append(encode_basestring(key if type(key) is str else str(key)))
+        parts.append(":")
+        _encode(item, parts)
+    parts.append("}")
+
+
+def _encode_list(value: List[Any], parts: List[str]) -> None:
+    parts.append("[")
+    first = True
+    for item in value:
+        if not first:
+            parts.append(",")
+        first = False
+        _encode(item, parts)
+    parts.append("]")
+
+
+def _encode_datetime(value: datetime, parts: List[str]) -> None:
+    parts.append(f'"{value.isoformat()}"')
+
+
+_ENCODERS: Dict[type, Callable[[Any, List[str]], None]] = {
+    str: _encode_str,
+    RawJSON: _encode_raw,
+    int: _encode_int,
+    float: _encode_float,
+    dict: _encode_dict,
+    list: _encode_list,
+    tuple: _encode_list,
+    datetime: _encode_datetime,
+}
+
+
+def _encode(value: Any, parts: List[str]) -> None:
+    # Exact type lookups first: they cover nearly every value in a response
+    encoder = _ENCODERS.get(type(value))
+    if encoder is not None:
+        encoder(value, parts)
+    elif value is None:
+        parts.append("null")
+    elif value is True:
+        parts.append("true")
+    elif value is False:
+        parts.append("false")
+    elif isinstance(value, Enum):
+        _encode(value.value, parts)
+    elif isinstance(value, BaseModel):
+        _encode(value.model_dump(), parts)
+    elif isinstance(value, int):
+        _encode_int(int(value), parts)
+    elif isinstance(value, float):
+        _encode_float(float(value), parts)
+    else:
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Encode a value as compact UTF-8 JSON.
+
+    Handles what the endpoints return: dicts, lists, strings, numbers,
+    booleans, None, naive datetimes (ISO 8601, as Pydantic writes them),
+    enums and Pydantic models. Ints of any size are written exactly.
+    """
+    parts: List[str] = []
+    _encode(value, parts)
+    return "".join(parts).encode()
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response encoded by ``dumps``, skipping Pydantic validation and jsonable_encoder.
+
+    Endpoints returning it keep their ``response_model`` for the OpenAPI
+    schema; FastAPI does not re-validate a Response it is handed.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
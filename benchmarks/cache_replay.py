@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Replay a request trace against each cache policy and compare hit ratios.
+
+The trace is the operation_history table (every request is logged, cached
+or not), oldest first. Use --synthetic to generate a trace instead: a skewed
+hot set interleaved with scans of one-off inputs.
+
+    python -m benchmarks.cache_replay --sizes 100,1000
+    python -m benchmarks.cache_replay --synthetic 200000
+"""
+import argparse
+import asyncio
+import random
+from typing import Iterable, List
+
+from sqlalchemy import select
+from tabulate import tabulate
+
+from app.db.base import AsyncSessionLocal, init_db
+from app.models.database import OperationHistory
+from app.services.cache import CacheService
+from app.services.cache_policy import POLICIES
+
+
+async def load_history(limit: int = None) -> List[str]:
+    """Cache keys of logged requests, oldest first."""
+    keys = CacheService(max_size=1)._generate_key
+    query = select(
+        OperationHistory.operation, OperationHistory.input_value, OperationHistory.exponent
+    ).order_by(OperationHistory.id)
+    if limit:
+        query = query.limit(limit)
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(query)).all()
+    return [keys(operation, value, exponent) for operation, value, exponent in rows]
+
+
+def synthetic_trace(length: int, hot_keys: int = 500, scan_every: int = 5000,
+                    scan_length: int = 2000, seed: int = 1) -> List[str]:
+    """A Zipf-like hot set with periodic scans of never-repeated inputs."""
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, hot_keys + 1)]
+    hot = rng.choices(range(hot_keys), weights, k=length)
+    trace, scanned = [], 0
+    for i, key in enumerate(hot):
+        if i and i % scan_every == 0:
+            trace.extend(f"factorial:{10 ** 6 + scanned + j}" for j in range(scan_length))
+            scanned += scan_length
+        trace.append(f"fibonacci:{key}")
+    return trace
+
+
+def hit_ratio(policy_name: str, size: int, trace: Iterable[str]) -> float:
+    """Fraction of requests a cache of ``size`` entries would have answered."""
+    policy = POLICIES[policy_name](size)
+    resident = set()
+    hits = requests = 0
+    for key in trace:
+        requests += 1
+        policy.record(key)
+        if key in resident:
+            hits += 1
+            policy.touch(key)
+        else:
+            resident.difference_update(policy.insert(key))
+            resident.add(key)
+    return hits / requests if requests else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated cache sizes")
+    parser.add_argument("--limit", type=int, help="Replay at most this many history rows")
+    parser.add_argument("--synthetic", type=int, metavar="N",
+                        help="Replay N synthetic requests instead of the history")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        trace = synthetic_trace(args.synthetic)
+    else:
+        trace = asyncio.run(load_history(args.limit))
+    if not trace:
+        parser.exit(1, "The trace is empty; make some requests first or use --synthetic\n")
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    rows = [
+        [size] + [f"{hit_ratio(name, size, trace):.2%}" for name in POLICIES]
+        for size in sizes
+    ]
+    print(f"{len(trace)} requests, {len(set(trace))} distinct keys")
+    print(tabulate(rows, headers=["size"] + list(POLICIES), tablefmt="grid"))
+
+
+if __name__ == "__main__":
+    main()
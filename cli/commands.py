@@ -8,9 +8,12 @@ import httpx
 from tabulate import tabulate
 
 from app.core.config import settings
+from app.models.schemas import OperationType
+from app.services import recurrence
 
 
 BASE_URL = f"http://localhost:{settings.PORT}{settings.API_V1_STR}"
+OPERATIONS = [operation.value for operation in OperationType]
 
 
 @click.group()
@@ -41,9 +44,28 @@ def factorial(number: int):
     asyncio.run(_calculate('factorial', number))
 
 
+@cli.command()
+@click.argument('operation', type=click.Choice(OPERATIONS))
+@click.argument('value', type=int)
+@click.option('--exponent', '-e', type=int, help='Exponent (power), or k (binomial, permutation)')
+@click.option('--modulus', '-m', type=int,
+              help='Reduce the result modulo this (binomial, permutation, fibonacci, linear_recurrence)')
+@click.option('--preset', '-p', type=click.Choice(list(recurrence.PRESETS)),
+              help='Named recurrence (linear_recurrence)')
+@click.option('--local', is_flag=True, help='Compute in-process instead of calling the API')
+def calculate(operation: str, value: int, exponent: Optional[int], modulus: Optional[int],
+              preset: Optional[str], local: bool):
+    """Run any registered operation."""
+    params = {"modulus": modulus, "preset": preset}
+    if local:
+        asyncio.run(_calculate_local(operation, value, exponent, params))
+    else:
+        asyncio.run(_calculate(operation, value, exponent, params))
+
+
 @cli.command()
 @click.option('--limit', '-l', type=int, default=10, help='Number of records to show')
-@click.option('--operation', '-o', type=click.Choice(['power', 'fibonacci', 'factorial']), 
+@click.option('--operation', '-o', type=click.Choice(OPERATIONS),
               help='Filter by operation type')
 def history(limit: int, operation: Optional[str]):
     """View operation history."""
@@ -63,7 +85,8 @@ def clear_cache():
     asyncio.run(_clear_cache())
 
 
-async def _calculate(operation: str, value: int, exponent: Optional[int] = None):
+async def _calculate(operation: str, value: int, exponent: Optional[int] = None,
+                     params: Optional[dict] = None):
     """Perform calculation via API."""
     async with httpx.AsyncClient() as client:
         try:
@@ -73,6 +96,7 @@ async def _calculate(operation: str, value: int, exponent: Optional[int] = None)
             }
             if exponent is not None:
                 data["exponent"] = exponent
+            data.update({name: param for name, param in (params or {}).items() if param is not None})
             
             response = await client.post(f"{BASE_URL}/calculate", json=data)
             
@@ -83,6 +107,8 @@ async def _calculate(operation: str, value: int, exponent: Optional[int] = None)
                 click.echo(f"Input: {result['input_value']}")
                 if result.get('exponent'):
                     click.echo(f"Exponent: {result['exponent']}")
+                if result.get('modulus'):
+                    click.echo(f"Modulus: {result['modulus']}")
                 click.echo(f"Result: {result['result']}")
                 click.echo(f"Cached: {'Yes' if result['cached'] else 'No'}")
                 click.echo(f"Computation time: {result['computation_time_ms']:.3f} ms")
@@ -96,6 +122,28 @@ async def _calculate(operation: str, value: int, exponent: Optional[int] = None)
             click.echo(f"\n✗ Error: {str(e)}", err=True)
 
 
+async def _calculate_local(operation: str, value: int, exponent: Optional[int] = None,
+                           params: Optional[dict] = None):
+    """Perform calculation in-process through the operation registry."""
+    # Imported here: it sets up the cache (attaching a shared segment), scheduler and NumPy
+    from app.services import registry
+
+    try:
+        spec = registry.get_operation(operation)
+        result, computation_time = await registry.run(spec, value, exponent, params)
+        click.echo("\n✓ Calculation completed successfully!")
+        click.echo(f"Operation: {operation}")
+        click.echo(f"Input: {value}")
+        if exponent is not None:
+            click.echo(f"Exponent: {exponent}")
+        if params and params.get("modulus") is not None:
+            click.echo(f"Modulus: {params['modulus']}")
+        click.echo(f"Result: {spec.serialize(result)}")
+        click.echo(f"Computation time: {computation_time:.3f} ms")
+    except Exception as e:
+        click.echo(f"\n✗ Error: {str(e)}", err=True)
+
+
 async def _get_history(limit: int, operation: Optional[str]):
     """Get operation history."""
     async with httpx.AsyncClient() as client:
@@ -5,10 +5,25 @@ import uvicorn
 from app.core.config import settings
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host=settings.HOST,
-        port=settings.PORT,
-        reload=True,
-        log_level=settings.LOG_LEVEL.lower()
-    )
\ No newline at end of file
+    shared_cache = None
+    if settings.WORKERS > 1 and settings.CACHE_BACKEND.lower() == "shared":
+        # Create the segment in this process so every worker attaches to the
+        # same one and it outlives worker restarts
+        from app.services.cache import cache_service as shared_cache
+
+    try:
+        uvicorn.run(
+            "app.main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            # Reloading is single-process only
+            reload=settings.WORKERS == 1,
+            workers=settings.WORKERS,
+            log_level=settings.LOG_LEVEL.lower()
+        )
+    finally:
+        if shared_cache is not None:
+            shared_cache.close()
+            # A segment this launcher found already in place belongs to whoever created it
+            if shared_cache.owner:
+                shared_cache.unlink()
@@ -0,0 +1,41 @@
+"""Shared test fixtures."""
+import asyncio
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# Tests get a database of their own, never the service's data/ directory
+_TEST_DATA_DIR = tempfile.mkdtemp(prefix="math-ops-tests-")
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite+aiosqlite:///{_TEST_DATA_DIR}/math_operations.db"
+)
+os.environ.setdefault("HISTORY_ARCHIVE_DIR", os.path.join(_TEST_DATA_DIR, "archive"))
+
+from app.db.base import engine, init_db, read_engine  # noqa: E402
+
+
+async def _dispose_engines():
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def setup_database():
+    """Create database tables once, as the app lifespan would."""
+    async def _init():
+        await init_db()
+        await _dispose_engines()
+
+    asyncio.run(_init())
+    yield
+    shutil.rmtree(_TEST_DATA_DIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def fresh_connection_pools():
+    """Close pooled connections after each test; a pool belongs to one event loop."""
+    yield
+    asyncio.run(_dispose_engines())
@@ -1,9 +1,34 @@
 """API endpoint tests."""
+import asyncio
+import json
+import math
+from datetime import datetime
+
+import httpx
 import pytest
 from httpx import AsyncClient
+from starlette.testclient import TestClient
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.datastructures import Headers
 
+from app.api import endpoints
+from app.api.middleware import RateLimitMiddleware, RoutingMiddleware, client_identity
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal
 from app.main import app
+from app.models.database import OperationHistory
+from app.services import ratelimit
+from app.services import registry
+from app.services.jobs import job_service
+from app.services.history import HistoryPolicy, HitCounters, RecentHistory
+from app.services.ratelimit import MemoryRateLimiter
+from app.services.retention import HistoryArchiver
+from app.services.rollups import OperationRollups
+from app.services.scheduler import AdmissionScheduler
+from app.services.stats import MetricsRegistry
+from app.services.routing import (
+    CLIENT_HEADER, FORWARDED_HEADER, NODE_HEADER, SECRET_HEADER, ClusterRouter
+)
 from app.models.schemas import OperationType
 
 
@@ -130,4 +155,631 @@ async def test_cache_hit():
         data2 = response2.json()
         assert data2["cached"] is True
         assert data2["result"] == data1["result"]
-        assert data2["computation_time_ms"] == 0.0
\ No newline at end of file
+        assert data2["computation_time_ms"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_sequence_stream():
+    """Test streaming a Fibonacci range as NDJSON."""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/sequence",
+            json={
+                "operation": "fibonacci",
+                "start": 0,
+                "stop": 10,
+                "step": 2
+            }
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [item["index"] for item in lines] == [0, 2, 4, 6, 8, 10]
+        assert [item["result"] for item in lines] == [0, 1, 3, 8, 21, 55]
+
+
+@pytest.mark.asyncio
+async def test_sequence_requires_base_for_power():
+    """Test power sequences without a base are rejected."""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/sequence",
+            json={"operation": "power", "start": 0, "stop": 5}
+        )
+        assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_sequence_rejects_long_ranges(monkeypatch):
+    """Test ranges beyond SEQUENCE_MAX_TERMS are rejected, counting by step."""
+    monkeypatch.setattr(settings, "SEQUENCE_MAX_TERMS", 100)
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/sequence",
+            json={"operation": "fibonacci", "start": 0, "stop": 100}
+        )
+        assert response.status_code == 422
+
+        response = await client.post(
+            "/api/v1/sequence",
+            json={"operation": "fibonacci", "start": 0, "stop": 990, "step": 10}
+        )
+        assert response.status_code == 200
+        assert len(response.text.splitlines()) == 100
+
+
+@pytest.mark.asyncio
+async def test_sequence_rejects_unsupported_operation():
+    """Test operations without a sequence form are rejected before streaming."""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/sequence",
+            json={"operation": "is_prime", "start": 0, "stop": 5}
+        )
+        assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_calculate_batch():
+    """Test batch calculation mixing vectorized powers and other operations."""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/calculate/batch",
+            json={
+                "operations": [
+                    {"operation": "power", "value": 2, "exponent": 10},
+                    {"operation": "power", "value": 2, "exponent": -2},
+                    {"operation": "power", "value": 10, "exponent": 30},
+                    {"operation": "factorial", "value": 6}
+                ]
+            }
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert [item["result"] for item in data["results"]] == [
+            1024, 0.25, 10 ** 30, 720
+        ]
+        assert data["results"][3]["operation"] == "factorial"
+
+
+@pytest.mark.asyncio
+async def test_power_summary():
+    """Test describing a huge power without materializing it."""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/power/summary",
+            json={
+                "base": 2,
+                "exponent": 10 ** 12,
+                "leading_digits": 5,
+                "modulus": 1000
+            }
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["bit_length"] == 10 ** 12 + 1
+        assert data["digit_count"] == 301029995664
+        assert data["mod_result"] == pow(2, 10 ** 12, 1000)
+
+
+@pytest.mark.asyncio
+async def test_history_with_float_result():
+    """Test history parses results back per operation, including floats."""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/calculate",
+            json={"operation": "power", "value": 2, "exponent": -3}
+        )
+        assert response.status_code == 200
+
+        response = await client.get("/api/v1/history", params={"operation": "power"})
+        assert response.status_code == 200
+        assert 0.125 in [item["result"] for item in response.json()]
+
+
+@pytest.mark.asyncio
+async def test_prime_operations():
+    """Test number-theory operations through the calculate endpoint."""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        cases = [
+            ("is_prime", 2 ** 61 - 1, True),
+            ("is_prime", 561, False),
+            ("next_prime", 100, 101),
+            ("nth_prime", 1000, 7919),
+            ("prime_count", 10 ** 6, 78498),
+        ]
+        for operation, value, expected in cases:
+            response = await client.post(
+                "/api/v1/calculate",
+                json={"operation": operation, "value": value}
+            )
+            assert response.status_code == 200
+            assert response.json()["result"] == expected
+
+        response = await client.get("/api/v1/history", params={"operation": "is_prime"})
+        assert response.status_code == 200
+        assert {item["result"] for item in response.json()} <= {True, False}
+
+
+@pytest.mark.asyncio
+async def test_binomial_and_permutation():
+    """Test combinatorics operations with and without a modulus."""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/calculate",
+            json={"operation": "binomial", "value": 52, "exponent": 5}
+        )
+        assert response.status_code == 200
+        assert response.json()["result"] == 2598960
+
+        response = await client.post(
+            "/api/v1/calculate",
+            json={"operation": "permutation", "value": 10 ** 9, "exponent": 3, "modulus": 1000}
+        )
+        assert response.status_code == 200
+        assert response.json()["result"] == 0
+        assert response.json()["modulus"] == 1000
+
+        response = await client.post(
+            "/api/v1/calculate",
+            json={"operation": "binomial", "value": 10}
+        )
+        assert response.status_code == 422
+
+        response = await client.post(
+            "/api/v1/calculate",
+            json={"operation": "factorial", "value": 10, "modulus": 7}
+        )
+        assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_linear_recurrence():
+    """Test recurrences by preset and by coefficients, with and without a modulus."""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        cases = [
+            ({"preset": "pell", "value": 10}, 2378),
+            ({"coefficients": [1, 1, 1], "initial_terms": [0, 0, 1], "value": 10}, 81),
+            ({"preset": "lucas", "value": 10 ** 9, "modulus": 10 ** 9 + 7}, None),
+        ]
+        for body, expected in cases:
+            response = await client.post(
+                "/api/v1/calculate",
+                json={"operation": "linear_recurrence", **body}
+            )
+            assert response.status_code == 200
+            if expected is not None:
+                assert response.json()["result"] == expected
+
+        response = await client.post(
+            "/api/v1/calculate",
+            json={"operation": "fibonacci", "value": 10 ** 12, "modulus": 1000}
+        )
+        assert response.status_code == 200
+        assert response.json()["result"] == 875
+
+        for body in [{"value": 5}, {"value": 5, "preset": "pell", "coefficients": [1]},
+                     {"value": 5, "coefficients": [1, 1], "initial_terms": [1]}]:
+            response = await client.post(
+                "/api/v1/calculate",
+                json={"operation": "linear_recurrence", **body}
+            )
+            assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_stats():
+    """Test service and cache statistics."""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        await client.post("/api/v1/calculate", json={"operation": "fibonacci", "value": 30})
+        await client.post("/api/v1/calculate", json={"operation": "fibonacci", "value": 30})
+
+        response = await client.get("/api/v1/cache/stats")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["operations"]["fibonacci"]["hits"] >= 1
+        assert 0.0 <= data["hit_ratio"] <= 1.0
+
+        response = await client.get("/api/v1/stats")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["counters"]["requests.calculate"] >= 2
+        assert "compute.fibonacci" in data["histograms"]
+        assert "hits" in data["cache"]
+
+
+@pytest.mark.asyncio
+async def test_routing_middleware():
+    """Test calculations are forwarded to their ring owner, with local fallback."""
+    peer_up = True
+    forwarded = []
+
+    def peer(request: httpx.Request) -> httpx.Response:
+        if not peer_up:
+            raise httpx.ConnectError("connection refused", request=request)
+        if request.url.path.endswith("/health"):
+            return httpx.Response(200, json={"status": "healthy"})
+        forwarded.append(request)
+        return httpx.Response(200, json={"result": "remote"}, headers={NODE_HEADER: "http://b"})
+
+    router = ClusterRouter(
+        node_url="http://a", peers=["http://a", "http://b"], transport=httpx.MockTransport(peer)
+    )
+    values = {router.owner("fibonacci", value): value for value in range(100)}
+    local = {"operation": "fibonacci", "value": values["http://a"]}
+    remote = {"operation": "fibonacci", "value": values["http://b"]}
+
+    async with AsyncClient(app=RoutingMiddleware(app, router), base_url="http://test") as client:
+        response = await client.post("/api/v1/calculate", json=local)
+        assert response.headers[NODE_HEADER] == "http://a"
+        assert response.json()["input_value"] == local["value"]
+
+        response = await client.post("/api/v1/calculate", json=remote)
+        assert response.json() == {"result": "remote"}
+        assert response.headers[NODE_HEADER] == "http://b"
+        assert forwarded[0].headers[FORWARDED_HEADER] == "http://a"
+        assert json.loads(forwarded[0].content) == remote
+
+        # Already forwarded once: never forwarded again
+        response = await client.post(
+            "/api/v1/calculate", json=remote, headers={FORWARDED_HEADER: "http://b"}
+        )
+        assert response.headers[NODE_HEADER] == "http://a"
+        assert len(forwarded) == 1
+
+        response = await client.get(f"/api/v1/calculate/fibonacci/{remote['value']}")
+        assert response.json() == {"result": "remote"}
+        assert forwarded[1].method == "GET"
+        response = await client.get(f"/api/v1/calculate/fibonacci/{local['value']}")
+        assert response.headers[NODE_HEADER] == "http://a"
+
+        peer_up = False
+        response = await client.post("/api/v1/calculate", json=remote)
+        assert response.status_code == 200
+        assert response.headers[NODE_HEADER] == "http://a"
+        assert router.owner("fibonacci", remote["value"]) == "http://a"
+
+    peer_up = True
+    await router.check_health()
+    assert router.owner("fibonacci", remote["value"]) == "http://b"
+    await router.close()
+
+
+@pytest.mark.asyncio
+async def test_jobs():
+    """Test submitting a background job, polling it and streaming its result."""
+    job_service.start()
+    try:
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            response = await client.post(
+                "/api/v1/jobs", json={"operation": "binomial", "value": 5000, "exponent": 2500}
+            )
+            assert response.status_code == 202
+            job_url = response.headers["location"]
+            assert response.json()["status"] in ("pending", "running", "done")
+
+            for _ in range(500):
+                data = (await client.get(job_url)).json()
+                if data["status"] == "done":
+                    break
+                await asyncio.sleep(0.01)
+            assert data["result_url"] == f"{job_url}/result"
+            assert data["elapsed_ms"] >= 0
+
+            response = await client.get(data["result_url"])
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/plain")
+            assert int(response.text) == math.comb(5000, 2500)
+
+            response = await client.get("/api/v1/jobs/0123456789abcdef")
+            assert response.status_code == 404
+            response = await client.post(
+                "/api/v1/jobs", json={"operation": "power", "value": 2}
+            )
+            assert response.status_code == 422
+    finally:
+        await job_service.stop()
+
+
+def test_websocket_calculations():
+    """Test pipelined WebSocket calculations reply by id, including errors."""
+    with TestClient(app).websocket_connect("/api/v1/ws") as websocket:
+        websocket.send_text(json.dumps({"id": 1, "operation": "factorial", "value": 20000}))
+        websocket.send_text(json.dumps({"id": "b", "operation": "fibonacci", "value": 10}))
+        websocket.send_text(json.dumps({"id": 3, "operation": "power", "value": 2}))
+        websocket.send_text("not json")
+        replies = {}
+        for _ in range(4):
+            reply = json.loads(websocket.receive_text())
+            replies[reply["id"]] = reply
+
+    assert replies[1]["result"] == math.factorial(20000)
+    assert replies["b"]["result"] == 55 and replies["b"]["operation"] == "fibonacci"
+    assert replies[3]["error"][0]["loc"] == ["exponent"]
+    assert replies[None]["error"].startswith("Invalid message")
+
+
+@pytest.mark.asyncio
+async def test_calculate_get_etag(monkeypatch):
+    """Test GET calculations carry strong ETags and honour If-None-Match."""
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.get("/api/v1/calculate/power/3", params={"exponent": 40})
+        assert response.status_code == 200
+        assert response.json() == {
+            "operation": "power", "input_value": 3, "exponent": 40, "modulus": None,
+            "result": 3 ** 40
+        }
+        etag = response.headers["etag"]
+        assert etag.startswith('"') and not etag.startswith('W/')
+        assert "immutable" in response.headers["cache-control"]
+        assert response.headers["x-cache"] in ("HIT", "MISS")
+
+        again = await client.get("/api/v1/calculate/power/3", params={"exponent": 40})
+        assert again.headers["etag"] == etag and again.content == response.content
+        other = await client.get("/api/v1/calculate/power/3", params={"exponent": 41})
+        assert other.headers["etag"] != etag
+
+        history = await client.get("/api/v1/history", params={"limit": 1})
+        last_id = history.json()[0]["id"]
+        response = await client.get(
+            "/api/v1/calculate/power/3", params={"exponent": 40},
+            headers={"If-None-Match": f'"other", W/{etag}'}
+        )
+        assert response.status_code == 304 and response.headers["etag"] == etag
+        history = await client.get("/api/v1/history", params={"limit": 1})
+        assert history.json()[0]["id"] == last_id
+
+        monkeypatch.setattr(settings, "HTTP_LOG_CONDITIONAL_HITS", True)
+        response = await client.get(
+            "/api/v1/calculate/power/3", params={"exponent": 40}, headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+        history = await client.get("/api/v1/history", params={"limit": 1})
+        assert history.json()[0]["id"] > last_id
+
+        response = await client.get("/api/v1/calculate/power/3")
+        assert response.status_code == 422
+        response = await client.get(
+            "/api/v1/calculate/linear_recurrence/10",
+            params={"coefficients": [1, 1], "initial_terms": [2, 1]}
+        )
+        assert response.json()["result"] == 123
+
+
+@pytest.mark.asyncio
+async def test_rate_limit(monkeypatch):
+    """Test clients are billed by computation cost, with cache hits nearly free."""
+    monkeypatch.setattr(settings, "RATE_LIMIT_COST_UNIT", 1000)
+    monkeypatch.setattr(settings, "RATE_LIMIT_CLIENT_HEADER", "x-client")
+    limiter = MemoryRateLimiter(capacity=10, refill_per_second=1, max_concurrent=4)
+    expensive = {"operation": "factorial", "value": 5011}
+
+    async with AsyncClient(app=RateLimitMiddleware(app, limiter), base_url="http://test") as client:
+        # About 54 tokens of work: admitted, leaving the bucket in debt
+        response = await client.post("/api/v1/calculate", json=expensive, headers={"x-client": "a"})
+        assert response.status_code == 200
+        response = await client.post("/api/v1/calculate", json=expensive, headers={"x-client": "a"})
+        assert response.status_code == 429
+        assert 40 <= int(response.headers["Retry-After"]) <= 50
+        response = await client.get("/api/v1/health", headers={"x-client": "a"})
+        assert response.status_code == 200
+
+        # The same result from the cache only costs the flat request fee
+        for _ in range(20):
+            response = await client.post(
+                "/api/v1/calculate", json=expensive, headers={"x-client": "b"}
+            )
+            assert response.status_code == 200
+            assert response.json()["cached"] is True
+
+
+@pytest.mark.asyncio
+async def test_forwarded_client_identity(monkeypatch):
+    """Test the billed client of a forwarded request is believed only from a peer."""
+    monkeypatch.setattr(settings, "CLUSTER_PEERS", ["http://10.0.0.2:8000", "http://10.0.0.3:8000"])
+    monkeypatch.setattr(settings, "CLUSTER_SECRET", None)
+    forged = Headers({FORWARDED_HEADER: "http://10.0.0.3:8000", CLIENT_HEADER: "victim"})
+    assert client_identity({"client": ("203.0.113.9", 1)}, forged) == "203.0.113.9"
+    assert client_identity({"client": ("10.0.0.3", 1)}, forged) == "victim"
+
+    monkeypatch.setattr(settings, "CLUSTER_SECRET", "s3cret")
+    assert client_identity({"client": ("10.0.0.3", 1)}, forged) == "10.0.0.3"
+    signed = Headers({
+        FORWARDED_HEADER: "http://10.0.0.3:8000", CLIENT_HEADER: "victim", SECRET_HEADER: "s3cret"
+    })
+    assert client_identity({"client": ("198.51.100.7", 1)}, signed) == "victim"
+
+    sent = []
+
+    def peer(request: httpx.Request) -> httpx.Response:
+        sent.append(request)
+        return httpx.Response(200)
+
+    router = ClusterRouter(
+        node_url="http://a", peers=["http://a", "http://b"], transport=httpx.MockTransport(peer)
+    )
+    await router.forward("http://b", "GET", "/api/v1/health", b"", {})
+    assert sent[0].headers[SECRET_HEADER] == "s3cret"
+    await router.close()
+
+
+def test_websocket_rate_limit(monkeypatch):
+    """Test every WebSocket message is billed like a request."""
+    monkeypatch.setattr(settings, "RATE_LIMIT_COST_UNIT", 1000)
+    monkeypatch.setattr(
+        ratelimit, "rate_limiter",
+        MemoryRateLimiter(capacity=10, refill_per_second=1, max_concurrent=4)
+    )
+    with TestClient(app).websocket_connect("/api/v1/ws") as websocket:
+        # About 54 tokens of work: admitted, leaving the bucket in debt
+        websocket.send_text(json.dumps({"id": 1, "operation": "factorial", "value": 5039}))
+        first = json.loads(websocket.receive_text())
+        websocket.send_text(json.dumps({"id": 2, "operation": "fibonacci", "value": 10}))
+        second = json.loads(websocket.receive_text())
+
+    assert first["result"] == math.factorial(5039)
+    assert second["id"] == 2 and second["error"] == "Rate limit exceeded"
+    assert 40 <= second["retry_after"] <= 50
+
+
+@pytest.mark.asyncio
+async def test_load_shedding(monkeypatch):
+    """Test computations that cannot get a slot in time are shed with 503."""
+    monkeypatch.setattr(settings, "SCHEDULER_INTERACTIVE_TIMEOUT_SECONDS", 0.05)
+    scheduler = AdmissionScheduler(max_concurrent=2)
+    monkeypatch.setattr(registry, "scheduler", scheduler)
+    release = asyncio.Event()
+
+    async def occupy():
+        async with scheduler.slot(0):
+            await release.wait()
+
+    # Offloaded, so it needs a slot
+    offloaded = {"operation": "factorial", "value": 20011}
+    holders = [asyncio.create_task(occupy()) for _ in range(2)]
+    await asyncio.sleep(0)
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/api/v1/calculate", json=offloaded)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        # Endpoints that compute nothing do not wait
+        response = await client.get("/api/v1/health")
+        assert response.status_code == 200
+
+        release.set()
+        await asyncio.gather(*holders)
+        response = await client.post("/api/v1/calculate", json=offloaded)
+        assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_sequence_holds_scheduler_slot(monkeypatch):
+    """Test sequence streams are shed when no slot is free and hold one while streaming."""
+    monkeypatch.setattr(settings, "SCHEDULER_INTERACTIVE_TIMEOUT_SECONDS", 0.05)
+    scheduler = AdmissionScheduler(max_concurrent=2, metrics=MetricsRegistry())
+    monkeypatch.setattr(endpoints, "scheduler", scheduler)
+    release = asyncio.Event()
+
+    async def occupy():
+        async with scheduler.slot(0):
+            await release.wait()
+
+    body = {"operation": "fibonacci", "start": 0, "stop": 2000}
+    holders = [asyncio.create_task(occupy()) for _ in range(2)]
+    await asyncio.sleep(0)
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/api/v1/sequence", json=body)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+        release.set()
+        await asyncio.gather(*holders)
+        response = await client.post("/api/v1/sequence", json=body)
+        assert response.status_code == 200
+        assert len(response.text.splitlines()) == 2001
+    # Granted to the two holders and the stream, and released when the stream ended
+    assert scheduler.metrics.histogram("scheduler.wait.interactive").count == 3
+    assert scheduler.snapshot()["running"] == 0
+
+
+@pytest.mark.asyncio
+async def test_history_archive(monkeypatch, tmp_path):
+    """Test archived and recent history stream back together, oldest first."""
+    archiver = HistoryArchiver(directory=tmp_path, retention_days=1)
+    monkeypatch.setattr(endpoints, "history_archiver", archiver)
+    async with AsyncSessionLocal() as db:
+        db.add_all([
+            OperationHistory(operation="fibonacci", input_value=value, result=str(result),
+                             computation_time_ms=0.1, created_at=datetime(2001, 3, day))
+            for value, result, day in [(10, 55, 1), (11, 89, 2)]
+        ])
+        await db.commit()
+    assert await archiver.archive(datetime(2001, 3, 10)) >= 2
+
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        response = await client.post("/api/v1/calculate", json={"operation": "fibonacci", "value": 12})
+        assert response.status_code == 200
+
+        params = {"operation": "fibonacci", "start": "2001-03-01T00:00:00"}
+        response = await client.get("/api/v1/history/archive", params=params)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        items = [json.loads(line) for line in response.text.splitlines()]
+        assert [item["result"] for item in items[:2]] == [55, 89]
+        assert 144 in [item["result"] for item in items[2:]]
+
+        response = await client.get(
+            "/api/v1/history/archive",
+            params={**params, "end": "2001-03-02T00:00:00+00:00", "include_recent": "false"}
+        )
+        assert [json.loads(line)["input_value"] for line in response.text.splitlines()] == [10]
+
+
+@pytest.mark.asyncio
+async def test_operation_stats(monkeypatch):
+    """Test calculations are counted per operation and served from the rollups."""
+    rollups = OperationRollups()
+    monkeypatch.setattr(endpoints, "operation_rollups", rollups)
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        for _ in range(3):
+            response = await client.post("/api/v1/calculate", json={"operation": "fibonacci", "value": 31})
+            assert response.status_code == 200
+        await rollups.flush()
+
+        response = await client.get(
+            "/api/v1/stats/operations", params={"granularity": "hour", "operation": "fibonacci"}
+        )
+        assert response.status_code == 200
+        (bucket,) = response.json()
+        assert bucket["count"] == 3
+        assert bucket["cache_hits"] >= 2
+        assert bucket["computation"]["count"] == 3 - bucket["cache_hits"]
+
+        response = await client.get("/api/v1/stats/operations", params={"granularity": "day"})
+        assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_history_hit_aggregation(monkeypatch):
+    """Test cache hits under the aggregate policy are counted instead of written."""
+    policy = HistoryPolicy(default="aggregate", counters=HitCounters())
+    monkeypatch.setattr(endpoints, "history_policy", policy)
+    calculation = {"operation": "fibonacci", "value": 4099}
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        async def written():
+            response = await client.get("/api/v1/history", params={"operation": "fibonacci", "limit": 1000})
+            return sum(item["input_value"] == 4099 for item in response.json())
+
+        before = await written()
+        for _ in range(4):
+            response = await client.post("/api/v1/calculate", json=calculation)
+            assert response.status_code == 200
+        assert response.json()["cached"] is True
+        # Only the miss, if this run computed it, was written
+        assert await written() - before <= 1
+
+        await policy.counters.flush()
+        response = await client.get("/api/v1/history/hits", params={"operation": "fibonacci"})
+        assert response.status_code == 200
+        hits = {item["input_value"]: item["hits"] for item in response.json()}
+        assert hits[4099] >= 3
+
+
+@pytest.mark.asyncio
+async def test_history_recent_pages(monkeypatch):
+    """Test recent history pages come from memory and match the database."""
+    recent = RecentHistory(size=50)
+    await recent.load()
+    monkeypatch.setattr(endpoints, "recent_history", recent)
+    async with AsyncClient(app=app, base_url="http://test") as client:
+        for value in (5, 6, 7):
+            response = await client.post("/api/v1/calculate", json={"operation": "factorial", "value": value})
+            assert response.status_code == 200
+
+        params = {"operation": "factorial", "limit": 3}
+        assert [row.input_value for row in recent.page(0, 3, "factorial")] == [7, 6, 5]
+        from_memory = (await client.get("/api/v1/history", params=params)).json()
+        monkeypatch.setattr(endpoints, "recent_history", RecentHistory(size=0))
+        from_database = (await client.get("/api/v1/history", params=params)).json()
+        assert from_memory == from_database
+        assert [item["result"] for item in from_memory] == [5040, 720, 120]
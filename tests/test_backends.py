@@ -0,0 +1,76 @@
+"""Differential tests across arithmetic backends."""
+import math
+import random
+
+import pytest
+
+from app.services.backends import available_backends, get_backend, fibonacci_pair
+
+
+BACKENDS = available_backends()
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    """Each backend usable in this environment."""
+    return get_backend(request.param)
+
+
+def test_python_backend_always_available():
+    """Test the pure-Python fallback can always be selected."""
+    assert "python" in BACKENDS
+    assert get_backend("python").name == "python"
+
+
+def test_unknown_backend():
+    """Test selecting an unknown backend fails."""
+    with pytest.raises(ValueError, match="Unknown arithmetic backend"):
+        get_backend("nope")
+
+
+def test_fac(backend):
+    """Test factorial against math.factorial."""
+    for n in list(range(0, 200)) + [1000, 5001, 20000]:
+        result = backend.fac(n)
+        assert type(result) is int
+        assert result == math.factorial(n)
+
+
+def test_fib(backend):
+    """Test Fibonacci against the iterative definition."""
+    prev, curr = 0, 1
+    for n in range(0, 2000):
+        assert backend.fib(n) == prev
+        prev, curr = curr, prev + curr
+    assert backend.fib(100000) == fibonacci_pair(100000)[0]
+
+
+def test_pow_and_mul(backend):
+    """Test pow and mul against built-in ints."""
+    rng = random.Random(30)
+    for _ in range(500):
+        base = rng.randint(-10 ** 6, 10 ** 6)
+        exponent = rng.randint(0, 300)
+        assert backend.pow(base, exponent) == pow(base, exponent)
+        a = rng.randint(-10 ** 500, 10 ** 500)
+        b = rng.randint(-10 ** 500, 10 ** 500)
+        assert backend.mul(a, b) == a * b
+
+
+def test_product_range(backend):
+    """Test range products against a plain loop."""
+    for lo, hi in [(1, 1), (2, 3), (5, 40), (17, 1000), (1000, 4000)]:
+        expected = 1
+        for i in range(lo, hi):
+            expected *= i
+        assert backend.product_range(lo, hi) == expected
+
+
+@pytest.mark.skipif(len(BACKENDS) < 2, reason="gmpy2 is not installed")
+def test_backends_agree():
+    """Test every backend returns identical results on large inputs."""
+    results = [
+        (b.fac(30000), b.fib(200000), b.pow(3, 100000), b.product_range(10 ** 5, 2 * 10 ** 5))
+        for b in map(get_backend, BACKENDS)
+    ]
+    assert all(result == results[0] for result in results)
@@ -1,8 +1,46 @@
 """Service layer tests."""
+import asyncio
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from datetime import datetime, timedelta
+from multiprocessing import get_context
+
 import pytest
+from sqlalchemy import select, text
+from sqlalchemy.exc import OperationalError
+
+from app.core.config import settings
+from app.db.base import AsyncSessionLocal, engine, read_engine
+from app.models.database import OperationHistory
+from app.services import registry
+from app.services import vectorized
 
 from app.services.calculator import CalculatorService
-from app.services.cache import CacheService
+from app.services.cache import CacheService, cache_service
+from app.services import jobs
+from app.services.history import HistoryBatch, HistoryPolicy, HitCounters, RecentHistory
+from app.services.jobs import JobService
+from app.services.ratelimit import MemoryRateLimiter, billing, charge
+from app.services.retention import HistoryArchiver
+from app.services.rollups import HOUR, MINUTE, OperationRollups, bucket_start
+from app.services.scheduler import AdmissionScheduler, OverloadedError
+from app.services.cache_policy import TinyLFUPolicy, create_policy
+from app.services.shared_cache import SharedMemoryCache
+from app.services.lazy import LazyPower
+from app.services.backends import product_range
+from app.services.combinatorics import binomial, binomial_exponents, permutation
+from app.services.recurrence import PRESETS, kitamasa, linear_recurrence
+from app.services.routing import HashRing
+from app.services.stats import CacheMetrics, CountMinSketch, LatencyHistogram, TopKeys
+from app.services import parallel
+from app.services.parallel import balanced_bounds
+from app.services.primes import (
+    SEGMENT_SPAN, is_prime, next_prime, nth_prime, prime_count, small_primes
+)
+from app.utils.encoding import RawJSON, dumps
 
 
 @pytest.mark.asyncio
@@ -115,4 +153,863 @@ async def test_cache_service():
     # Clear cache
     await cache.clear()
     stats = await cache.get_stats()
-    assert stats['size'] == 0
\ No newline at end of file
+    assert stats['size'] == 0
+
+
+def test_sequence_matches_single_calculations():
+    """Test sequence iteration against the single-value implementations."""
+    calculator = CalculatorService()
+
+    fib = list(calculator.sequence("fibonacci", 0, 30))
+    assert fib == [(n, calculator._fibonacci_dp(n)) for n in range(31)]
+
+    fib_step = list(calculator.sequence("fibonacci", 5, 50, step=7))
+    assert fib_step == [(n, calculator._fibonacci_dp(n)) for n in range(5, 51, 7)]
+
+    fact = list(calculator.sequence("factorial", 3, 20, step=4))
+    assert fact == [(n, calculator._factorial_iterative(n)) for n in range(3, 21, 4)]
+
+    powers = list(calculator.sequence("power", 2, 12, step=5, base=3))
+    assert powers == [(2, 9), (7, 2187), (12, 531441)]
+
+
+def test_sequence_modular():
+    """Test sequence values reduced by a modulus."""
+    calculator = CalculatorService()
+    modulus = 1_000_007
+
+    fib = list(calculator.sequence("fibonacci", 100, 120, step=3, modulus=modulus))
+    assert fib == [
+        (n, calculator._fibonacci_dp(n) % modulus) for n in range(100, 121, 3)
+    ]
+
+    fact = list(calculator.sequence("factorial", 0, 5, modulus=1))
+    assert all(value == 0 for _, value in fact)
+
+    powers = list(calculator.sequence("power", 0, 40, step=10, base=7, modulus=modulus))
+    assert powers == [(e, pow(7, e, modulus)) for e in range(0, 41, 10)]
+
+
+@pytest.mark.asyncio
+async def test_power_many_matches_pow():
+    """Test batched powers match pow() exactly, including fallbacks."""
+    calculator = CalculatorService()
+    bases = [b for b in range(-12, 13) for _ in range(-20, 41)]
+    exponents = [e for _ in range(-12, 13) for e in range(-20, 41)]
+    pairs = [(b, e) for b, e in zip(bases, exponents) if not (b == 0 and e < 0)]
+    # Overflowing results and NumPy-inexact negative powers must take the exact path
+    pairs += [(3, 45), (-7, 31), (10, -17), (-10, -5), (5, -17), (7, -41), (5, -5), (-5, -5)]
+    assert len(pairs) >= vectorized.MIN_VECTOR_SIZE
+
+    results, time_ms = await calculator.power_many(
+        [b for b, _ in pairs], [e for _, e in pairs]
+    )
+    expected = [pow(b, e) for b, e in pairs]
+    assert results == expected
+    assert [type(r) for r in results] == [type(r) for r in expected]
+    assert time_ms >= 0
+    if vectorized.np is not None:
+        small = vectorized.power_small([b for b, _ in pairs], [e for _, e in pairs])
+        assert sum(value is not None for value in small) > len(pairs) // 3
+
+    # Operands beyond int64 make the whole batch fall back to pow()
+    oversized = [(2 ** 70, 3), (10, -400), (5, 2 ** 70 // 2 ** 69)] * 6
+    results, _ = await calculator.power_many(
+        [b for b, _ in oversized], [e for _, e in oversized]
+    )
+    assert results == [pow(b, e) for b, e in oversized]
+
+    with pytest.raises(ValueError):
+        await calculator.power_many([0] * 20, [-1] * 20)
+
+
+def test_power_small_vectorizes_in_range_batches():
+    """Test NumPy computes the machine-sized elements and leaves the rest to the caller."""
+    pytest.importorskip("numpy")
+    bases = list(range(-8, 8)) + [3, 10, 0, 2]
+    exponents = [5] * 16 + [45, -17, -1, 62]
+    assert len(bases) >= vectorized.MIN_VECTOR_SIZE
+    small = vectorized.power_small(bases, exponents)
+    assert small[:16] == [b ** 5 for b in range(-8, 8)]
+    assert all(type(value) is int for value in small[:16])
+    # Too large, negative exponents (not correctly rounded by NumPy) and errors
+    assert small[16:19] == [None, None, None]
+    assert small[19] == 2 ** 62
+
+
+@pytest.mark.asyncio
+async def test_lazy_power():
+    """Test lazy power answers match the materialized value."""
+    calculator = CalculatorService()
+
+    for base, exponent in [(3, 5000), (-7, 1001), (2, 4097), (-8, 3000), (10, 600), (0, 9)]:
+        lazy, _ = await calculator.power(base, exponent, lazy=True)
+        value = pow(base, exponent)
+        assert lazy.value == value
+        assert lazy.digit_count() == len(str(abs(value)))
+        assert lazy.bit_length() == abs(value).bit_length()
+        assert lazy.leading_digits(12) == int(str(abs(value))[:12])
+        assert lazy.mod(1_000_000_007) == value % 1_000_000_007
+
+    # Comparisons use logarithms and settle ties exactly
+    lazy_a, _ = await calculator.power(4, 300000, lazy=True)
+    lazy_b, _ = await calculator.power(2, 600001, lazy=True)
+    assert lazy_a < lazy_b
+    assert lazy_a == LazyPower(2, 600000)
+
+    # Huge exponents stay cheap unless the digits are requested
+    huge = LazyPower(3, 10 ** 18)
+    assert huge.digit_count() == 477121254719662438
+    assert huge.leading_digits(10) == 1972549467
+
+
+@pytest.mark.asyncio
+async def test_factorial_parallel_matches_sequential():
+    """Test the process-pool product tree against the sequential path."""
+    calculator = CalculatorService()
+
+    for n in [0, 1, 2, 7, 3000]:
+        parallel_result, _ = await calculator.factorial(n, parallel=True)
+        sequential_result, _ = await calculator.factorial(n, parallel=False)
+        assert parallel_result == sequential_result == calculator._factorial_iterative(n)
+
+
+@pytest.mark.asyncio
+async def test_parallel_product_multiplies_only_in_pool(monkeypatch):
+    """Test every multiplication of the product tree, the last included, runs in the pool."""
+    monkeypatch.setattr(settings, "FACTORIAL_PARALLEL_WORKERS", 3)
+    parallel.shutdown_pool()
+    try:
+        # Start the workers before the backend is taken away from this process
+        assert await parallel.parallel_product_range(2, 50) == math.factorial(49)
+
+        def no_backend():
+            raise AssertionError("multiplied on the event loop")
+
+        monkeypatch.setattr(parallel, "get_backend", no_backend)
+        assert await parallel.parallel_product_range(2, 7001) == math.factorial(7000)
+    finally:
+        parallel.shutdown_pool()
+
+
+def test_balanced_bounds():
+    """Test factorial chunks cover the range with similar product sizes."""
+    bounds = balanced_bounds(2, 100001, 8)
+    assert bounds[0] == 2 and bounds[-1] == 100001
+    assert bounds == sorted(set(bounds))
+
+    sizes = [product_range(a, b).bit_length() for a, b in zip(bounds, bounds[1:])]
+    assert max(sizes) / min(sizes) < 1.05
+
+
+@pytest.mark.asyncio
+async def test_registry_executors(monkeypatch):
+    """Test every executor produces the same results."""
+    monkeypatch.setattr(settings, "INLINE_COST_THRESHOLD", 0)
+    for name, value, exponent in [("power", 7, 300), ("fibonacci", 500, None),
+                                  ("factorial", 300, None)]:
+        spec = registry.get_operation(name)
+        result, time_ms = await registry.run(spec, value, exponent)
+        for executor in registry.EXECUTORS:
+            other = replace(spec, executor=executor)
+            assert (await registry.run(other, value, exponent))[0] == result
+        assert spec.deserialize(spec.serialize(result)) == result
+        assert time_ms >= 0
+
+
+@pytest.mark.asyncio
+async def test_registry_execute_caches():
+    """Test registry execution goes through the cache."""
+    await cache_service.clear()
+    first = await registry.execute("fibonacci", 77)
+    second = await registry.execute("fibonacci", 77)
+    assert first[0] == second[0] == 5527939700884757
+    assert first[2] is False and second[2] is True
+
+    with pytest.raises(ValueError, match="Unsupported operation"):
+        await registry.execute("unknown", 1)
+
+
+@pytest.mark.asyncio
+async def test_registry_execute_many():
+    """Test batch execution keeps request order across vectorized groups."""
+    requests = [("power", 2, 5, None), ("factorial", 5, None, None), ("power", 4, -1, None),
+                ("fibonacci", 10, None, None), ("binomial", 10, 3, {"modulus": 7})]
+    outcomes = await registry.execute_many(requests)
+    assert [result for result, _, _ in outcomes] == [32, 120, 0.25, 55, 1]
+
+
+@pytest.mark.asyncio
+async def test_registry_execute_many_sends_large_powers_through_cache():
+    """Test only machine-sized powers are vectorized; the rest are cached like single calls."""
+    await cache_service.clear()
+    requests = [("power", base, 3, None) for base in range(20)] + [("power", 3, 500, None)]
+    outcomes = await registry.execute_many(requests)
+    assert [result for result, _, _ in outcomes] == [pow(b, e) for _, b, e, _ in requests]
+    assert await cache_service.get("power", 3, 500) == 3 ** 500
+    assert await cache_service.get("power", 2, 3) is None
+
+    outcomes = await registry.execute_many(requests)
+    assert outcomes[-1][2] is True
+
+
+@pytest.mark.asyncio
+async def test_registry_execute_many_waits_for_scheduler(monkeypatch):
+    """Test large vectorized groups run on a thread under a scheduler slot."""
+    monkeypatch.setattr(settings, "SCHEDULER_INTERACTIVE_TIMEOUT_SECONDS", 0.05)
+    scheduler = AdmissionScheduler(max_concurrent=2)
+    monkeypatch.setattr(registry, "scheduler", scheduler)
+    release = asyncio.Event()
+
+    async def occupy():
+        async with scheduler.slot(0):
+            await release.wait()
+
+    # 5000 results of 40 bits: above INLINE_COST_THRESHOLD together
+    requests = [("power", 2, 40, None)] * 5000
+    holders = [asyncio.create_task(occupy()) for _ in range(2)]
+    await asyncio.sleep(0)
+    with pytest.raises(OverloadedError):
+        await registry.execute_many(requests)
+    # Cheap groups still run inline
+    outcomes = await registry.execute_many(requests[:20])
+    assert [result for result, _, _ in outcomes] == [2 ** 40] * 20
+
+    release.set()
+    await asyncio.gather(*holders)
+    outcomes = await registry.execute_many(requests)
+    assert outcomes[0][0] == 2 ** 40 and outcomes[-1][2] is False
+
+
+def test_registry_deserialize_history():
+    """Test history results parse back per operation."""
+    assert registry.deserialize_result("power", "0.25") == 0.25
+    assert registry.deserialize_result("factorial", "120") == 120
+    assert registry.deserialize_result("fibonacci_sequence", "[0, 10, 1]") == [0, 10, 1]
+
+
+def test_is_prime():
+    """Test Miller-Rabin below 64 bits and BPSW above."""
+    sieve = set(small_primes(10000))
+    assert [n for n in range(10000) if is_prime(n)] == sorted(sieve)
+
+    # Carmichael numbers and strong pseudoprimes to many bases
+    for composite in [561, 3215031751, 3825123056546413051, 318665857834031151167461]:
+        assert not is_prime(composite)
+    assert is_prime(2 ** 61 - 1)
+    assert is_prime(2 ** 127 - 1)
+    assert not is_prime((2 ** 61 - 1) * (2 ** 89 - 1))
+    assert next_prime(2 ** 64) == 2 ** 64 + 13
+
+
+@pytest.mark.asyncio
+async def test_prime_count_and_nth_prime():
+    """Test sieve-backed and analytic prime counting agree."""
+    await cache_service.clear()
+    assert await prime_count(100, sieve_limit=10 ** 7) == 25
+    assert await prime_count(3 * SEGMENT_SPAN + 5, sieve_limit=10 ** 7) == \
+        await prime_count(3 * SEGMENT_SPAN + 5, sieve_limit=0)
+    assert await prime_count(10 ** 8, sieve_limit=0) == 5761455
+
+    assert [await nth_prime(n, sieve_limit=10 ** 7) for n in range(1, 11)] == \
+        [2, 3, 5, 7, 11, 13, 17, 19, 23, 29]
+    assert await nth_prime(10 ** 6, sieve_limit=10 ** 7) == 15485863
+
+    # Segments and base primes are kept in the shared result cache
+    assert await cache_service.get("prime_segment", 0) is not None
+
+
+def test_binomial():
+    """Test every binomial strategy against math.comb."""
+    import math
+    for n, k in [(10, 3), (1000, 500), (5000, 1234), (30, 0), (30, 31)]:
+        expected = math.comb(n, k)
+        assert binomial(n, k) == expected
+        # Factorization path and product tree path
+        assert binomial(n, k, sieve_limit=0) == expected
+        for modulus in [1, 2, 97, 1000, 1001, 10 ** 9 + 7]:
+            assert binomial(n, k, modulus) == expected % modulus
+            # Beyond the sieve: Lucas per prime with CRT, or the exact value reduced
+            assert binomial(n, k, modulus, sieve_limit=0) == expected % modulus
+
+    exponents = binomial_exponents(1000, 500)
+    assert math.prod(p ** e for p, e in exponents.items()) == math.comb(1000, 500)
+
+    # Lucas' theorem for n far beyond anything that could be multiplied out
+    assert binomial(10 ** 18, 10 ** 9, 13) == math.comb(10 ** 18 % 13, 10 ** 9 % 13) * \
+        binomial(10 ** 18 // 13, 10 ** 9 // 13, 13) % 13
+    # Squarefree composite moduli too, one prime at a time
+    huge = binomial(10 ** 18, 10 ** 9, 7 * 11 * 13)
+    assert all(huge % p == binomial(10 ** 18, 10 ** 9, p) for p in (7, 11, 13))
+
+
+def test_permutation():
+    """Test k-permutations with and without a modulus."""
+    import math
+    for n, k in [(10, 3), (500, 500), (500, 0), (5, 6)]:
+        assert permutation(n, k) == math.perm(n, k)
+        assert permutation(n, k, 1009) == math.perm(n, k) % 1009
+    assert permutation(10 ** 12, 10 ** 6, 10 ** 6) == 0
+
+
+@pytest.mark.asyncio
+async def test_registry_params():
+    """Test extra parameters reach the operation and are part of the cache key."""
+    await cache_service.clear()
+    plain = await registry.execute("binomial", 50, 25)
+    reduced = await registry.execute("binomial", 50, 25, {"modulus": 1000})
+    assert reduced[0] == plain[0] % 1000
+    assert reduced[2] is False
+
+    with pytest.raises(ValueError, match="does not accept modulus"):
+        await registry.execute("factorial", 5, None, {"modulus": 7})
+
+
+def _naive_terms(coefficients, initial_terms, count):
+    terms = list(initial_terms)
+    while len(terms) < count:
+        terms.append(sum(c * terms[-i] for i, c in enumerate(coefficients, 1)))
+    return terms[:count]
+
+
+def test_linear_recurrence():
+    """Test Kitamasa against direct iteration for presets and custom recurrences."""
+    cases = list(PRESETS.values()) + [((3,), (5,)), ((0, 2, -1, 4), (1, -2, 3, 7))]
+    for coefficients, initial_terms in cases:
+        expected = _naive_terms(coefficients, initial_terms, 300)
+        assert [kitamasa(coefficients, initial_terms, n) for n in range(300)] == expected
+        assert [kitamasa(coefficients, initial_terms, n, 1009) for n in range(300)] == \
+            [term % 1009 for term in expected]
+
+    assert linear_recurrence(10, preset="lucas") == 123
+    assert linear_recurrence(10 ** 18, preset="fibonacci", modulus=10 ** 9 + 7) == \
+        kitamasa((1, 1), (0, 1), 10 ** 18, 10 ** 9 + 7)
+    with pytest.raises(ValueError):
+        linear_recurrence(5, coefficients=[1, 1], initial_terms=[1])
+    with pytest.raises(ValueError):
+        linear_recurrence(5, preset="unknown")
+
+
+def test_latency_histogram():
+    """Test histogram percentiles stay within one bucket of the exact values."""
+    histogram = LatencyHistogram()
+    for micros in range(1, 10001):
+        histogram.record(micros / 1_000_000)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 10000
+    assert snapshot["max_ms"] == 10.0
+    for percent, exact_ms in [(50.0, 5.0), (90.0, 9.0), (99.0, 9.9)]:
+        assert exact_ms <= histogram.percentile(percent) <= exact_ms * 1.13
+
+
+def test_count_min_sketch_and_top_keys():
+    """Test the sketch never undercounts and heavy hitters surface."""
+    sketch = CountMinSketch(width=64)
+    for i in range(1000):
+        sketch.add(i % 100)
+    assert all(sketch.estimate(key) >= 10 for key in range(100))
+    sketch.halve()
+    assert sketch.estimate(0) >= 5
+
+    top = TopKeys(size=3)
+    for i in range(5000):
+        top.add(f"hot{i % 3}" if i % 2 else f"cold{i}")
+    assert {item["key"] for item in top.top()} == {"hot0", "hot1", "hot2"}
+
+
+@pytest.mark.asyncio
+async def test_cache_metrics(monkeypatch):
+    """Test the cache counts hits, misses, expirations and evictions."""
+    cache = CacheService(max_size=2, ttl_seconds=60)
+    cache._metrics = CacheMetrics(sample_rate=1.0)
+    await cache.set("power", 2, 4, exponent=2)
+    await cache.get("power", 2, exponent=2)
+    await cache.get("power", 3, exponent=2)
+    await cache.set("fibonacci", 10, 55)
+    await cache.set("factorial", 5, 120)  # evicts power:2:2
+
+    cache._cache["fibonacci:10"]["expires_at"] = cache._cache["fibonacci:10"]["created_at"]
+    assert await cache.get("fibonacci", 10) is None
+
+    stats = await cache.get_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+    assert stats["operations"]["power"]["hit_ratio"] == 0.5
+    assert stats["expirations"] == 1 and stats["evictions"] == 1
+    assert stats["latency"]["get"]["count"] == 3
+    assert stats["hot_keys"][0]["key"] in {"power:2:2", "power:3:2", "fibonacci:10"}
+
+
+def test_tinylfu_resists_scans():
+    """Test a scan of one-off keys does not flush frequently used ones."""
+    policy = TinyLFUPolicy(100)
+    resident = set()
+
+    def access(key):
+        policy.record(key)
+        if key in resident:
+            policy.touch(key)
+            return True
+        resident.difference_update(policy.insert(key))
+        resident.add(key)
+        return False
+
+    for _ in range(20):
+        for key in range(50):
+            access(f"hot{key}")
+    for key in range(1000):
+        access(f"scan{key}")
+    assert len(resident) <= 100
+    assert sum(access(f"hot{key}") for key in range(50)) == 50
+
+    with pytest.raises(ValueError, match="Unknown cache policy"):
+        create_policy("fifo", 10)
+
+
+@pytest.mark.asyncio
+async def test_cache_service_tinylfu():
+    """Test the cache stays within its size under the TinyLFU policy."""
+    cache = CacheService(max_size=10, ttl_seconds=60, policy="tinylfu")
+    for value in range(100):
+        await cache.set("fibonacci", value, value)
+        await cache.get("fibonacci", value % 5)
+    stats = await cache.get_stats()
+    assert stats["policy"] == "tinylfu"
+    assert stats["size"] <= 10
+    assert stats["evictions"] == 100 - stats["size"]
+
+
+@pytest.mark.asyncio
+async def test_cache_active_expiry():
+    """Test expired entries are freed without being read, with per-entry TTLs."""
+    cache = CacheService(max_size=100, ttl_seconds=60)
+    for value in range(10):
+        await cache.set("factorial", value, value, ttl_seconds=0)
+    await cache.set("factorial", 10, 10)
+    await cache.set("factorial", 11, 11, ttl_seconds=3600)
+    # Setting a key again supersedes its earlier deadline
+    await cache.set("factorial", 0, 0, ttl_seconds=3600)
+
+    assert await cache.expire(max_entries=4) == 4
+    assert await cache.expire() == 6
+    stats = await cache.get_stats()
+    assert stats["size"] == 3
+    assert stats["expirations"] == 9
+    assert await cache.get("factorial", 0) == 0
+
+    cache.start_expiry(interval=0.01)
+    await cache.set("factorial", 12, 12, ttl_seconds=0)
+    await asyncio.sleep(0.05)
+    await cache.stop_expiry()
+    assert "factorial:12" not in cache._cache
+
+
+def _shared_cache_set(name, value):
+    cache = SharedMemoryCache(name=name)
+    asyncio.run(cache.set("factorial", value, 10 ** 500 + value))
+    cache.close()
+
+
+@pytest.fixture
+def shared_cache():
+    """A small shared memory cache, unlinked afterwards."""
+    cache = SharedMemoryCache(name=f"test_cache_{os.getpid()}", slots=64, arena_bytes=8192)
+    assert cache.owner
+    yield cache
+    cache.close()
+    cache.unlink()
+
+
+@pytest.mark.asyncio
+async def test_shared_cache(shared_cache):
+    """Test entries are visible across attachments and processes."""
+    await shared_cache.set("power", 2, 2 ** 1000, exponent=1000)
+    await shared_cache.set("is_prime", 7, True)
+    await shared_cache.set("power_lazy", 3, LazyPower(3, 10 ** 6), exponent=10 ** 6)
+
+    other = SharedMemoryCache(name=shared_cache.name)
+    assert not other.owner
+    assert await other.get("power", 2, exponent=1000) == 2 ** 1000
+    assert await other.get("is_prime", 7) is True
+    assert (await other.get("power_lazy", 3, exponent=10 ** 6)).digit_count() == 477122
+    other.close()
+
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        await loop.run_in_executor(pool, _shared_cache_set, shared_cache.name, 5)
+    assert await shared_cache.get("factorial", 5) == 10 ** 500 + 5
+
+
+@pytest.mark.asyncio
+async def test_shared_cache_arena_and_expiry(shared_cache):
+    """Test overwritten arena bytes read as misses and expired slots are freed."""
+    await shared_cache.set("power", 2, 2 ** 1000, exponent=1000)
+    for value in range(60):
+        await shared_cache.set("factorial", value, 10 ** 300 + value)
+    assert await shared_cache.get("power", 2, exponent=1000) is None
+    assert await shared_cache.get("factorial", 59) == 10 ** 300 + 59
+
+    await shared_cache.clear()
+    await shared_cache.set("fibonacci", 10, 55, ttl_seconds=0)
+    await shared_cache.set("fibonacci", 11, 89)
+    assert await shared_cache.get("fibonacci", 10) is None
+    assert await shared_cache.expire(64) == 1
+    stats = await shared_cache.get_stats()
+    assert stats["size"] == 1 and stats["expirations"] == 1
+
+
+def test_hash_ring():
+    """Test keys spread over the ring and only a removed node's keys move."""
+    nodes = ["http://a:8000", "http://b:8000", "http://c:8000"]
+    ring = HashRing(nodes, replicas=100)
+    keys = [f"factorial:{value}" for value in range(3000)]
+    owners = {key: ring.node_for(key) for key in keys}
+    for node in nodes:
+        assert 600 < list(owners.values()).count(node) < 1400
+
+    smaller = HashRing(nodes[:2], replicas=100)
+    for key, owner in owners.items():
+        if owner != nodes[2]:
+            assert smaller.node_for(key) == owner
+    assert HashRing().node_for("factorial:5") is None
+
+
+async def _wait_for_job(service: JobService, job_id: str):
+    for _ in range(500):
+        job = await service.get(job_id)
+        if job is None or job.status not in jobs.ACTIVE_STATUSES:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+@pytest.mark.asyncio
+async def test_job_service(monkeypatch):
+    """Test jobs are deduplicated, run, streamed, failed and cleaned up."""
+    service = JobService(workers=2)
+    job, created = await service.submit("factorial", 3000, params={"modulus": None})
+    duplicate, duplicate_created = await service.submit("factorial", 3000)
+    assert created and not duplicate_created
+    assert duplicate.id == job.id
+    failing, _ = await service.submit("factorial", -1)
+
+    service.start()
+    try:
+        done = await _wait_for_job(service, job.id)
+        assert done.status == jobs.DONE and done.computation_time_ms >= 0
+        chunks = [chunk async for chunk in service.stream_result(job.id, chunk_size=1000)]
+        assert len(chunks) > 1
+        assert {len(chunk) for chunk in chunks[:-1]} == {1000}
+        assert int("".join(chunks)) == math.factorial(3000)
+
+        failed = await _wait_for_job(service, failing.id)
+        assert failed.status == jobs.FAILED and "negative" in failed.error
+
+        # A finished job no longer deduplicates new submissions
+        again, created = await service.submit("factorial", 3000)
+        assert created and again.id != job.id
+        await _wait_for_job(service, again.id)
+    finally:
+        await service.stop()
+
+    monkeypatch.setattr(settings, "JOB_RESULT_TTL_SECONDS", 0)
+    expiring, _ = await service.submit("fibonacci", 77)
+    claimed = await service._claim()
+    assert claimed.id == expiring.id
+    await service.run(claimed)
+    assert await service.get(expiring.id) is None
+    assert await service.cleanup() >= 1
+
+
+class _RecordingSession:
+    """Stands in for a database session, keeping each commit's rows."""
+
+    def __init__(self, commits):
+        self._commits = commits
+        self._rows = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def add_all(self, rows):
+        self._rows.extend(rows)
+
+    async def commit(self):
+        self._commits.append(self._rows)
+
+
+@pytest.mark.asyncio
+async def test_history_batch():
+    """Test history rows are committed in batches by size, by age and on close."""
+    commits = []
+    batch = HistoryBatch(max_size=3, interval=0.05, session_factory=lambda: _RecordingSession(commits))
+    for i in range(4):
+        batch.add(i)
+    await asyncio.sleep(0)
+    assert commits == [[0, 1, 2]]
+    await asyncio.sleep(0.1)
+    assert commits == [[0, 1, 2], [3]]
+
+    batch.add(4)
+    await batch.close()
+    assert commits == [[0, 1, 2], [3], [4]]
+
+
+@pytest.mark.asyncio
+async def test_memory_rate_limiter(monkeypatch):
+    """Test token buckets go into debt, refill, and cap concurrent requests."""
+    limiter = MemoryRateLimiter(capacity=5, refill_per_second=100, max_concurrent=2)
+    assert await limiter.admit("a") is None
+    assert await limiter.admit("a") is None
+    assert await limiter.admit("a") == 1.0
+    await limiter.settle("a", 1)
+    await limiter.settle("a", 14)
+    wait = await limiter.admit("a")
+    assert 0 < wait <= 0.1
+    await asyncio.sleep(wait + 0.01)
+    assert await limiter.admit("a") is None
+    # Other clients have their own buckets
+    assert await limiter.admit("b") is None
+
+    monkeypatch.setattr(settings, "RATE_LIMIT_REQUEST_COST", 0.5)
+    monkeypatch.setattr(settings, "RATE_LIMIT_COST_UNIT", 100)
+
+    async def work(cost):
+        charge(cost)
+
+    charge(1000)  # outside a request: ignored
+    with billing() as bill:
+        charge(150)
+        # Tasks started by the request bill it too
+        await asyncio.create_task(work(50))
+    assert bill.tokens() == 2.5
+
+
+@pytest.mark.asyncio
+async def test_admission_scheduler(monkeypatch):
+    """Test bulk work cannot take every slot, waits are bounded, and lanes share fairly."""
+    monkeypatch.setattr(settings, "SCHEDULER_BULK_COST", 1000)
+    monkeypatch.setattr(settings, "SCHEDULER_INTERACTIVE_TIMEOUT_SECONDS", 0.05)
+    scheduler = AdmissionScheduler(max_concurrent=2, bulk_limit=2)
+    order = []
+
+    async def run(cost, hold=None):
+        async with scheduler.slot(cost, shed=False) as lane:
+            order.append(lane)
+            if hold is not None:
+                await hold.wait()
+
+    bulk_done = asyncio.Event()
+    bulk = asyncio.create_task(run(10 ** 6, bulk_done))
+    await asyncio.sleep(0)
+    waiting_bulk = asyncio.create_task(run(10 ** 6))
+    interactive_done = asyncio.Event()
+    interactive = asyncio.create_task(run(10, interactive_done))
+    await asyncio.sleep(0)
+    # Bulk keeps one slot free for interactive work
+    assert order == ["bulk", "interactive"]
+    assert scheduler.snapshot()["lanes"]["bulk"]["waiting"] == 1
+
+    with pytest.raises(OverloadedError):
+        async with scheduler.slot(10):
+            pass
+    assert scheduler.snapshot()["lanes"]["interactive"]["waiting"] == 0
+
+    waiters = [asyncio.create_task(run(10)) for _ in range(5)]
+    await asyncio.sleep(0)
+    bulk_done.set()
+    interactive_done.set()
+    await asyncio.gather(bulk, interactive, waiting_bulk, *waiters)
+    # The queued bulk computation is not starved by the interactive queue
+    assert order[2:].index("bulk") < 5
+    assert scheduler.snapshot()["running"] == 0
+
+
+@pytest.mark.asyncio
+async def test_sqlite_profile():
+    """Test SQLite connections get the performance pragmas and /history reads are query-only."""
+    async with engine.connect() as conn:
+        assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+        # 1 is NORMAL
+        assert (await conn.execute(text("PRAGMA synchronous"))).scalar() == 1
+        assert (await conn.execute(text("PRAGMA mmap_size"))).scalar() == settings.SQLITE_MMAP_SIZE
+
+    assert read_engine is not engine
+    async with read_engine.connect() as conn:
+        assert (await conn.execute(text("SELECT count(*) FROM operation_history"))).scalar() >= 0
+        with pytest.raises(OperationalError):
+            await conn.execute(text("DELETE FROM operation_history WHERE id = -1"))
+
+
+@pytest.mark.asyncio
+async def test_history_archiver(tmp_path):
+    """Test rows past retention move to per-bucket archive files and can be read back."""
+    created = [datetime(2000, 1, 1, 5), datetime(2000, 1, 1, 6), datetime(2000, 1, 2, 1),
+               datetime(2000, 1, 4, 12)]
+    async with AsyncSessionLocal() as db:
+        rows = [OperationHistory(operation="factorial", input_value=i, result=str(math.factorial(i)),
+                                 computation_time_ms=0.1, created_at=moment)
+                for i, moment in enumerate(created)]
+        db.add_all(rows)
+        await db.commit()
+
+    archiver = HistoryArchiver(directory=tmp_path, retention_days=1, batch_size=2)
+    now = datetime(2000, 1, 5, 18)
+    assert archiver.cutoff(now) == datetime(2000, 1, 4)
+    assert await archiver.archive(now) == 3
+    assert await archiver.archive(now) == 0
+    spans = [(start.day, end.day) for start, end, _ in archiver.files()]
+    assert spans == [(1, 2), (2, 3)]
+
+    records = list(archiver.read(start=datetime(2000, 1, 1, 6)))
+    assert [record["input_value"] for record in records] == [1, 2]
+    assert records[1]["result"] == "2"
+    assert list(archiver.read(end=datetime(2000, 1, 1, 6))) == list(archiver.read())[:1]
+
+    async with AsyncSessionLocal() as db:
+        remaining = (await db.execute(
+            select(OperationHistory).where(OperationHistory.created_at < datetime(2000, 1, 5))
+        )).scalars().all()
+        assert [row.id for row in remaining] == [rows[3].id]
+        await db.delete(remaining[0])
+        await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_operation_rollups():
+    """Test rollups merge across flushes into per-minute and per-hour buckets."""
+    rollups = OperationRollups()
+    # Minutes hh:00 and hh:01 of an hour within the minute rollups' retention
+    hour = bucket_start(datetime.utcnow() - timedelta(hours=2), HOUR)
+    for seconds, cached, time_ms in [(5, False, 10.0), (40, True, 0.0), (60, False, 1000.0)]:
+        rollups.record("fibonacci", cached, time_ms, hour + timedelta(seconds=seconds))
+    assert await rollups.flush() == 3
+    rollups.record("fibonacci", False, 20.0, hour + timedelta(seconds=50))
+    rollups.record("factorial", False, 5.0, hour + timedelta(seconds=50))
+
+    start, end = hour, hour + timedelta(hours=1)
+    # Pending counts are included before and after they are flushed
+    for _ in range(2):
+        minutes = await rollups.query(MINUTE, start, end, "fibonacci")
+        assert [(m["bucket_start"].minute, m["count"], m["cache_hits"]) for m in minutes] == [
+            (0, 3, 1), (1, 1, 0)
+        ]
+        assert minutes[0]["computation"]["count"] == 2
+        assert 10 <= minutes[0]["computation"]["p50_ms"] <= 11.5
+        await rollups.flush()
+
+    hours = await rollups.query(HOUR, start, end)
+    assert [(h["operation"], h["count"]) for h in hours] == [("factorial", 1), ("fibonacci", 4)]
+    fibonacci = hours[1]
+    assert fibonacci["cache_hit_ratio"] == 0.25
+    assert fibonacci["computation"]["max_ms"] == 1000.0
+    assert 900 <= fibonacci["computation"]["p99_ms"] <= 1000
+    with pytest.raises(ValueError):
+        await rollups.query("day")
+
+
+def test_latency_histogram_merge():
+    """Test merged and round-tripped histograms report the combined percentiles."""
+    first, second = LatencyHistogram(), LatencyHistogram()
+    for ms in range(1, 51):
+        first.record(ms / 1000)
+    for ms in range(51, 101):
+        second.record(ms / 1000)
+    first.merge(LatencyHistogram.from_dict(second.to_dict()))
+    assert first.count == 100
+    assert first.max_micros == 100_000
+    assert 45 <= first.percentile(50) <= 56
+
+
+@pytest.mark.asyncio
+async def test_history_policy():
+    """Test misses are always kept while hits are written, sampled or counted per operation."""
+    with pytest.raises(ValueError):
+        HistoryPolicy(default="sometimes")
+    with pytest.raises(ValueError):
+        HistoryPolicy(overrides={"power": "aggregate:0.5"})
+
+    policy = HistoryPolicy(
+        default="full",
+        overrides={"fibonacci": "sample:0.25", "factorial": "aggregate"},
+        counters=HitCounters()
+    )
+
+    def row(operation, value):
+        return OperationHistory(operation=operation, input_value=value, result="1",
+                                computation_time_ms=0.0)
+
+    assert policy.keep(row("factorial", 7), cached=False)
+    assert all(policy.keep(row("power", 2), cached=True) for _ in range(10))
+    assert sum(policy.keep(row("fibonacci", 9), cached=True) for _ in range(100)) == 25
+    assert not any(policy.keep(row("factorial", 7), cached=True) for _ in range(5))
+    policy.keep(row("factorial", 8), cached=True)
+
+    assert await policy.counters.flush() == 2
+    assert await policy.counters.flush() == 0
+    policy.keep(row("factorial", 7), cached=True)
+    await policy.counters.flush()
+    totals = await policy.counters.totals(operation="factorial")
+    assert [(t["input_value"], t["hits"]) for t in totals][:2] == [(7, 6), (8, 1)]
+
+
+@pytest.mark.asyncio
+async def test_recent_history():
+    """Test the buffer keeps the newest rows in order and serves only pages it holds."""
+    assert RecentHistory(size=0).enabled is False
+    recent = RecentHistory(size=4, max_bytes=100)
+    await recent.load()
+    assert recent.page(0, 1) is not None
+
+    def row(id, minute, operation="fibonacci", result="1"):
+        return OperationHistory(id=id, operation=operation, input_value=id, result=result,
+                                computation_time_ms=0.0, created_at=datetime(2100, 1, 1, 0, minute))
+
+    recent = RecentHistory(size=4, max_bytes=100)
+    recent._loaded = True
+    recent.add([row(1, 1), row(2, 2), row(4, 4, "factorial")])
+    # Committed after row 4 but created before it
+    recent.add([row(3, 3)])
+    assert [r.id for r in recent.page(0, 4)] == [4, 3, 2, 1]
+    recent.add([row(5, 5), row(6, 6)])
+    assert [r.id for r in recent.page(1, 3)] == [5, 4, 3]
+    # Past the buffer's end, and the rows it would need have been evicted
+    recent.add([row(0, 0)])
+    assert recent.page(0, 5) is None
+    assert [r.id for r in recent.page(0, 1, "factorial")] == [4]
+    assert recent.page(0, 2, "factorial") is None
+
+    # A large result evicts older rows to stay within the byte budget
+    recent.add([row(7, 7, result="9" * 100)])
+    assert [r.id for r in recent.page(0, 1)] == [7]
+    assert recent.page(0, 2) is None
+    recent.discard_before(datetime(2100, 1, 1, 0, 8))
+    assert recent.page(0, 1) is None
+
+
+def test_encoding_matches_json_dumps():
+    """Test the fast encoder writes what json.dumps would, compactly and unescaped."""
+    def reference(value):
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+    values = [
+        0, -1, 2 ** 63, -(3 ** 20000), 7 ** 5000,
+        0.1, -0.0, 1e300, 5e-324, -2.5,
+        "", "plain", "caf\u00e9 \u65e5\u672c \U0001f600", "quote\" back\\ slash",
+        "\x00\x01\x1f\x7f\n\r\t\b\f\u2028",
+        None, True, False,
+        [], {}, [1, [2.5, [None, "x"]], {"a": {"b": []}}],
+        {"n": 2 ** 100000, "list": [True, {"nested": -0.0}], 3: "int key"},
+        (1, "tuple"),
+    ]
+    for value in values:
+        assert dumps(value) == reference(value), value
+    assert dumps(RawJSON("123456789")) == b"123456789"
+
+    for value in (math.nan, math.inf, -math.inf, [1, {"x": math.nan}]):
+        with pytest.raises(ValueError):
+            json.dumps(value, allow_nan=False)
+        with pytest.raises(ValueError):
+            dumps(value)